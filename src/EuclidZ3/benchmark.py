@@ -0,0 +1,228 @@
+'''
+Benchmarks for the EuclidZ3 proof checker.
+
+Runs two suites under several solver configurations:
+
+    test1   the diagram and queries of test.test1
+    book1   the proof scripts of Book I propositions in benchmarks/book1
+
+and records, for each query or proof step, the answer, the wall time,
+the time spent in the solver, the conflicts, decisions and quantifier
+instantiations (axiom instances in ground mode) of z3 and its peak memory.
+
+    python -m EuclidZ3.benchmark [--suite NAME] [--timeout MS] [--json FILE]
+                                 [--compare BASELINE] [--tolerance T]
+
+--json writes the results as JSON. --compare checks them against the
+JSON of an earlier run and reports a regression for every query whose
+answer changed, or whose wall time or instantiations grew by more than
+the tolerance. Exits with status 1 if there are any.
+'''
+from z3 import *
+from EuclidZ3.core import LanguageE, Proof, getLanguage
+from EuclidZ3 import profiling, script
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+
+
+SUITES = ("test1", "book1")
+SCRIPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "book1")
+
+
+def test1Diagram(language):
+    '''
+    Returns the constants, assumptions and (description, query, expected)
+    triples of the test1 scenario in test.py.
+    '''
+    p, q, r, s, t, u, v = Consts('p q r s t u v', language.PointSort)
+    K, L, M, N, O = Consts('K L M N O', language.LineSort)
+    On, Between, SameSide, Segment = language.OnLine, language.Between, language.SameSide, language.Segment
+
+    assumptions = [Distinct(p, q, r, s, t, u, v), Distinct(K, L, M, N, O),
+        On(p, L), On(q, L), On(p, N), On(s, N), On(t, N), On(p, M), On(r, M),
+        On(q, O), On(s, O), On(r, O), On(q, K), On(t, K), Not(On(r, L)),
+        Between(p, s, t), Between(q, s, r), Between(s, u, t), Not(p == q), Between(p, q, v)]
+
+    queries = [
+        ("Hence True", BoolVal(True), 'sat'),
+        ("Hence s and t are on opposite sides of O", Not(SameSide(s, t, O)), 'sat'),
+        ("Hence u and t are on same side of M", SameSide(u, t, M), 'sat'),
+        ("Hence p and t are on same side of O", SameSide(p, t, O), 'unsat'),
+        ("Hence s and t are on same side of O", SameSide(s, t, O), 'unsat'),
+        ("Hence s and t are on opposite sides of M", Not(SameSide(s, t, M)), 'unsat'),
+        ("Hence u and t are on opposite sides of M", Not(SameSide(u, t, M)), 'unsat'),
+        ("Hence seg su is less than seg st", Not(Segment(s, u) < Segment(s, t)), 'unsat'),
+    ]
+    return assumptions, queries
+
+
+def configurations():
+    '''
+    Returns (name, Proof options) pairs for the configurations benchmarked.
+    '''
+    inferred = LanguageE(patterns=False)
+    return [
+        ("inferred triggers, mbqi", dict(language=inferred)),
+        ("patterns, mbqi", dict()),
+        ("patterns, no mbqi", dict(mbqi=False)),
+        ("patterns, no mbqi, relevance", dict(mbqi=False, relevance=True)),
+        ("ground", dict(ground=True)),
+    ]
+
+
+def measure(proof, description, run, expected):
+    '''
+    Runs run(), a query or step of proof, and returns its result dict
+    with the answer run returns and what its checks cost (see Proof.profile).
+    '''
+    checks = len(proof.profile)
+    start = time.time()
+    result = run()
+    wall = time.time() - start
+    costs = profiling.summarize(proof.profile[checks:])
+    return {"query": description, "result": result, "expected": expected, "wall": wall,
+            "solver": sum(cost["wall"] for cost in costs),
+            "conflicts": sum(cost["conflicts"] for cost in costs),
+            "decisions": sum(cost["decisions"] for cost in costs),
+            "instantiations": sum(cost["instantiations"] for cost in costs),
+            "memory": proof.counters["memory"]}
+
+
+def runTest1(options, timeout):
+    '''
+    Checks every test1 query in a fresh proof. Returns a list of result dicts.
+    '''
+    proof = Proof(timeout=timeout, **options)
+    assumptions, queries = test1Diagram(proof.language)
+    for assumption in assumptions:
+        proof.assume(assumption)
+
+    def query(description, expr):
+        proof.label = description
+        proof.register(expr)
+        guard = FreshBool("query", proof.context)
+        proof.push()
+        proof.solver.add(Implies(guard, proof.local(expr)))
+        result = proof.check(guard)
+        proof.pop()
+        return str(result)
+
+    results = [measure(proof, description, lambda: query(description, expr), expected)
+               for description, expr, expected in queries]
+    proof.close()
+    return results
+
+
+def runScript(path, options, timeout):
+    '''
+    Checks the proof script at path one step at a time. Returns a list
+    of result dicts, one per step; a step's answer is ok, failed or unknown.
+    '''
+    name = os.path.basename(path)
+    parser = script.ScriptParser()
+    proof = None
+    results = []
+
+    def apply(step):
+        undecided = len(proof.undecided)
+        if step.apply(proof):
+            return "ok"
+        return "unknown" if len(proof.undecided) > undecided else "failed"
+
+    with open(path) as lines:
+        for step in parser.steps(lines):
+            if proof is None:
+                proof = Proof(timeout=timeout, **dict(parser.options, **options))
+            if step.kind == "construct":
+                description = "%s:%d let %s" % (name, step.number, step.value.label)
+            else:
+                description = "%s:%d %s" % (name, step.number, step.text)
+            results.append(measure(proof, description, lambda: apply(step), "ok"))
+    if proof is not None:
+        proof.close()
+    return results
+
+
+def runBook1(options, timeout, directory=SCRIPTS):
+    '''
+    Checks every proof script in directory. Returns a list of result dicts.
+    '''
+    results = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".euclid"):
+            results.extend(runScript(os.path.join(directory, name), options, timeout))
+    return results
+
+
+def compare(results, baseline, tolerance, floor):
+    '''
+    Returns a message for each result that regressed against the result
+    for the same query in baseline. Wall times under floor seconds in
+    both runs are too short to compare.
+    '''
+    previous = dict(((old["suite"], old["configuration"], old["query"]), old) for old in baseline)
+    regressions = []
+    for result in results:
+        old = previous.get((result["suite"], result["configuration"], result["query"]))
+        if old is None:
+            continue
+        name = result["suite"] + " / " + result["configuration"] + " / " + result["query"]
+        if result["result"] != old["result"]:
+            regressions.append("%s: answer %s, was %s" % (name, result["result"], old["result"]))
+        if max(result["wall"], old["wall"]) >= floor and result["wall"] > old["wall"] * (1 + tolerance):
+            regressions.append("%s: %.3fs, was %.3fs" % (name, result["wall"], old["wall"]))
+        if result["instantiations"] > old["instantiations"] * (1 + tolerance) + 100:
+            regressions.append("%s: %d instantiations, was %d" % \
+                (name, result["instantiations"], old["instantiations"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the proof checker under several solver configurations.")
+    parser.add_argument("--suite", action="append", choices=SUITES, help="suite to run, all by default")
+    parser.add_argument("--timeout", type=int, default=10000, help="per query timeout in milliseconds")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="report regressions against the results in this file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="relative slowdown counted as a regression")
+    parser.add_argument("--floor", type=float, default=0.25, help="wall times in seconds too short to compare")
+    args = parser.parse_args(argv)
+
+    getLanguage()
+    results = []
+    for name, options in configurations():
+        for suite in args.suite or SUITES:
+            print("=== " + suite + " / " + name + " ===")
+            runner = runTest1 if suite == "test1" else runBook1
+            for result in runner(options, args.timeout):
+                result["suite"] = suite
+                result["configuration"] = name
+                results.append(result)
+                print(">> " + result["query"])
+                print("      << %s (expected %s) %.3fs, solver %.3fs, %d conflicts, %d instantiations, %.1fMB" % \
+                    (result["result"], result["expected"], result["wall"], result["solver"],
+                     result["conflicts"], result["instantiations"], result["memory"]))
+
+    ## ru_maxrss is in kilobytes on Linux
+    report = {"timeout": args.timeout, "peakMemory": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+              "results": results}
+    if args.json:
+        with open(args.json, "w") as out:
+            json.dump(report, out, indent=2)
+
+    if args.compare:
+        with open(args.compare) as stored:
+            baseline = json.load(stored)["results"]
+        regressions = compare(results, baseline, args.tolerance, args.floor)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        print("=== %d regressions against %s ===" % (len(regressions), args.compare))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+from z3 import *
+
+
+## argument positions each relation is symmetric in, by axiom:
+## Between(a,b,c) = Between(c,b,a), SameSide(a,b,L) = SameSide(b,a,L),
+## Segment(a,b) = Segment(b,a) and Area is invariant under every
+## permutation of its points
+SYMMETRIC = {"Between" : (0, 2), "SameSide" : (0, 1), "Segment" : (0, 1), "Area" : (0, 1, 2)}
+
+
+def canonicalArgs(name, args, key):
+    '''
+    Returns args of relation name in canonical order, the symmetric
+    positions sorted by key.
+    '''
+    positions = SYMMETRIC.get(name)
+    if positions is None:
+        return args
+    args = list(args)
+    chosen = sorted([args[position] for position in positions], key=key)
+    for position, arg in zip(positions, chosen):
+        args[position] = arg
+    return args
+
+
+def canonicalize(expr):
+    '''
+    Rewrites the applications of the symmetric relations in expr so their
+    symmetric arguments are in canonical order (by their SMT-LIB text),
+    so that equal terms are also syntactically equal. Terms under
+    quantifiers are left alone.
+    '''
+    if not is_expr(expr):
+        return expr
+    rewrites = []
+    todo = [expr]
+    seen = set()
+    while todo:
+        node = todo.pop()
+        if node.get_id() in seen or not is_app(node) or node.num_args() == 0:
+            continue
+        seen.add(node.get_id())
+        decl = node.decl()
+        if decl.kind() == Z3_OP_UNINTERPRETED and decl.name() in SYMMETRIC:
+            args = node.children()
+            ordered = canonicalArgs(decl.name(), args, lambda arg: arg.sexpr())
+            if any(not new.eq(old) for new, old in zip(ordered, args)):
+                rewrites.append((node, decl(*ordered)))
+        todo.extend(node.children())
+    if len(rewrites) == 0:
+        return expr
+    return substitute(expr, *rewrites)
+
+
+class Coincidences(object):
+    '''
+    A union-find over the points, lines and circles of a proof, which
+    merges the classes of two objects once they are known to be equal.
+    rewrite replaces every object in an expression by the representative
+    of its class, the member with the first SMT-LIB text, so facts about
+    coinciding objects are stated about one term.
+    '''
+    __slots__ = ("parent", "members", "pairs")
+    
+    def __init__(self):
+        ## id of an object -> its parent in the class, roots are absent,
+        ## and id of a non-root object -> the object
+        self.parent = dict()
+        self.members = dict()
+        ## (object, representative) for every merged away object, or None
+        ## once a merge made it stale
+        self.pairs = []
+    
+    def find(self, const):
+        '''
+        Returns the representative of the class of const.
+        '''
+        path = []
+        while const.get_id() in self.parent:
+            path.append(const)
+            const = self.parent[const.get_id()]
+        for member in path:
+            self.parent[member.get_id()] = const
+        return const
+    
+    def merge(self, first, second):
+        '''
+        Merges the classes of first and second. Returns False if they 
+        were already the same class.
+        '''
+        first, second = self.find(first), self.find(second)
+        if first.eq(second):
+            return False
+        if second.sexpr() < first.sexpr():
+            first, second = second, first
+        self.parent[second.get_id()] = first
+        self.members[second.get_id()] = second
+        self.pairs = None
+        return True
+    
+    def rewrite(self, expr):
+        '''
+        Returns expr with every merged away object replaced by its
+        representative.
+        '''
+        if not self.parent:
+            return expr
+        if self.pairs is None:
+            self.pairs = [(member, self.find(member)) for member in list(self.members.values())]
+        return substitute(expr, *self.pairs)
@@ -0,0 +1,164 @@
+'''
+Batch proof checker.
+
+Checks every proof file in the given directories in a pool of worker
+processes, printing each result as soon as it is known.
+
+    python -m EuclidZ3.check DIR [DIR ...] [--jobs N] [--timeout SECONDS] [--json FILE]
+
+A proof file is either a proof script ending in .euclid (see script.py)
+or a python module defining proof(), which builds and checks a proof and
+returns its Proof. A proof passes when none of its steps failed 
+(see Proof.failures); it is unknown when the solver could not decide
+some of them (see Proof.undecided).
+
+Exits with status 1 if any proof did not pass.
+'''
+from z3 import *
+from EuclidZ3.core import defaultPool, getLanguage, setDefaultPool
+from EuclidZ3.pool import SolverPool
+from EuclidZ3 import script
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import time
+
+
+class ProofTimeout(Exception):
+    pass
+
+
+def proofFiles(paths):
+    '''
+    Returns the proof files in paths, searching directories recursively.
+    '''
+    found = []
+    for path in paths:
+        if os.path.isfile(path):
+            found.append(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith((".py", ".euclid")) and not name.startswith("_"):
+                    found.append(os.path.join(root, name))
+    return found
+
+
+def loadProof(path):
+    '''
+    Checks the proof file at path, returns its Proof.
+    '''
+    if path.endswith(".euclid"):
+        return script.load(path)
+    name = "euclidz3_proof_" + str(abs(hash(path)))
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    if not hasattr(module, "proof"):
+        raise ValueError("no proof() function in " + path)
+    return module.proof()
+
+
+def warm(timeout):
+    '''
+    Initializes a worker: builds the language once, and a solver with
+    the axioms internalized that the proofs the worker checks reuse (see
+    SolverPool), and bounds each z3 check by the proof timeout.
+    '''
+    getLanguage()
+    if timeout:
+        set_param("timeout", int(timeout * 1000))
+    setDefaultPool(SolverPool(size=1, timeout=int(timeout * 1000) if timeout else None))
+
+
+def timedOut(signum, frame):
+    raise ProofTimeout()
+
+
+def checkFile(task):
+    '''
+    Checks the proof file of task, a (path, timeout) pair.
+    Returns a result dict.
+    '''
+    path, timeout = task
+    result = {"path": path, "status": "ok", "failures": []}
+    start = time.time()
+    log = io.StringIO()
+    previous = signal.signal(signal.SIGALRM, timedOut)
+    if timeout:
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    proof = None
+    try:
+        with contextlib.redirect_stdout(log):
+            proof = loadProof(path)
+        if proof is None:
+            raise ValueError("proof() did not return a Proof")
+        if len(proof.undecided) > 0:
+            result["status"] = "unknown"
+            result["failures"] = [step + " " + str(expr) for step, expr in proof.failures]
+        elif len(proof.failures) > 0:
+            result["status"] = "failed"
+            result["failures"] = [step + " " + str(expr) for step, expr in proof.failures]
+    except ProofTimeout:
+        result["status"] = "timeout"
+    except Exception as error:
+        result["status"] = "error"
+        result["error"] = type(error).__name__ + ": " + str(error)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+        if proof is not None:
+            proof.close()
+        ## the proofs of a file that raised or timed out were never closed
+        pool = defaultPool()
+        if pool is not None:
+            pool.reclaim()
+    result["time"] = time.time() - start
+    result["log"] = log.getvalue()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check a directory of EuclidZ3 proofs.")
+    parser.add_argument("paths", nargs="+", help="proof files or directories of proof files")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--timeout", type=float, default=0, help="per proof timeout in seconds, 0 for none")
+    parser.add_argument("--json", help="write a summary of the results to this file")
+    args = parser.parse_args(argv)
+
+    files = proofFiles(args.paths)
+    results = []
+    start = time.time()
+    with multiprocessing.Pool(args.jobs, initializer=warm, initargs=(args.timeout,)) as pool:
+        for result in pool.imap_unordered(checkFile, [(path, args.timeout) for path in files]):
+            print ("%-8s %7.2fs  %s" % (result["status"], result["time"], result["path"]))
+            for failure in result["failures"]:
+                print ("             " + failure)
+            if "error" in result:
+                print ("             " + result["error"])
+            sys.stdout.flush()
+            results.append(result)
+
+    counts = dict()
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    elapsed = time.time() - start
+    print ("=== %d proofs in %.2fs : %s ===" % (len(results), elapsed,
+        ", ".join("%d %s" % (counts[status], status) for status in sorted(counts))))
+
+    if args.json:
+        results.sort(key=lambda result: result["path"])
+        with open(args.json, "w") as out:
+            json.dump({"time": elapsed, "jobs": args.jobs, "counts": counts, "results": results}, out, indent=2)
+    return 0 if counts.get("ok", 0) == len(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,304 @@
+from z3 import *
+
+
+## Horn clauses of the diagrammatic, circle and intersection axioms of E.
+## Disjunctive axioms appear in the contrapositive forms that are Horn,
+## axioms concluding an equality of objects are left to z3.
+RULES = [
+    ## inequality is symmetric
+    "a != b -> b != a",
+
+    ## strict betweeness
+    "Between(a,b,c) -> Between(c,b,a) & a != b & a != c & b != c & ~Between(b,a,c)",
+    "Between(a,b,c) & On(a,L) & On(b,L) -> On(c,L)",
+    "Between(a,b,c) & On(a,L) & On(c,L) -> On(b,L)",
+    "Between(a,b,c) & Between(a,d,b) -> Between(a,d,c)",
+    "Between(a,b,c) & Between(b,c,d) -> Between(a,b,d)",
+    "Between(a,b,c) & Between(a,b,d) -> ~Between(d,b,c)",
+    "On(a,L) & On(b,L) & On(c,L) & a != b & a != c & b != c & ~Between(b,a,c) & ~Between(a,c,b) -> Between(a,b,c)",
+
+    ## same side
+    "~On(a,L) -> SameSide(a,a,L)",
+    "SameSide(a,b,L) -> SameSide(b,a,L) & ~On(a,L)",
+    "SameSide(a,b,L) & SameSide(a,c,L) -> SameSide(b,c,L)",
+    "~On(a,L) & ~On(b,L) & ~On(c,L) & ~SameSide(a,b,L) & ~SameSide(a,c,L) -> SameSide(b,c,L)",
+
+    ## Pasch
+    "Between(a,b,c) & SameSide(a,c,L) -> SameSide(a,b,L)",
+    "Between(a,b,c) & On(a,L) & ~On(b,L) -> SameSide(b,c,L)",
+    "Between(a,b,c) & On(b,L) -> ~SameSide(a,c,L)",
+    "a != b & b != c & L != M & On(a,M) & On(b,M) & On(c,M) & ~SameSide(a,c,L) & On(b,L) -> Between(a,b,c)",
+
+    ## triple incidence
+    "On(a,L) & On(a,M) & On(a,N) & On(b,L) & On(c,M) & On(d,N) & SameSide(c,d,L) & SameSide(b,c,N) -> ~SameSide(b,d,M)",
+    "On(a,L) & On(a,M) & On(a,N) & On(b,L) & On(c,M) & On(d,N) & SameSide(c,d,L) & ~SameSide(d,b,M) & ~On(d,M) & b != a -> SameSide(b,c,N)",
+
+    ## circles
+    "Center(a,alpha) -> Inside(a,alpha)",
+    "Inside(a,alpha) -> ~Onc(a,alpha)",
+    "Inside(a,alpha) & Onc(b,alpha) & Onc(c,alpha) & On(a,L) & On(b,L) & On(c,L) & b != c -> Between(b,a,c)",
+
+    ## intersection
+    "On(a,M) & On(b,M) & ~SameSide(a,b,L) -> Intersectsll(L,M)",
+    "Inside(a,alpha) & Inside(b,alpha) & ~On(a,L) & ~On(b,L) & ~SameSide(a,b,L) -> Intersectslc(L,alpha)",
+    "Inside(a,alpha) & Onc(b,alpha) & ~On(a,L) & ~On(b,L) & ~SameSide(a,b,L) -> Intersectslc(L,alpha)",
+    "Onc(a,alpha) & Inside(b,alpha) & ~On(a,L) & ~On(b,L) & ~SameSide(a,b,L) -> Intersectslc(L,alpha)",
+    "Onc(a,alpha) & Onc(b,alpha) & ~On(a,L) & ~On(b,L) & ~SameSide(a,b,L) -> Intersectslc(L,alpha)",
+    "Inside(a,alpha) & On(a,L) -> Intersectslc(L,alpha)",
+    "Onc(a,alpha) & Inside(b,alpha) & Inside(a,beta) & ~Inside(b,beta) & ~Onc(b,beta) -> Intersectscc(alpha,beta)",
+    "Onc(a,alpha) & Onc(b,alpha) & Inside(a,beta) & ~Inside(b,beta) & ~Onc(b,beta) -> Intersectscc(alpha,beta)",
+    "Onc(a,alpha) & Inside(b,alpha) & Inside(a,beta) & Onc(b,beta) -> Intersectscc(alpha,beta)",
+]
+
+## relations the closure keeps tables for
+PREDICATES = ("Between", "On", "SameSide", "Onc", "Inside", "Center",
+              "Intersectsll", "Intersectslc", "Intersectscc")
+
+
+def parseLiteral(text):
+    '''
+    Parses "Pred(x,y)", "~Pred(x,y)" or "x != y" into a literal,
+    a (predicate, polarity, arguments) tuple. Inequality is the
+    negative literal of predicate "=".
+    '''
+    text = text.strip()
+    if "!=" in text:
+        left, right = text.split("!=")
+        return ("=", False, (left.strip(), right.strip()))
+    positive = not text.startswith("~")
+    name, args = text.lstrip("~").rstrip(")").split("(")
+    return (name.strip(), positive, tuple(arg.strip() for arg in args.split(",")))
+
+
+def negate(literal):
+    return (literal[0], not literal[1], literal[2])
+
+
+class Rule(object):
+    '''
+    A Horn clause "premise & ... -> conclusion & ..." over literals
+    whose arguments are variables.
+    '''
+
+    def __init__(self, text):
+        self.text = text
+        premises, conclusions = text.split("->")
+        self.premises = [parseLiteral(part) for part in premises.split("&")]
+        self.conclusions = [parseLiteral(part) for part in conclusions.split("&")]
+
+    def __str__(self):
+        return self.text
+
+
+class Closure(object):
+    '''
+    Computes the closure of a set of ground diagrammatic facts under the
+    Horn axioms in RULES by forward chaining, so that queries about
+    On, Between, SameSide and the circle relations can be answered by
+    a table lookup instead of a solver call.
+
+    Facts are ground literals over the names of points, lines and circles.
+    They are indexed by predicate and polarity, and by every argument
+    position, so a rule firing on a new fact only joins its other premises
+    against the facts that agree on the variables bound so far.
+
+    The closure is sound but not complete: a literal missing from it may
+    still follow from the facts, and facts it cannot represent (equalities,
+    metric facts) are ignored.
+    '''
+
+    def __init__(self, rules=None):
+        self.rules = [Rule(text) for text in (RULES if rules is None else rules)]
+        ## (predicate, polarity) -> [(rule, premise index)] to fire on a new fact
+        self.triggers = dict()
+        for rule in self.rules:
+            for index, premise in enumerate(rule.premises):
+                self.triggers.setdefault(premise[:2], []).append((rule, index))
+        ## literal -> ("fact", expr) or (rule, premise literals) it was derived from
+        self.facts = dict()
+        ## (predicate, polarity) and (predicate, polarity, position, argument)
+        ## -> literals in that table
+        self.index = dict()
+        self.agenda = []
+        ## a literal whose negation is also in the closure, if any
+        self.contradiction = None
+        self.hits = 0
+        self.misses = 0
+
+    def literals(self, expr, strict=False):
+        '''
+        Returns the literals of expr, a literal or a conjunction of them.
+        Parts that cannot be represented are skipped, or if strict is set,
+        None is returned.
+        '''
+        found = []
+        todo = [expr]
+        while todo:
+            expr = todo.pop()
+            if is_and(expr):
+                todo.extend(expr.children())
+                continue
+            if is_distinct(expr) and self.objects(expr) is not None:
+                names = self.objects(expr)
+                found.extend(("=", False, (x, y)) for x in names for y in names if x != y)
+                continue
+            positive = not is_not(expr)
+            atom = expr if positive else expr.arg(0)
+            names = self.objects(atom)
+            literal = None
+            if names is not None:
+                if is_eq(atom) and not positive:
+                    literal = ("=", False, tuple(names))
+                elif is_app(atom) and atom.decl().name() in PREDICATES:
+                    literal = (atom.decl().name(), positive, tuple(names))
+            if literal is not None:
+                found.append(literal)
+            elif strict:
+                return None
+        return found
+
+    def objects(self, expr):
+        '''
+        Returns the names of the arguments of expr if they are
+        all points, lines or circles, None otherwise.
+        '''
+        if not is_app(expr) or expr.num_args() == 0:
+            return None
+        names = []
+        for arg in expr.children():
+            if not is_const(arg) or arg.decl().kind() != Z3_OP_UNINTERPRETED \
+                    or arg.sort().kind() != Z3_UNINTERPRETED_SORT:
+                return None
+            names.append(arg.decl().name())
+        return names
+
+    def add(self, expr):
+        '''
+        Adds the literals of the fact expr and saturates the closure.
+        '''
+        for literal in self.literals(expr):
+            self.insert(literal, ("fact", expr))
+        self.saturate()
+
+    def insert(self, literal, reason):
+        if literal in self.facts:
+            return
+        self.facts[literal] = reason
+        if self.contradiction is None and (negate(literal) in self.facts or \
+                (literal[0] == "=" and not literal[1] and literal[2][0] == literal[2][1])):
+            self.contradiction = literal
+        self.index.setdefault(literal[:2], set()).add(literal)
+        for position, arg in enumerate(literal[2]):
+            self.index.setdefault(literal[:2] + (position, arg), set()).add(literal)
+        self.agenda.append(literal)
+
+    def saturate(self):
+        '''
+        Fires the rules on the new facts until no new fact is derived.
+        '''
+        while self.agenda:
+            literal = self.agenda.pop()
+            for rule, index in self.triggers.get(literal[:2], []):
+                binding = self.unify(rule.premises[index][2], literal[2], dict())
+                if binding is None:
+                    continue
+                others = rule.premises[:index] + rule.premises[index + 1:]
+                for binding, used in self.join(others, binding, [literal]):
+                    for conclusion in rule.conclusions:
+                        args = tuple(binding[var] for var in conclusion[2])
+                        self.insert(conclusion[:2] + (args,), (rule, used))
+
+    def unify(self, variables, args, binding):
+        '''
+        Extends binding so that it maps variables to args, returns
+        None if that is not possible.
+        '''
+        binding = dict(binding)
+        for var, arg in zip(variables, args):
+            if binding.setdefault(var, arg) != arg:
+                return None
+        return binding
+
+    def join(self, premises, binding, used):
+        '''
+        Yields (binding, premise literals) for every way to extend binding
+        so that all premises are in the closure.
+        '''
+        if len(premises) == 0:
+            yield binding, used
+            return
+        ## match the premise with the most bound arguments first
+        best = max(range(len(premises)),
+            key=lambda i: sum(1 for var in premises[i][2] if var in binding))
+        predicate, positive, variables = premises[best]
+        rest = premises[:best] + premises[best + 1:]
+        tables = [self.index.get((predicate, positive, position, binding[var]), ())
+            for position, var in enumerate(variables) if var in binding]
+        if len(tables) == 0:
+            tables = [self.index.get((predicate, positive), ())]
+        for literal in list(min(tables, key=len)):
+            extended = self.unify(variables, literal[2], binding)
+            if extended is not None:
+                for result in self.join(rest, extended, used + [literal]):
+                    yield result
+
+    def lookup(self, expr):
+        '''
+        Returns True if every literal of expr is in the closure, False if
+        the negation of one of them is, and None if the closure cannot
+        tell, e.g. because expr is not a conjunction of diagrammatic
+        literals or because the facts are contradictory.
+        '''
+        literals = self.literals(expr, strict=True)
+        if not literals or self.contradiction is not None:
+            self.misses += 1
+            return None
+        if all(self.witness(literal) is not None for literal in literals):
+            self.hits += 1
+            return True
+        if any(self.witness(negate(literal)) is not None for literal in literals):
+            self.hits += 1
+            return False
+        self.misses += 1
+        return None
+
+    def witness(self, literal):
+        '''
+        Returns the literal of the closure that establishes literal,
+        or None if there is none.
+        '''
+        if literal in self.facts:
+            return literal
+        ## a point on a line is on neither side of it, a consequence the
+        ## rules cannot derive forwards since it holds for every other point
+        if literal[:2] == ("SameSide", False):
+            a, b, line = literal[2]
+            for point in (a, b):
+                if ("On", True, (point, line)) in self.facts:
+                    return ("On", True, (point, line))
+        return None
+
+    def support(self, expr):
+        '''
+        Returns the facts the literals of expr were derived from.
+        '''
+        found = dict()
+        todo = [self.witness(literal) for literal in self.literals(expr)]
+        seen = set()
+        while todo:
+            literal = todo.pop()
+            if literal is None or literal in seen:
+                continue
+            seen.add(literal)
+            origin, parents = self.facts[literal]
+            if origin == "fact":
+                found[parents.get_id()] = parents
+            else:
+                todo.extend(parents)
+        return list(found.values())
+
+    def size(self):
+        '''
+        Returns the number of literals in the closure.
+        '''
+        return len(self.facts)
@@ -1,7 +1,32 @@
 from z3 import *
+import abc
+import asyncio
+import concurrent.futures
+import copy
+import hashlib
+import inspect
+import os
+import tempfile
+import threading
+import time
+import weakref
+from EuclidZ3.canonical import canonicalize, Coincidences
+from EuclidZ3.closure import Closure
+from EuclidZ3.ground import Grounder, constants, refine
+from EuclidZ3 import profiling
+from EuclidZ3.querycache import QueryCache
+from EuclidZ3.sampler import Sampler
 # import sets
 
 
+## families of symbols, an axiom is relevant to a proof once 
+## the proof uses a symbol of every family the axiom mentions
+FAMILIES = {"Between" : "diagrammatic", "On" : "diagrammatic", "SameSide" : "diagrammatic",
+            "Onc" : "circle", "Inside" : "circle", "Center" : "circle",
+            "Intersectsll" : "intersection", "Intersectslc" : "intersection", "Intersectscc" : "intersection",
+            "Segment" : "segment", "Angle" : "angle", "RightAngle" : "angle", "Area" : "area"}
+
+
 class LanguageE(object):
     '''   
  @author: krojas
@@ -71,11 +96,17 @@ class LanguageE(object):
   ENSURES: two circles intersect when they have exactly two points in common.
 '''
     
-    def __init__(self):
+    def __init__(self, checkAxioms=False, cacheDir=None, patterns=True):
         '''
-        Constructor
+        Constructor. The axiom set is reloaded from the on-disk cache
+        in cacheDir when possible (see loadAxioms). Checking the axiom
+        set for satisfiability is slow and only done if checkAxioms is set.
+        
+        Every axiom carries hand chosen E-matching patterns, unless
+        patterns is False, in which case z3 infers its own triggers.
         '''
         print ("=== Initializing language EuclidZ3 ===")
+        self.usePatterns = patterns
         
         # # make sorts
         self.PointSort = DeclareSort("Point")
@@ -100,16 +131,39 @@ class LanguageE(object):
         
         # # make constants/terms
         self.RightAngle = Const("RightAngle", RealSort())
+        
+        ## (name, domain sort names, range sort name) of every symbol, so the
+        ## language can be declared again in other z3 contexts
+        self.signatures = [(f.name(), [f.domain(i).name() for i in range(f.arity())], f.range().name()) 
+            for f in [self.Between, self.OnLine, self.OnCircle, self.Inside, self.Center, 
+                      self.SameSide, self.Intersectsll, self.Intersectslc, self.Intersectscc, 
+                      self.Segment, self.Angle, self.Area, self.RightAngle.decl()]]
+        
+        self.axioms = self.loadAxioms(cacheDir)
+        self.axiomSymbols = [self.symbolsOf(axiom) for axiom in self.axioms]
+        self.solver = Solver()
+        self.solver.add(self.axioms)
+        
+        if checkAxioms:
+            self.checkAxioms()
+    
+    def makeAxioms(self):
+        '''
+        Builds and returns the list of axioms for language E.
+        '''
         a, b, c, d, e = Consts('a b c d e', self.PointSort)
         L, M, N = Consts('L M N' , self.LineSort)
         alpha, beta = Consts('alpha beta', self.CircleSort)
         
         # # assert self.axioms for language E         
         self.axioms = [ ]
+        self.axiomGroups = [ ]
+        self.symmetries = set()
         
         """
             ---------- DIAGRAMMATIC AXIOMS ----------
         """
+        self.beginGroup("diagrammatic")
         """
           Two points determine a line
           1. If a != b, a is on L, and b is L, a is on M and b is on M,
@@ -119,25 +173,31 @@ class LanguageE(object):
             Implies(And(\
                 Not(a == b), self.OnLine(a, L), self.OnLine(b, L), \
                 self.OnLine(a, M), self.OnLine(b, M)), \
-                     L == M)))
+                     L == M), \
+            patterns=self.triggers(MultiPattern(self.OnLine(a, L), self.OnLine(b, L), self.OnLine(a, M), self.OnLine(b, M)))))
         
+        self.beginGroup("circle")
         """
           self.Center of circle is unique
           2. if a and b are both centers of alpha then a=b
           3. if a is the center of alpha then a is inside alpha          
         """
         self.axioms.append(ForAll([a, b, alpha], \
-            Implies((And (self.Center(a, alpha), self.Center(b, alpha))), a == b)))
+            Implies((And (self.Center(a, alpha), self.Center(b, alpha))), a == b), \
+            patterns=self.triggers(MultiPattern(self.Center(a, alpha), self.Center(b, alpha)))))
         self.axioms.append(ForAll([a, alpha], \
-            Implies(self.Center(a, alpha), self.Inside(a, alpha))))
+            Implies(self.Center(a, alpha), self.Inside(a, alpha)), \
+            patterns=self.triggers(self.Center(a, alpha))))
         
         """
           No degenerate circles
           4. if a is inside alpha, then a is not on alpha
         """
         self.axioms.append(ForAll([a, alpha] , \
-            Implies(self.Inside(a, alpha), Not(self.OnCircle(a, alpha)))))
+            Implies(self.Inside(a, alpha), Not(self.OnCircle(a, alpha))), \
+            patterns=self.triggers(self.Inside(a, alpha))))
         
+        self.beginGroup("diagrammatic")
         """
           Strict betweeness
           1. If b is between a and c then b is between c and a,
@@ -152,40 +212,52 @@ class LanguageE(object):
           7. if b is between a and c and b is between a and d then b is not between c and d.
         """
         
+        self.axioms.append(ForAll([a, b, c], \
+            Implies(self.Between(a, b, c), self.Between(c, b, a)), \
+            patterns=self.triggers(self.Between(a, b, c))))
+        self.symmetry()
+        
         self.axioms.append(ForAll([a, b, c], \
             Implies(self.Between(a, b, c), \
-                And(self.Between(c, b, a), Not(a == c), Not(a == b), Not(self.Between(b, a, c))))))
+                And(Not(a == c), Not(a == b), Not(self.Between(b, a, c)))), \
+            patterns=self.triggers(self.Between(a, b, c))))
         
         self.axioms.append(ForAll([a, b, c], \
             Implies(And(\
                 self.Between(a, b, c), self.OnLine(a, L), self.OnLine(b, L)), \
-                    self.OnLine(c, L))))
+                    self.OnLine(c, L)), \
+            patterns=self.triggers(self.Between(a, b, c))))
         
         self.axioms.append(ForAll([a, b, c], \
             Implies(And(\
                 self.Between(a, b, c), self.OnLine(a, L), self.OnLine(c, L)), \
-                    self.OnLine(b, L))))
+                    self.OnLine(b, L)), \
+            patterns=self.triggers(self.Between(a, b, c))))
         
         self.axioms.append(ForAll([a, b, c], \
             Implies(And(\
                 self.Between(a, b, c), self.Between(a, d, b)), \
-                    self.Between(a, d, c))))
+                    self.Between(a, d, c)), \
+            patterns=self.triggers(self.Between(a, b, c))))
         
         self.axioms.append(ForAll([a, b, c, d], \
             Implies(And(\
                 self.Between(a, b, c), self.Between(b, c, d)), \
-                    self.Between(a, b, d))))
+                    self.Between(a, b, d)), \
+            patterns=self.triggers(MultiPattern(self.Between(a, b, c), self.Between(b, c, d)))))
         
         self.axioms.append(ForAll([a, b, c, L], \
             Implies(And(\
                 self.OnLine(a, L), self.OnLine(b, L), self.OnLine(c, L), \
                 Not(a == b), Not(a == c), Not(b == c)), \
-                    Or(self.Between(a, b, c), self.Between(b, a, c), self.Between(a, c, b)))))
+                    Or(self.Between(a, b, c), self.Between(b, a, c), self.Between(a, c, b))), \
+            patterns=self.triggers(MultiPattern(self.OnLine(a, L), self.OnLine(b, L), self.OnLine(c, L)))))
         
         self.axioms.append(ForAll([a, b, c, d], \
             Implies(And(\
                 self.Between(a, b, c), self.Between(a, b, d)), \
-                    Not(self.Between(d, b, c)))))
+                    Not(self.Between(d, b, c))), \
+            patterns=self.triggers(MultiPattern(self.Between(a, b, c), self.Between(a, b, d)))))
         
         
         """
@@ -202,18 +274,25 @@ class LanguageE(object):
         
         self.axioms.append(ForAll([a, L], \
             Implies(Not(self.OnLine(a, L)), \
-                self.SameSide(a, a, L))))
+                self.SameSide(a, a, L)), \
+            patterns=self.triggers(self.OnLine(a, L))))
         self.axioms.append(ForAll([a, b, L], \
-            Implies(self.SameSide(a, b, L), \
-                And(Not(self.OnLine(a, L), self.SameSide(b, a, L))))))
+            Implies(self.SameSide(a, b, L), self.SameSide(b, a, L)), \
+            patterns=self.triggers(self.SameSide(a, b, L))))
+        self.symmetry()
+        self.axioms.append(ForAll([a, b, L], \
+            Implies(self.SameSide(a, b, L), Not(self.OnLine(a, L))), \
+            patterns=self.triggers(self.SameSide(a, b, L))))
         self.axioms.append(ForAll([a, b, c, L], \
             Implies(And(\
                 self.SameSide(a, b, L), self.SameSide(a, c, L)), \
-                    self.SameSide(b, c, L))))
+                    self.SameSide(b, c, L)), \
+            patterns=self.triggers(MultiPattern(self.SameSide(a, b, L), self.SameSide(a, c, L)))))
         self.axioms.append(ForAll([ a, b, c, L], \
             Implies(And(\
                 Not(self.OnLine(a, L)), Not(self.OnLine(b, L)), Not(self.OnLine(c, L))), \
-                    Or(self.SameSide(a, b, L), self.SameSide(a, c, L), self.SameSide(b, c, L)))))
+                    Or(self.SameSide(a, b, L), self.SameSide(a, c, L), self.SameSide(b, c, L))), \
+            patterns=self.triggers(MultiPattern(self.OnLine(a, L), self.OnLine(b, L), self.OnLine(c, L)))))
         
         # # TODO: check this axiom below with avigad, 
         # # "either a and c are sameside L, or b"
@@ -222,7 +301,8 @@ class LanguageE(object):
             Implies(And(\
                 Not(self.OnLine(a, L)), Not(self.OnLine(b, L)), Not(self.OnLine(c, L)), \
                 Not(self.SameSide(a, b, L))), \
-                    Or(self.SameSide(a, c, L), self.SameSide(b, c, L)))))
+                    Or(self.SameSide(a, c, L), self.SameSide(b, c, L))), \
+            patterns=self.triggers(MultiPattern(self.SameSide(a, b, L), self.OnLine(c, L)))))
         
         """
            Pasch self.axioms
@@ -239,23 +319,27 @@ class LanguageE(object):
         self.axioms.append(ForAll([a, b, c, L], \
             Implies(And(\
                 self.Between(a, b, c), self.SameSide(a, c, L)), \
-                    self.SameSide(a, b, L))))
+                    self.SameSide(a, b, L)), \
+            patterns=self.triggers(MultiPattern(self.Between(a, b, c), self.SameSide(a, c, L)))))
         
         self.axioms.append(ForAll([a, b, c, L], \
             Implies(And(\
                 self.Between(a, b, c), self.OnLine(a, L), Not(self.OnLine(b, L))), \
-                    self.SameSide(b, c, L))))
+                    self.SameSide(b, c, L)), \
+            patterns=self.triggers(MultiPattern(self.Between(a, b, c), self.OnLine(a, L)))))
         
         self.axioms.append(ForAll([a, b, c, L], \
             Implies(And(\
                 self.Between(a, b, c), self.OnLine(b, L)), \
-                    Not(self.SameSide(a, c, L)))))
+                    Not(self.SameSide(a, c, L))), \
+            patterns=self.triggers(MultiPattern(self.Between(a, b, c), self.OnLine(b, L)))))
         
         self.axioms.append(ForAll([a, b, c, L, M], \
             Implies(And(\
                 Not(a == b), Not(b == c), Not(L == M), \
                 self.OnLine(a, M), self.OnLine(b, M), self.OnLine(c, M), Not(self.SameSide(a, c, L)), self.OnLine(b, L)), \
-                    self.Between(a, b, c))))        
+                    self.Between(a, b, c)), \
+            patterns=self.triggers(MultiPattern(self.SameSide(a, c, L), self.OnLine(b, L), self.OnLine(b, M)))))        
         """
            Triple incidence self.axioms
            1. if L, M, and N are lines meeting at a point a, and b, c, and d are points on L, M,and N resctively,
@@ -274,79 +358,95 @@ class LanguageE(object):
             Implies(And(\
                 self.OnLine(a, L), self.OnLine(a, M), self.OnLine(a, N), self.OnLine(b, L), self.OnLine(c, M), self.OnLine(d, N), \
                 self.SameSide(c, d, L), self.SameSide(b, c, N)), \
-                    Not(self.SameSide(b, d, M)))))
+                    Not(self.SameSide(b, d, M))), \
+            patterns=self.triggers(MultiPattern(self.SameSide(c, d, L), self.SameSide(b, c, N), self.OnLine(a, M)))))
         
         self.axioms.append(ForAll([a, b, c, d], \
             Implies(And(\
                 self.OnLine(a, L), self.OnLine(a, M), self.OnLine(a, N), \
                 self.OnLine(b, L), self.OnLine(c, M), self.OnLine(d, N), \
                 self.SameSide(c, d, L), Not(self.SameSide(d, b, M)), Not(self.OnLine(d, M)), Not(b == a)), \
-                    self.SameSide(b, c, N))))
+                    self.SameSide(b, c, N)), \
+            patterns=self.triggers(MultiPattern(self.SameSide(c, d, L), self.SameSide(d, b, M), self.OnLine(a, N)))))
         
         self.axioms.append(ForAll([a, b, c, d, e, L, M, N], \
             Implies(And(\
                 self.OnLine(a, L), self.OnLine(c, M), self.OnLine(a, N), self.OnLine(b, L), \
                 self.OnLine(c, M), self.OnLine(d, N), self.SameSide(b, c, N), self.SameSide(d, c, L), \
                 self.SameSide(d, e, M), self.SameSide(c, e, N)), \
-                    self.SameSide(c, e, L))))
+                    self.SameSide(c, e, L)), \
+            patterns=self.triggers(MultiPattern(self.SameSide(b, c, N), self.SameSide(d, c, L), self.SameSide(d, e, M), self.OnLine(a, L)))))
         """
             Circle self.axioms
         """
+        self.beginGroup("circle")
         
         self.axioms.append(ForAll([a, b, c, alpha, L], \
             Implies(And(\
                 self.Inside(a, alpha), self.OnCircle(b, alpha), self.OnCircle(c, alpha), \
                 self.OnLine(a, L), self.OnLine(b, L), self.OnLine(c, L), Not(b == c)), \
-                    self.Between(b, a, c))))
+                    self.Between(b, a, c)), \
+            patterns=self.triggers(MultiPattern(self.Inside(a, alpha), self.OnCircle(b, alpha), self.OnCircle(c, alpha), self.OnLine(a, L)))))
         
         self.axioms.append(ForAll([a, b, c, alpha], \
             Implies(And(\
                 Or(self.Inside(a, alpha), self.OnCircle(a, alpha)), Or(self.Inside(b, alpha), self.OnCircle(b, alpha)), \
                 self.Between(a, c, b)), \
-                    And(Not(self.Inside(b, alpha)), Not(self.OnCircle(b, alpha))))))
+                    self.Inside(c, alpha)), \
+            patterns=self.triggers(MultiPattern(self.Between(a, c, b), self.Inside(a, alpha)), \
+                MultiPattern(self.Between(a, c, b), self.OnCircle(a, alpha)))))
         
-        self.axioms.append(ForAll([a, b, c, alpha, L], \
+        self.axioms.append(ForAll([a, b, c, alpha], \
             Implies(And(\
                 Or(self.Inside(a, alpha), self.OnCircle(a, alpha)), Not(self.Inside(c, alpha)), self.Between(a, c, b)), \
-                    And(Not(self.Inside(b, alpha)), Not(self.OnCircle(b, alpha))))))
+                    And(Not(self.Inside(b, alpha)), Not(self.OnCircle(b, alpha)))), \
+            patterns=self.triggers(MultiPattern(self.Between(a, c, b), self.Inside(c, alpha)))))
         
         self.axioms.append(ForAll([a, b, c, d, alpha, beta], \
             Implies(And(\
                 self.OnCircle(c, alpha), self.OnCircle(c, beta), self.OnCircle(d, alpha), self.OnCircle(d, beta), \
                 Not(alpha == beta), Not(c == d), self.OnLine(a, L), self.OnLine(b, L), \
                 self.Center(a, alpha), self.Center(a, beta)), \
-                    Not(self.SameSide(c, d, L)))))
+                    Not(self.SameSide(c, d, L))), \
+            patterns=self.triggers(MultiPattern(self.Center(a, alpha), self.Center(a, beta), self.OnCircle(c, alpha), self.OnCircle(d, beta), self.OnLine(b, L)))))
         
         """
             Intersection
         """
+        self.beginGroup("intersection")
         self.axioms.append(ForAll([L, M, a, b], \
             Implies(And(\
                 self.OnLine(a, M), self.OnLine(b, M), Not(self.SameSide(a, b, L))), \
-                    self.Intersectsll(L, M))))
+                    self.Intersectsll(L, M)), \
+            patterns=self.triggers(MultiPattern(self.SameSide(a, b, L), self.OnLine(a, M), self.OnLine(b, M)))))
         
         self.axioms.append(ForAll([alpha, L, a, b], \
             Implies(And(\
                 Or(self.Inside(a, alpha), self.OnCircle(a, alpha)), \
                 Or(self.Inside(b, alpha), self.OnCircle(b, alpha)), \
                 Not(self.OnLine(a, L)), Not(self.OnLine(b, L)), Not(self.SameSide(a, b, L))), \
-                    self.Intersectslc(L, alpha))))
+                    self.Intersectslc(L, alpha)), \
+            patterns=self.triggers(MultiPattern(self.SameSide(a, b, L), self.Inside(a, alpha)), \
+                MultiPattern(self.SameSide(a, b, L), self.OnCircle(a, alpha)))))
         
         self.axioms.append(ForAll([L, alpha, a], \
             Implies(And(\
                 self.Inside(a, alpha), self.OnLine(a, L)), \
-                    self.Intersectslc(L, alpha))))
+                    self.Intersectslc(L, alpha)), \
+            patterns=self.triggers(MultiPattern(self.Inside(a, alpha), self.OnLine(a, L)))))
         
         self.axioms.append(ForAll([alpha, beta, a, b], \
             Implies(And(\
                 self.OnCircle(a, alpha), Or(self.Inside(b, alpha), self.OnCircle(b, alpha)), \
                 self.Inside(a, beta), Not(self.Inside(b, beta)), Not(self.OnCircle(b, beta))), \
-                    self.Intersectscc(alpha, beta))))
+                    self.Intersectscc(alpha, beta)), \
+            patterns=self.triggers(MultiPattern(self.OnCircle(a, alpha), self.Inside(a, beta), self.Inside(b, beta)))))
         
         self.axioms.append(ForAll([alpha, beta, a, b], \
             Implies(And(\
-                self.OnCircle(a, alpha), self.Inside(b, beta), self.Inside(a, beta), self.OnCircle(b, beta)), \
-                    self.Intersectscc(alpha, beta))))
+                self.OnCircle(a, alpha), self.Inside(b, alpha), self.Inside(a, beta), self.OnCircle(b, beta)), \
+                    self.Intersectscc(alpha, beta)), \
+            patterns=self.triggers(MultiPattern(self.OnCircle(a, alpha), self.OnCircle(b, beta)))))
         
         """
             ---------- METRIC AXIOMS ----------
@@ -354,72 +454,91 @@ class LanguageE(object):
         """
             Segments
         """
+        self.beginGroup("segment")
         self.axioms.append(ForAll([a, b], \
-            Implies(self.Segment(a, b) == RealVal(0.0), a == b)))
+            Implies(self.Segment(a, b) == RealVal(0.0), a == b), \
+            patterns=self.triggers(self.Segment(a, b))))
         
         self.axioms.append(ForAll([a], \
-            self.Segment(a, a) == RealVal(0.0)))
+            self.Segment(a, a) == RealVal(0.0), \
+            patterns=self.triggers(self.Segment(a, a))))
         
         self.axioms.append(ForAll([a, b], \
-            (self.Segment(a, b) >= RealVal(0.0))))
+            (self.Segment(a, b) >= RealVal(0.0)), \
+            patterns=self.triggers(self.Segment(a, b))))
         
         self.axioms.append(ForAll([a, b], \
-            self.Segment(a, b) == self.Segment(b, a)))
+            self.Segment(a, b) == self.Segment(b, a), \
+            patterns=self.triggers(self.Segment(a, b))))
+        self.symmetry()
         
         """
             Angles
         """
+        self.beginGroup("angle")
         
         self.axioms.append(ForAll ([a, b, c], \
             Implies(And(\
                 Not(a == b), Not(b == c)), \
-                    self.Angle(a, b, c) == self.Angle(c, b, a))))
+                    self.Angle(a, b, c) == self.Angle(c, b, a)), \
+            patterns=self.triggers(self.Angle(a, b, c))))
         
         self.axioms.append(ForAll ([a, b, c], \
             Implies(And(\
                 Not((a == b)), Not((b == c))), \
                     And(\
                         self.Angle(a, b, c) >= RealVal(0.0), \
-                        self.Angle(a, b, c) <= (self.RightAngle + self.RightAngle)))))
+                        self.Angle(a, b, c) <= (self.RightAngle + self.RightAngle))), \
+            patterns=self.triggers(self.Angle(a, b, c))))
         
         """
             Areas
         """
+        self.beginGroup("area")
         
         self.axioms.append(ForAll([a, b], \
-            self.Area(a, a, b) == RealVal(0.0)))
+            self.Area(a, a, b) == RealVal(0.0), \
+            patterns=self.triggers(self.Area(a, a, b))))
         
         self.axioms.append(ForAll([a, b, c], \
-            self.Area(a, b, c) >= RealVal(0.0)))
+            self.Area(a, b, c) >= RealVal(0.0), \
+            patterns=self.triggers(self.Area(a, b, c))))
         
         self.axioms.append(ForAll([a, b, c], \
-            And(self.Area(a, b, c) == self.Area(c, a, b), self.Area(a, b, c) == self.Area(b, a, c))))
+            And(self.Area(a, b, c) == self.Area(c, a, b), self.Area(a, b, c) == self.Area(b, a, c)), \
+            patterns=self.triggers(self.Area(a, b, c))))
+        self.symmetry()
         
         """
             ---------- Transfer AXIOMS ----------
         """
+        self.beginGroup("transfer")
         
         """
             Diagram-segment transfer self.axioms
         """
         self.axioms.append(ForAll([a, b, c], \
-            Implies(self.Between(a, b, c), ((self.Segment(a, b) + self.Segment(b, c)) == self.Segment(a, c)))))
+            Implies(self.Between(a, b, c), ((self.Segment(a, b) + self.Segment(b, c)) == self.Segment(a, c))), \
+            patterns=self.triggers(self.Between(a, b, c))))
         
         # # center and radius determine circle
         self.axioms.append(ForAll([a, b, c, alpha, beta], \
             Implies(And(\
                 self.Center(a, alpha), self.Center(a, beta), self.OnCircle(b, alpha), self.OnCircle(c, beta), \
                 self.Segment(a, b) == self.Segment(a, c)), \
-                    (alpha == beta))))
+                    (alpha == beta)), \
+            patterns=self.triggers(MultiPattern(self.Center(a, alpha), self.Center(a, beta), self.OnCircle(b, alpha), self.OnCircle(c, beta)))))
         
         self.axioms.append(ForAll([a, b, c, alpha], \
-            Implies(And(self.Center(a, alpha), self.OnCircle(b, beta), self.Segment(a, c) == self.Segment(a, b)), \
-                self.OnCircle(c, alpha))))
+            Implies(And(self.Center(a, alpha), self.OnCircle(b, alpha), self.Segment(a, c) == self.Segment(a, b)), \
+                self.OnCircle(c, alpha)), \
+            patterns=self.triggers(MultiPattern(self.Center(a, alpha), self.OnCircle(b, alpha), self.Segment(a, c)))))
         
         self.axioms.append(ForAll([a, b, c, alpha], \
             Implies(And(\
                 self.Center(a, alpha), self.OnCircle(b, alpha)), \
-                    ((self.Segment(a, c) == self.Segment(a, b)) == self.Inside(c, alpha)))))
+                    ((self.Segment(a, c) < self.Segment(a, b)) == self.Inside(c, alpha))), \
+            patterns=self.triggers(MultiPattern(self.Center(a, alpha), self.OnCircle(b, alpha), self.Segment(a, c)))))
         
         
         """
@@ -428,11 +547,13 @@ class LanguageE(object):
         self.axioms.append(ForAll([a, b, c, L], \
             Implies(And(\
                 Not((a == b)), Not((a == c)), self.OnLine(a, L), self.OnLine(b, L)), \
-                    (And(self.OnLine(c, L), Not(self.Between(c, a, b))) == (self.Angle(b, a, c) == RealVal(0.0))))))
+                    (And(self.OnLine(c, L), Not(self.Between(c, a, b))) == (self.Angle(b, a, c) == RealVal(0.0)))), \
+            patterns=self.triggers(MultiPattern(self.OnLine(a, L), self.OnLine(b, L), self.Angle(b, a, c)))))
         
         # # Possibly this is superfluous 
         self.axioms.append(ForAll([a, b], \
-            Implies(Not((a == b)), self.Angle(a, b, a) == RealVal(0.0))))
+            Implies(Not((a == b)), self.Angle(a, b, a) == RealVal(0.0)), \
+            patterns=self.triggers(self.Angle(a, b, a))))
         
         # # Point inside angle iff angles sum
         self.axioms.append(ForAll([a, b, c, d, L, M], \
@@ -441,13 +562,15 @@ class LanguageE(object):
                 Not((a == b)), Not((a == c)), Not(self.OnLine(d, L)), Not(self.OnLine(d, M)), \
                 Not((L == M))), \
                     ((self.Angle(b, a, c) == (self.Angle(b, a, d) + self.Angle(d, a, c))) == \
-                        And(self.SameSide(b, d, M), self.SameSide(d, c, L))))))
+                        And(self.SameSide(b, d, M), self.SameSide(d, c, L)))), \
+            patterns=self.triggers(MultiPattern(self.OnLine(a, L), self.OnLine(a, M), self.Angle(b, a, d), self.Angle(d, a, c)))))
         
         # # Define right angle (and all right angles are equal)
         self.axioms.append(ForAll([a, b, c, d, L], \
             Implies(And(\
                 self.OnLine(a, L), self.OnLine(b, L), self.Between(a, c, b), Not(self.OnLine(d, L))), \
-                    ((self.Angle(a, c, d) == self.Angle(d, c, b)) == (self.Angle(a, c, d) == self.RightAngle)))))
+                    ((self.Angle(a, c, d) == self.Angle(d, c, b)) == (self.Angle(a, c, d) == self.RightAngle))), \
+            patterns=self.triggers(MultiPattern(self.Between(a, c, b), self.OnLine(a, L), self.Angle(a, c, d)))))
         
         """
             Diagram-area transfer self.axioms
@@ -455,22 +578,187 @@ class LanguageE(object):
         self.axioms.append(ForAll([a, b, c, L], \
             Implies(And(\
                 self.OnLine(a, L), self.OnLine(b, L), Not((a == b))), \
-                    ((self.Area(a, b, c) == RealVal(0.0)) == self.OnLine(c, L)))))
+                    ((self.Area(a, b, c) == RealVal(0.0)) == self.OnLine(c, L))), \
+            patterns=self.triggers(MultiPattern(self.OnLine(a, L), self.OnLine(b, L), self.Area(a, b, c)))))
         
         # # Sum of Areas
         self.axioms.append(ForAll([a, b, c, d, L], \
             Implies(And(\
                 self.OnLine(a, L), self.OnLine(b, L), self.OnLine(c, L), Not(self.OnLine(d, L)), \
                 Not((a == b)), Not((c == a)), Not((c == b))), \
-                    (self.Between(a, c, b) == ((self.Area(a, c, d) + self.Area(d, c, b)) == self.Area(a, d, b))))))
-         
-         
-        
-        
-        self.solver = Solver()
-        self.solver.add(self.axioms)
-        
-        print ("Axiom set : " + str(self.solver.check()))
+                    (self.Between(a, c, b) == ((self.Area(a, c, d) + self.Area(d, c, b)) == self.Area(a, d, b)))), \
+            patterns=self.triggers(MultiPattern(self.Area(a, c, d), self.Area(d, c, b), self.OnLine(a, L)))))
+        self.beginGroup(None)
+        return self.axioms
+    
+    def beginGroup(self, group):
+        '''
+        Tags the axioms appended since the previous call with their group,
+        and starts a new group.
+        '''
+        if len(self.axiomGroups) < len(self.axioms):
+            self.axiomGroups.extend([self.group] * (len(self.axioms) - len(self.axiomGroups)))
+        self.group = group
+    
+    def symmetry(self):
+        '''
+        Marks the last axiom appended as a symmetry axiom, one that only
+        states a symmetry of a relation (see canonical.SYMMETRIC). 
+        Symmetry axioms are redundant on canonicalized ground terms.
+        '''
+        self.symmetries.add(len(self.axioms) - 1)
+    
+    def symbolsOf(self, expr):
+        '''
+        Returns the names of the symbols of this language occurring in expr.
+        '''
+        names = set(signature[0] for signature in self.signatures)
+        found = set()
+        todo = [expr]
+        seen = set()
+        while todo:
+            node = todo.pop()
+            if node.get_id() in seen:
+                continue
+            seen.add(node.get_id())
+            if is_quantifier(node):
+                todo.append(node.body())
+            elif is_app(node):
+                if node.decl().name() in names:
+                    found.add(node.decl().name())
+                todo.extend(node.children())
+        return found
+    
+    def familiesOf(self, symbols):
+        '''
+        Returns the symbol families (see FAMILIES) of the given symbol names.
+        '''
+        return set(FAMILIES[symbol] for symbol in symbols if symbol in FAMILIES)
+    
+    def triggers(self, *patterns):
+        '''
+        Returns the patterns for an axiom, or none when patterns are disabled.
+        '''
+        if not self.usePatterns:
+            return []
+        return list(patterns)
+    
+    def axiomHash(self):
+        '''
+        Returns a hash identifying this axiom set. It changes whenever
+        the source of this class, which declares the symbols and builds,
+        tags and serializes the axioms, or the z3 version changes.
+        '''
+        try:
+            source = inspect.getsource(LanguageE)
+        except (IOError, TypeError):
+            return None
+        digest = hashlib.sha256()
+        digest.update(source.encode("utf-8"))
+        digest.update(get_version_string().encode("utf-8"))
+        digest.update(str(self.usePatterns).encode("utf-8"))
+        return digest.hexdigest()[:16]
+    
+    def loadAxioms(self, cacheDir=None):
+        '''
+        Returns the axioms, reloading them from the serialized SMT-LIB
+        file in cacheDir if one exists for this axiom set. Otherwise the 
+        axioms are built and the file is written for the next cold start.
+        '''
+        if cacheDir is None:
+            cacheDir = os.environ.get("EUCLIDZ3_CACHE_DIR", 
+                os.path.join(os.path.expanduser("~"), ".cache", "EuclidZ3"))
+        key = self.axiomHash()
+        ## identifies the axiom set in query cache keys
+        self.axiomKey = key
+        if cacheDir and key is not None:
+            path = os.path.join(cacheDir, "axioms-" + key + ".smt2")
+            try:
+                with open(path) as cached:
+                    self.axiomText = cached.read()
+                tags = [line.split()[2:] for line in self.axiomText.splitlines() 
+                    if line.startswith("; group ")]
+                self.axiomGroups = [tag[0] for tag in tags]
+                self.symmetries = set(index for index, tag in enumerate(tags) if "symmetry" in tag[1:])
+                return self.axiomsIn(main_ctx())
+            except (IOError, OSError, Z3Exception):
+                pass
+        
+        axioms = self.makeAxioms()
+        self.axiomText = self.serializeAxioms(axioms)
+        if not cacheDir or key is None:
+            return axioms
+        try:
+            if not os.path.isdir(cacheDir):
+                os.makedirs(cacheDir)
+            ## write to a private file first so concurrent workers 
+            ## never read a partially written axiom set
+            handle, tmpPath = tempfile.mkstemp(dir=cacheDir, suffix=".tmp")
+            with os.fdopen(handle, "w") as tmp:
+                tmp.write(self.axiomText)
+            os.replace(tmpPath, path)
+        except (IOError, OSError):
+            pass
+        return axioms
+    
+    def serializeAxioms(self, axioms):
+        '''
+        Returns axioms as SMT-LIB assertions. Symbols of the language are
+        left undeclared, constants occurring free in the axioms are listed
+        in "; const <name> <sort>" comment lines. Each assertion follows a
+        "; group <group> [symmetry]" line.
+        '''
+        names = set(signature[0] for signature in self.signatures)
+        free = dict()
+        todo = list(axioms)
+        while todo:
+            expr = todo.pop()
+            if is_quantifier(expr):
+                todo.append(expr.body())
+            elif is_app(expr):
+                if expr.num_args() == 0 and expr.decl().kind() == Z3_OP_UNINTERPRETED \
+                        and expr.decl().name() not in names:
+                    free[expr.decl().name()] = expr.sort().name()
+                todo.extend(expr.children())
+        lines = ["; const " + name + " " + free[name] for name in sorted(free)]
+        for index, (group, axiom) in enumerate(zip(self.axiomGroups, axioms)):
+            lines.append("; group " + group + (" symmetry" if index in self.symmetries else ""))
+            lines.append("(assert " + axiom.sexpr() + ")")
+        return "\n".join(lines) + "\n"
+    
+    def axiomsIn(self, ctx):
+        '''
+        Returns a copy of the axioms in the z3 Context ctx. The copy is
+        parsed from the serialized axiom set, so it never touches
+        the context of this language and is safe to call from any thread.
+        '''
+        ## z3 only identifies the parsed symbols with those of the API 
+        ## when they are passed in explicitly
+        sorts = dict()
+        def sortIn(name):
+            if name == "Bool":
+                return BoolSort(ctx)
+            if name == "Real":
+                return RealSort(ctx)
+            if name not in sorts:
+                sorts[name] = DeclareSort(name, ctx)
+            return sorts[name]
+        decls = dict()
+        for name, domain, rng in self.signatures:
+            decls[name] = Function(name, *([sortIn(s) for s in domain] + [sortIn(rng)]))
+        for line in self.axiomText.splitlines():
+            if line.startswith("; const "):
+                name, sort = line.split()[2:4]
+                decls[name] = Const(name, sortIn(sort))
+        return list(parse_smt2_string(self.axiomText, sorts=sorts, decls=decls, ctx=ctx))
+    
+    def checkAxioms(self):
+        '''
+        Checks that the axiom set is satisfiable. Returns the z3 result.
+        '''
+        result = self.solver.check()
+        print ("Axiom set : " + str(result))
+        return result
 
 class Proof(object):
     '''
@@ -481,21 +769,237 @@ class Proof(object):
     It can carry out construction of GeometricObjects
     '''
 
-    def __init__(self):
+    def __init__(self, entailment=False, ground=False, mbqi=True, language=None, relevance=False, 
+                 closure=False, queryCache=None, timeout=None, rlimit=None, portfolio=None,
+                 previous=None, pool=None, models=8, samples=0, entailedPrereqs=False):
         '''
-        Constructor
+        Constructor. If entailment is set, hence only accepts
+        expressions entailed by the facts of the proof, rather than
+        expressions merely consistent with them.
+        
+        If ground is set, the axioms are instantiated over the points,
+        lines and circles of the proof (see Grounder) and checked with a
+        quantifier free QF_UFLRA solver. New instances are added each 
+        time an object is constructed or mentioned by hence.
+        
+        Setting mbqi to False leaves quantifier instantiation to E-matching 
+        on the patterns of the axioms. language defaults to the shared 
+        LanguageE.
+        
+        If relevance is set, an axiom is only loaded once the proof uses
+        a symbol of every family (see FAMILIES) the axiom mentions, so a 
+        proof that never mentions circles or areas never pays for them.
+        
+        If closure is set, the diagrammatic facts of the proof are also
+        saturated by forward chaining (see Closure), and hence answers
+        the queries settled by the closure without calling z3.
+        
+        queryCache is an optional QueryCache that hence and construct 
+        consult before calling z3, and store the answers of z3 in.
+        
+        timeout (milliseconds) and rlimit bound every check. A check
+        that runs out is answered unknown, and the step it was for is
+        recorded in undecided. portfolio is an optional Portfolio that 
+        races several configurations on each check instead of using the
+        proof's own solver; it is not used in ground mode.
+        
+        previous is an earlier run of an edited version of this proof. 
+        Its steps are replayed without a solver call where the facts they
+        depended on are unchanged (see history).
+        
+        pool is a SolverPool to check a warm solver out of, which close
+        returns. Without one the default pool is used, if one is set (see
+        setDefaultPool) and it has a solver to spare for this proof.
+        
+        The models of the last few satisfiable checks, up to models, are 
+        kept while they remain models of the facts. A claim one of them
+        refutes is rejected without a solver call, and outside entailment
+        mode a claim one of them satisfies is accepted without one.
+        
+        If samples is set, the objects of the proof are also realized in
+        that many random configurations of the plane (see Sampler), which
+        are used like the kept models. This needs numpy.
+        
+        construct only requires the prerequisites of a construction to be
+        consistent with the facts, unless entailedPrereqs is set, in which
+        case they must be entailed by them.
         '''           
         print ("=== Initializing proof checker ===")
-        self.language = language
-        self.solver = language.solver
+        self.entailment = entailment
+        self.entailedPrereqs = entailedPrereqs
+        self.mbqi = mbqi
+        self.language = language if language is not None else getLanguage()
+        ## each proof owns its own z3 context, so facts never leak between
+        ## proofs and independent proofs can be checked on separate threads.
+        ## Geometric objects should still be built on a single thread.
+        self.pooled = None
+        if pool is not None:
+            if ground or relevance or pool.mbqi != mbqi or pool.language is not self.language:
+                raise ValueError("the solvers of the pool do not fit the options of this proof")
+            self.pool = pool
+            self.pooled = pool.checkout()
+        elif _defaultPool is not None and not ground and not relevance and \
+                _defaultPool.mbqi == mbqi and _defaultPool.language is self.language:
+            self.pool = _defaultPool
+            self.pooled = _defaultPool.checkout(block=False)
+        if self.pooled is not None:
+            ## the checkout this proof holds, see SolverPool.release
+            self.lease = self.pooled.uses
+            self.context = self.pooled.context
+            entries = []
+        else:
+            self.context = Context()
+            entries = list(zip(self.language.axiomsIn(self.context), 
+                [self.language.familiesOf(symbols) for symbols in self.language.axiomSymbols], 
+                self.language.axiomGroups))
+        if ground:
+            ## ground terms are canonicalized, which makes symmetry axioms redundant
+            entries = [entry for index, entry in enumerate(entries) if index not in self.language.symmetries]
+        ## with relevance, axioms not loaded yet as (axiom, families, group)
+        self.unloaded = None
+        self.families = set()
+        self.groups = set()
+        if relevance:
+            self.unloaded = entries
+            axioms = []
+        else:
+            axioms = [axiom for axiom, _, _ in entries]
+            self.groups.update(group for _, _, group in entries)
+        
+        self.grounder = None
+        if self.pooled is not None:
+            ## the axioms are asserted below the base scope of the pooled solver
+            self.solver = self.pooled.solver
+            self.groups.update(self.language.axiomGroups)
+        elif ground:
+            self.solver = SolverFor("QF_UFLRA", ctx=self.context)
+            self.grounder = Grounder(axioms)
+        else:
+            self.solver = Solver(ctx=self.context)
+            if not mbqi:
+                self.solver.set("smt.mbqi", False)
+            self.solver.add(axioms)
+        self.timeout = timeout
+        self.rlimit = rlimit
+        if timeout:
+            self.solver.set("timeout", timeout)
+        if rlimit:
+            self.solver.set("rlimit", rlimit)
+        self.portfolio = portfolio if self.grounder is None else None
+        ## answer, reason for an unknown answer and ids of the unsat core 
+        ## literals of the last check
+        self.lastResult = None
+        self.lastReason = None
+        self.lastCore = []
+        self.closure = Closure() if closure else None
+        self.queryCache = queryCache
+        ## SMT-LIB text of every tracked fact, for query cache keys and
+        ## step dependencies
+        self.contextTexts = dict()
+        ## one entry per step of the proof: its kind, a signature of what
+        ## it checks, whether it checked, the basis it was decided on and
+        ## the steps that introduced the facts of that basis, and the reason
+        ## each of its failures was undecided, or None. A basis is
+        ## ("core", facts) if the step holds for any superset of the facts,
+        ## or ("facts", facts) if it was decided by a satisfiable check
+        ## against all the facts, which must stay the same. Facts that share
+        ## no object with the step can still make it fail through the axioms
+        self.history = []
+        ## SMT-LIB text of a fact -> index of the step that introduced it
+        self.introducedBy = dict()
+        self.basis = None
+        ## signature -> entries of the history of previous, in order
+        self.previous = dict()
+        if previous is not None:
+            for entry in previous.history:
+                if entry["signature"] is not None:
+                    self.previous.setdefault(entry["signature"], []).append(entry)
+        self.reused = 0
+        ## event loop -> the lock serializing the async steps of this proof
+        ## in that loop, made on first use
+        self.asyncLocks = weakref.WeakKeyDictionary()
+        ## lazily found ground instances, and how many existed at each push
+        self.instances = []
+        self.scopes = []
         self.points = dict()
         self.lines = dict()
         self.circles = dict()
-        ## TODO: make constructableobjects and expression hashable so they
-        ## can be stored in a set instead of a list. Increase performance,
-        ## remove annoying duplicates.
-        self.assumptions = []
-        self.conclusions = []  
+        ## the facts assumed and concluded, each once (see FactSet). They 
+        ## are records: assume, construct and hence add to them
+        self.assumptions = FactSet()
+        self.conclusions = FactSet()
+        ## classes of the points, lines and circles known to be equal.
+        ## Facts and queries are stated about the representatives
+        self.coincidences = Coincidences()
+        ## every fact is asserted once, guarded by a literal. The literals
+        ## of the facts of the proof are in tracked, and their facts' ids 
+        ## in active. factOf maps a literal's id back to its fact and 
+        ## literalOf maps the id of a fact back to its literal
+        self.tracked = []
+        self.active = set()
+        self.factOf = dict()
+        self.literalOf = dict()
+        ## the prerequisites the last failed construction could not meet
+        self.lastFailure = None
+        ## (expr, facts it depended on) for each entailed conclusion
+        self.justifications = []
+        ## (step, expr) for each step of the proof that did not check
+        self.failures = []
+        ## (step, expr, reason) for each of those the solver could not decide
+        self.undecided = []
+        ## for each failure of the current step, the reason it was undecided
+        ## or None, kept in its history entry
+        self.stepFailures = []
+        ## totals over every check: solver calls, seconds spent in the solver,
+        ## quantifier instantiations (axiom instances found in ground mode)
+        ## and the peak memory of z3 in megabytes
+        self.counters = {"checks": 0, "solverTime": 0.0, "instantiations": 0, "memory": 0.0,
+                         "modelHits": 0, "sampleHits": 0}
+        ## models of the axioms and facts, most recent first
+        self.models = []
+        self.modelLimit = models
+        self.sampler = Sampler(samples) if samples else None
+        ## one record per check with its label, timing, answer and the z3
+        ## statistics it counted (see EuclidZ3.profiling). label names the
+        ## step the checks are made for
+        self.profile = []
+        self.label = None
+        self.created = time.time()
+        self.statistics = profiling.statistics(self.solver) if self.pooled is not None else dict()
+    
+    def local(self, expr):
+        '''
+        Returns expr translated into this proof's z3 context, with
+        coinciding objects replaced by their representative (see 
+        coincide) and the arguments of symmetric relations in canonical
+        order.
+        '''
+        if not is_expr(expr):
+            return BoolVal(expr, self.context)
+        if expr.ctx != self.context:
+            with mainContextLock:
+                expr = expr.translate(self.context)
+        return canonicalize(self.coincidences.rewrite(expr))
+    
+    def close(self):
+        '''
+        Releases this proof's solver and z3 context, returning a pooled
+        solver to its pool. The proof cannot be used afterwards. A proof
+        used as a context manager is closed when the block exits.
+        '''
+        self.models = []
+        if self.pooled is not None:
+            self.pool.release(self.pooled, self.lease)
+            self.pooled = None
+        self.solver = None
+        self.context = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exception):
+        self.close()
+        return False
     
     def point(self,point):
         '''
@@ -507,59 +1011,754 @@ class Proof(object):
             return None
         return result   
     
+    def guard(self, fact, local=None):
+        '''
+        Returns the named literal guarding fact, asserting that the
+        literal implies fact the first time. local is fact in this
+        proof's context, if already known.
+        '''
+        if local is None:
+            local = self.local(fact)
+        if local.get_id() in self.literalOf:
+            return self.literalOf[local.get_id()]
+        literal = Bool("fact!" + str(len(self.literalOf)), self.context)
+        self.solver.add(Implies(literal, local))
+        self.factOf[literal.get_id()] = fact
+        self.literalOf[local.get_id()] = literal
+        return literal
+    
+    def track(self, fact, local=None):
+        '''
+        Makes fact a fact of the proof: its guard literal is assumed by
+        every check, so checks can report which facts they depended on
+        through unsat cores. A fact is only ever asserted once.
+        '''
+        if local is None:
+            local = self.local(fact)
+        literal = self.guard(fact, local)
+        if local.get_id() in self.active:
+            return literal
+        self.active.add(local.get_id())
+        self.tracked.append(literal)
+        if self.closure is not None:
+            self.closure.add(fact)
+        text = local.sexpr()
+        self.contextTexts[text] = fact
+        self.introducedBy.setdefault(text, len(self.history))
+        if self.models:
+            self.models = [model for model in self.models 
+                           if is_true(model.eval(local, model_completion=True))]
+        if self.sampler is not None:
+            self.sampler.add(local)
+        return literal
+    
+    def known(self, expr):
+        '''
+        Returns True if expr, up to canonical form, is a fact of this proof.
+        '''
+        return self.local(expr).get_id() in self.active
+    
+    def record(self, facts, expr):
+        '''
+        Adds expr to facts, the assumptions or conclusions, and tracks it.
+        '''
+        local = self.local(expr)
+        facts.add(expr)
+        literal = self.track(expr, local)
+        self.coincide(local)
+        return literal
+    
+    def coincide(self, local):
+        '''
+        If local, a fact of the proof in its context, equates two points, 
+        lines or circles, merges their classes. From then on facts and 
+        queries are rewritten to the representative of the class, so the
+        solver sees one term where it would have to propagate the equality.
+        The facts already tracked are known in their rewritten form too.
+        '''
+        if not is_eq(local) or len(constants(local)) != 2 or \
+                not all(is_const(arg) for arg in local.children()):
+            return
+        if not self.coincidences.merge(*local.children()):
+            return
+        for text, fact in list(self.contextTexts.items()):
+            rewritten = self.local(fact)
+            alias = rewritten.sexpr()
+            if alias in self.contextTexts:
+                continue
+            self.active.add(rewritten.get_id())
+            self.contextTexts[alias] = fact
+            self.introducedBy[alias] = self.introducedBy[text]
+    
+    def assume(self, expr):
+        '''
+        Asserts expr as an assumption of the proof without checking it.
+        '''
+        self.stepFailures = []
+        self.register(expr)
+        self.record(self.assumptions, expr)
+        self.log("assume", "assume " + self.local(expr).sexpr(), True, ("core", []))
+    
+    def log(self, step, signature, ok, basis, failed=None):
+        '''
+        Appends a step to the history. basis is ("core", facts) or
+        ("facts", SMT-LIB texts), see history. failed lists the
+        positions of the prerequisites a failed construction could not meet.
+        The failures reported for the step so far are logged with it.
+        '''
+        mode, facts = basis
+        if mode == "core":
+            facts = frozenset(self.local(fact).sexpr() for fact in facts)
+        depends = sorted(set(self.introducedBy[text] for text in facts 
+                             if self.introducedBy.get(text, len(self.history)) < len(self.history)))
+        self.history.append({"step": step, "signature": signature, "ok": ok, 
+            "basis": (mode, facts), "depends": depends, "failed": failed or [], 
+            "undecided": self.stepFailures})
+        self.stepFailures = []
+    
+    def replayed(self, signature):
+        '''
+        Returns the entry of the previous run for the step with signature
+        if the step can be reused: the facts it depended on are still 
+        facts, and for a step decided by a satisfiable check, the facts are
+        the same. A step that failed on an answer cut short by a limit (see
+        settled) is checked again. Returns None otherwise.
+        '''
+        entries = self.previous.get(signature)
+        if not entries:
+            return None
+        entry = entries.pop(0)
+        if not all(reason is None or self.settled('unknown', reason) for reason in entry["undecided"]):
+            return None
+        mode, facts = entry["basis"]
+        if mode == "core" and not all(text in self.contextTexts for text in facts):
+            return None
+        if mode == "facts" and facts != frozenset(self.contextTexts):
+            return None
+        self.reused += 1
+        return entry
+    
+    def dependents(self, index):
+        '''
+        Returns the indices of the steps of the history that depend on
+        step index, directly or through other steps.
+        '''
+        found = set([index])
+        for later in range(index + 1, len(self.history)):
+            if found.intersection(self.history[later]["depends"]):
+                found.add(later)
+        found.discard(index)
+        return sorted(found)
+    
+    def check(self, *assumptions):
+        '''
+        Checks the facts of this proof together with assumptions.
+        '''
+        assumptions = self.tracked + list(assumptions)
+        start = time.time()
+        instances = len(self.instances)
+        if self.portfolio is not None:
+            result = self.race(assumptions)
+            self.count(start, instances, result)
+            return result
+        if self.grounder is None:
+            result = self.solver.check(*assumptions)
+        else:
+            ## refine until the model satisfies every instance of the lazy axioms
+            result = refine(self.solver, self.grounder, assumptions, self.instances)
+        self.count(start, instances, result)
+        if len(self.instances) > instances:
+            ## new ground instances may be false in the kept models
+            self.models = []
+        if str(result) == 'sat' and self.modelLimit:
+            self.models.insert(0, self.solver.model())
+            del self.models[self.modelLimit:]
+        self.lastResult = result
+        self.lastReason = self.solver.reason_unknown() if str(result) == 'unknown' else None
+        self.lastCore = [literal.get_id() for literal in self.solver.unsat_core()] \
+            if str(result) == 'unsat' else []
+        return result
+    
+    def count(self, start, instances, result):
+        '''
+        Adds a check that started at time start, when there were
+        instances lazy axiom instances, to the counters and the profile.
+        '''
+        wall = time.time() - start
+        ## z3 counts most statistics over the life of the solver, so a 
+        ## check's counts are the difference to the ones after the previous
+        ## check; the gauges are reported for the check itself
+        statistics = profiling.statistics(self.solver)
+        counted = profiling.difference(statistics, self.statistics)
+        self.statistics = statistics
+        if self.grounder is not None:
+            counted["axiom instances"] = len(self.instances) - instances
+        self.profile.append({"label": self.label or "check", "start": start - self.created,
+            "wall": wall, "result": str(result), "statistics": counted})
+        
+        counters = self.counters
+        counters["checks"] += 1
+        counters["solverTime"] += wall
+        counters["instantiations"] += counted.get("quant instantiations", 0) + counted.get("axiom instances", 0)
+        counters["memory"] = max(counters["memory"], counted.get("max memory", 0))
+    
+    def stats(self):
+        '''
+        Returns the totals over every check of this proof and, per label,
+        what its checks cost, the most expensive first.
+        '''
+        return {"totals": dict(self.counters), "steps": profiling.summarize(self.profile)}
+    
+    def exportStats(self, path, format="jsonl"):
+        '''
+        Writes the profile of this proof to the file at path, as JSON 
+        lines or, with format "chrome", as a Chrome trace.
+        '''
+        with open(path, "w") as out:
+            if format == "chrome":
+                profiling.writeChromeTrace(self.profile, out)
+            else:
+                profiling.writeJsonLines(self.profile, out)
+    
+    def race(self, assumptions):
+        '''
+        Checks the assertions of the solver under assumptions with the
+        portfolio, bounded by the timeout and rlimit of this proof.
+        Returns the answer of the configuration that won.
+        '''
+        result, reason, core, winner = self.portfolio.check(self.solver.assertions(), 
+            [str(literal) for literal in assumptions], self.timeout, self.rlimit)
+        byName = dict((str(literal), literal) for literal in assumptions)
+        self.lastResult = {'sat' : sat, 'unsat' : unsat}.get(result, unknown)
+        self.lastReason = reason
+        self.lastCore = [byName[name].get_id() for name in (core or []) if name in byName]
+        return self.lastResult
+    
+    def consistent(self, result, reason=None):
+        '''
+        Returns True if result shows the checked facts are consistent. 
+        Without MBQI z3 cannot conclude sat in the presence of quantifiers,
+        so there an unknown due to incomplete quantifiers counts as 
+        consistent: E-matching found no contradiction. reason defaults 
+        to the reason for the last unknown answer.
+        '''
+        if str(result) == 'sat':
+            return True
+        if str(result) != 'unknown' or self.mbqi:
+            return False
+        if reason is None:
+            reason = self.lastReason
+        return reason == "(incomplete quantifiers)"
+    
+    def register(self, expr):
+        '''
+        Registers what expr mentions before it is checked or asserted.
+        With relevance, loads the axioms its symbols make relevant. 
+        In ground mode, registers its points, lines and circles and adds 
+        the axiom instances that mention them.
+        '''
+        expr = self.local(expr)
+        if self.unloaded is not None:
+            self.loadRelevant(self.language.familiesOf(self.language.symbolsOf(expr)))
+        if self.grounder is not None:
+            for const in constants(expr):
+                instances = self.grounder.register(const)
+                if instances:
+                    self.solver.add(instances)
+                    self.models = []
+    
+    def satisfied(self, expr):
+        '''
+        Returns True if expr holds in one of the kept models or sampled
+        configurations, which are models of the axioms and facts of this
+        proof, so that expr is consistent with them.
+        '''
+        local = self.local(expr)
+        for model in self.models:
+            if is_true(model.eval(local, model_completion=True)):
+                self.counters["modelHits"] += 1
+                self.lastResult, self.lastReason = sat, None
+                return True
+        if self.sampler is not None and self.sampler.witnesses(local):
+            self.counters["sampleHits"] += 1
+            self.lastResult, self.lastReason = sat, None
+            return True
+        return False
+    
+    def loadRelevant(self, families):
+        '''
+        Marks families as used and loads the axioms that became relevant.
+        '''
+        if families <= self.families:
+            return
+        self.families.update(families)
+        relevant = [entry for entry in self.unloaded if entry[1] <= self.families]
+        if len(relevant) == 0:
+            return
+        self.unloaded = [entry for entry in self.unloaded if not entry[1] <= self.families]
+        axioms = [axiom for axiom, _, _ in relevant]
+        self.groups.update(group for _, _, group in relevant)
+        self.models = []
+        if self.grounder is not None:
+            self.solver.add(self.grounder.addAxioms(axioms))
+        else:
+            self.solver.add(axioms)
+    
+    def push(self):
+        self.scopes.append(len(self.instances))
+        self.solver.push()
+    
+    def pop(self):
+        '''
+        Pops a solver scope, keeping the ground instances found in it.
+        '''
+        self.solver.pop()
+        found = self.instances[self.scopes.pop():]
+        if len(found) > 0:
+            self.solver.add(found)
+    
+    def fail(self, step, expr, message):
+        '''
+        Reports a step that did not check and records it in failures.
+        If the last check was undecided, the step is recorded in undecided.
+        '''
+        reason = None
+        if str(self.lastResult) == 'unknown':
+            reason = self.lastReason
+            message = "Undecided (" + str(reason) + ") : " + str(expr)
+            self.undecided.append((step, expr, reason))
+        print ("ProofCheck >> " + message)
+        self.failures.append((step, expr))
+        self.stepFailures.append(reason)
+    
+    def refail(self, step, expr, message, reason):
+        '''
+        Reports a failure replayed from a previous run, undecided for 
+        reason as it was there, or a plain failure if reason is None.
+        '''
+        self.lastResult = unknown if reason is not None else None
+        self.lastReason = reason
+        self.fail(step, expr, message)
+    
+    def core(self):
+        '''
+        Returns the facts in the unsat core of the last check.
+        '''
+        return [self.factOf[key] for key in self.lastCore if key in self.factOf]
+    
+    def cached(self, kind, queries):
+        '''
+        Looks up the answer to a kind of check of queries in the query 
+        cache. Returns the cache key and the cached entry or None.
+        '''
+        if self.queryCache is None:
+            return None, None
+        mode = [kind, "ground" if self.grounder is not None else "quantified", 
+                "mbqi" if self.mbqi else "nombqi"] + sorted(self.groups)
+        key = self.queryCache.key(self.language.axiomKey, self.contextTexts, 
+            "\n".join(self.local(query).sexpr() for query in queries), ",".join(mode))
+        entry = self.queryCache.get(key)
+        if entry is not None:
+            self.lastResult, self.lastReason = entry["result"], entry.get("reason")
+            self.lastCore = []
+        return key, entry
+    
+    def settled(self, result, reason):
+        '''
+        Returns True if result is an answer z3 would give again without
+        resource limits: sat, unsat, or unknown for incomplete quantifiers.
+        Answers cut short by a timeout, rlimit or interrupt are not.
+        '''
+        return str(result) in ('sat', 'unsat') or \
+            (str(result) == 'unknown' and reason == "(incomplete quantifiers)")
+    
+    def store(self, key, result, core=None):
+        '''
+        Stores the result of the last check and the facts of its core
+        in the query cache under key, if it is settled.
+        '''
+        if key is None:
+            return
+        reason = self.lastReason if str(result) == 'unknown' else None
+        if not self.settled(result, reason):
+            return
+        if core is not None:
+            core = [self.local(fact).sexpr() for fact in core]
+        self.queryCache.put(key, result, reason, core)
+    
+    def entails(self, expr):
+        '''
+        Checks if expression is entailed by facts and axioms, that is, 
+        if Not(expr) is unsatisfiable under the tracked facts.
+        Returns the list of facts in the unsat core if so, None otherwise.
+        '''
+        self.register(expr)
+        if self.satisfied(Not(expr)):
+            return None
+        key, entry = self.cached("entails", [expr])
+        if entry is not None:
+            if entry["result"] != 'unsat':
+                return None
+            return [self.contextTexts[text] for text in entry.get("core", []) if text in self.contextTexts]
+        goal = FreshBool("goal", self.context)
+        self.push()
+        self.solver.add(Implies(goal, Not(self.local(expr))))
+        result = self.check(goal)
+        core = self.core() if str(result) == 'unsat' else None
+        self.store(key, result, core)
+        self.pop()
+        return core
+    
     def hence(self, expr):
         '''
         Checks if expression follows from facts and axioms.
-        if so, the expression is made explicit
+        if so, the expression is made explicit.
+        
+        In entailment mode the expression must be entailed, and the
+        facts it depended on are recorded in justifications. Otherwise
+        it is enough for the expression to be consistent with the facts.
+        
+        With a closure, expressions in the closure are accepted without
+        a solver call. Outside entailment mode, expressions whose negation
+        is in the closure are rejected without one.
+        
+        With a previous run, the step is replayed from it if it can be
+        reused (see replayed).
         '''
-        self.solver.push()
-        self.solver.add(expr)
-        result = self.solver.check()
-        if str(result) != 'sat':
-            print ("ProofCheck >> Does not follow : " + str(expr))
-            self.solver.pop()
+        self.lastResult = None
+        self.stepFailures = []
+        self.label = "hence " + str(expr)
+        signature = "hence " + self.local(expr).sexpr()
+        entry = self.replayed(signature)
+        if entry is not None:
+            self.register(expr)
+            mode, texts = entry["basis"]
+            if not entry["ok"]:
+                self.refail("hence", expr, "Does not follow : " + str(expr), (entry["undecided"] or [None])[0])
+            else:
+                if self.entailment:
+                    self.justifications.append((expr, [self.contextTexts[text] for text in texts]))
+                self.record(self.conclusions, expr)
+            self.log("hence", signature, entry["ok"], 
+                (mode, [self.contextTexts[text] for text in texts]) if mode == "core" else (mode, texts))
+            return entry["ok"]
+        
+        context = frozenset(self.contextTexts)
+        self.basis = None
+        ok = self.conclude(expr)
+        self.log("hence", signature, ok, ("facts", context) if self.basis is None else ("core", self.basis))
+        return ok
+    
+    def conclude(self, expr):
+        '''
+        Checks expr for hence, see there. Sets basis to the facts an
+        accepted expr depended on, when known.
+        '''
+        known = None
+        if self.closure is not None:
+            self.register(expr)
+            known = self.closure.lookup(expr)
+        if known is True:
+            self.basis = self.closure.support(expr)
+            if self.entailment:
+                self.justifications.append((expr, self.basis))
+        elif known is False and not self.entailment:
+            ## the facts entail the negation, so expr is inconsistent with them
+            self.fail("hence", expr, "Does not follow : " + str(expr))
             return False
+        elif self.entailment:
+            core = self.entails(expr)
+            if core is None:
+                self.fail("hence", expr, "Does not follow : " + str(expr))
+                return False
+            self.basis = core
+            self.justifications.append((expr, core))
+        else:
+            self.register(expr)
+            if self.satisfied(expr):
+                result, reason = sat, None
+            else:
+                key, entry = self.cached("consistent", [expr])
+                if entry is not None:
+                    result, reason = entry["result"], entry.get("reason")
+                else:
+                    guard = FreshBool("hence", self.context)
+                    self.push()
+                    self.solver.add(Implies(guard, self.local(expr)))
+                    result = self.check(guard)
+                    reason = self.lastReason
+                    self.store(key, result)
+                    self.pop()
+            if not self.consistent(result, reason):
+                self.fail("hence", expr, "Does not follow : " + str(expr))
+                return False
         
-        self.conclusions.append(expr)
-        self.solver.pop()
-        self.solver.add(expr)
-        return True         
+        self.record(self.conclusions, expr)
+        return True
+
+    def hence_many(self, exprs):
+        '''
+        Checks a batch of expressions against the same facts in a single
+        solver scope. Each expression is guarded by an assumption literal
+        and answered by a check under that literal, so the scope is built
+        once and learned clauses stay warm across the batch.
+
+        Returns a list with one True/False per expression. The expressions
+        that follow are made explicit, as with hence, provided they are
+        also consistent with each other; if they are not, none is made
+        explicit and all of them are reported as failed.
+        '''
+        exprs = list(exprs)
+        self.lastResult = None
+        self.stepFailures = []
+        for expr in exprs:
+            self.register(expr)
+        context = frozenset(self.contextTexts)
+        guards = [FreshBool("hence", self.context) for _ in exprs]
+        self.push()
+        for guard, expr in zip(guards, exprs):
+            if self.entailment:
+                self.solver.add(Implies(guard, Not(self.local(expr))))
+            else:
+                self.solver.add(Implies(guard, self.local(expr)))
+
+        results = []
+        cores = []
+        for guard, expr in zip(guards, exprs):
+            self.label = "hence " + str(expr)
+            result = self.check(guard)
+            if self.entailment:
+                ok = str(result) == 'unsat'
+                cores.append(self.core() if ok else None)
+            else:
+                ok = self.consistent(result)
+            if not ok:
+                self.fail("hence", expr, "Does not follow : " + str(expr))
+            results.append(ok)
+
+        accepted = [guard for guard, ok in zip(guards, results) if ok]
+        self.label = "hence_many"
+        ## entailed expressions are always jointly consistent with the facts
+        if not self.entailment and len(accepted) > 1 and \
+                not self.consistent(self.check(*accepted)):
+            for index, expr in enumerate(exprs):
+                if results[index]:
+                    self.fail("hence", expr, "Not jointly consistent with the batch : " + str(expr))
+                    results[index] = False
+            accepted = []
+        self.pop()
+
+        for index, expr in enumerate(exprs):
+            if results[index]:
+                if self.entailment:
+                    self.justifications.append((expr, cores[index]))
+                self.record(self.conclusions, expr)
+        ## batches are always checked again, but take part in the
+        ## dependencies of later steps
+        self.log("hence_many", None, len(accepted) == len(exprs), ("facts", context))
+        return results        
         
     def construct(self, obj):
         '''
         Takes in a ConstructableObject with preconditions
         and postconditions. Checks that preconditions hold
         in the proof context and if so, asserts the post-conditions.
+        
+        All preconditions are checked at once, each assumed through its
+        guard literal. If they cannot be met, the ones in the unsat core
+        are reported and kept in lastFailure. Otherwise the same guards
+        make the preconditions facts of the proof, so nothing is asserted
+        twice.
+        
+        With a previous run, the step is replayed from it if it can be
+        reused (see replayed).
         '''
-        self.solver.push()
-        for prereq in obj.prereqs:
-            self.solver.add(simplify(prereq, blast_distinct = True))
-            prereqCheck = self.solver.check()
-            if str(prereqCheck) != 'sat':
-                print ("ProofCheck >> Construction Failed - Could not meet: " + str(prereq)) 
-                self.solver.pop()
-                return False
-            
-        if len(obj.prereqs) > 0:
-            self.assumptions.extend(obj.prereqs)
+        self.lastResult = None
+        self.stepFailures = []
+        self.label = "construct " + obj.label
+        signature = "construct " + obj.label + " " + \
+            " ".join(self.local(expr).sexpr() for expr in obj.prereqs + obj.conclusions)
+        for expr in [obj.z3Expr] + obj.prereqs + obj.conclusions:
+            self.register(expr)
+        entry = self.replayed(signature)
+        if entry is not None:
+            failed = [obj.prereqs[index] for index in entry["failed"]]
+            for prereq, reason in zip(failed, entry["undecided"]):
+                self.refail("construct", prereq, "Construction Failed - Could not meet: " + str(prereq), reason)
+            mode, texts = entry["basis"]
+            self.log("construct", signature, entry["ok"], 
+                (mode, [self.contextTexts[text] for text in texts]) if mode == "core" else (mode, texts),
+                entry["failed"])
+        else:
+            context = frozenset(self.contextTexts)
+            if self.entailedPrereqs:
+                failed = [prereq for prereq in obj.prereqs if self.entails(prereq) is None]
+            else:
+                failed = self.unmet(obj.prereqs)
+            if len(obj.prereqs) == 0:
+                basis = ("core", [])
+            elif self.entailedPrereqs:
+                basis = ("facts", context)
+            elif failed and str(self.lastResult) == 'unsat' and self.lastCore:
+                basis = ("core", [fact for fact in self.core() if self.known(fact)])
+            else:
+                basis = ("facts", context)
+            for prereq in failed:
+                self.fail("construct", prereq, "Construction Failed - Could not meet: " + str(prereq))
+            self.log("construct", signature, not failed, basis,
+                [index for index, prereq in enumerate(obj.prereqs) if any(prereq is other for other in failed)])
+        self.lastFailure = failed or None
+        if failed:
+            return False
             
+        for prereq in obj.prereqs:
+            self.record(self.assumptions, prereq)
         for conclusion in obj.conclusions:
-            self.solver.add(simplify(conclusion, blast_distinct=True))
-            self.conclusions.append(conclusion)
-        
+            self.record(self.conclusions, conclusion)
+        self.keep(obj)
+        return True
+    
+    def keep(self, obj, facts=()):
+        '''
+        Adds a constructed object to the points, lines or circles, and
+        places it in the sampled configurations by its conclusions and
+        facts, further facts about it such as the conclusions of a lemma.
+        '''
+        if self.sampler is not None:
+            if facts:
+                obj = copy.copy(obj)
+                obj.conclusions = obj.conclusions + list(facts)
+            self.sampler.realize(obj)
         if isinstance(obj, Point):
             self.points[obj.label] = obj
         elif isinstance(obj, Line):
             self.lines[obj.label] = obj
         elif isinstance(obj, Circle):
             self.circles[obj.label] = obj
+    
             
-        self.solver.pop()
-        self.solver.add(obj.prereqs)
-        self.solver.add(obj.conclusions)
+    
+    def apply(self, theorem, objects):
+        '''
+        Applies a proved theorem as a lemma. objects are the objects of 
+        this proof that take the place of the theorem's assumed objects, 
+        followed by new objects for its desired objects. If the instances
+        of its assumed properties are entailed, the new objects are 
+        constructed and the instances of its conclusions asserted, without
+        deriving them from the axioms again.
+        '''
+        self.lastResult = None
+        self.stepFailures = []
+        self.label = "apply " + str(theorem.name)
+        if not theorem.prove():
+            self.fail("apply", theorem.name, "Theorem not proved : " + str(theorem.name))
+            return False
+        assumed = objects[:len(theorem.assumedObjects)]
+        for index, obj in enumerate(objects[len(theorem.assumedObjects):]):
+            ## the conclusions of the theorem hold for some new objects, so 
+            ## they cannot be asserted of objects that are already constrained
+            earlier = assumed + objects[len(theorem.assumedObjects):len(theorem.assumedObjects) + index]
+            if obj.label in self.points or obj.label in self.lines or obj.label in self.circles or \
+                    any(obj.z3Expr.eq(other.z3Expr) for other in earlier) or obj.prereqs or \
+                    any(not is_distinct(conclusion) or conclusion.num_args() > 1 for conclusion in obj.conclusions):
+                self.fail("apply", obj.z3Expr, "Lemma needs a new object : " + obj.label)
+                return False
+        properties, conclusions = theorem.instantiate(objects)
+        support = []
+        for prop in properties:
+            core = self.entails(prop)
+            if core is None:
+                self.fail("apply", prop, "Lemma does not apply - Could not meet: " + str(prop))
+                return False
+            support.extend(core)
+        
+        for obj in objects[len(theorem.assumedObjects):]:
+            for conclusion in obj.conclusions:
+                self.register(conclusion)
+                self.record(self.conclusions, conclusion)
+            self.keep(obj, conclusions)
+        for conclusion in conclusions:
+            self.register(conclusion)
+            if self.entailment:
+                self.justifications.append((conclusion, [theorem] + support))
+            self.record(self.conclusions, conclusion)
+        ## lemma applications are always checked again, but take part in
+        ## the dependencies of later steps
+        self.log("apply", None, True, ("core", support))
         return True
     
-            
+    async def hence_async(self, expr):
+        '''
+        hence, checked on the executor of async steps (see setAsyncLimit)
+        so the event loop is not blocked. Cancelling the step interrupts 
+        the solver; a step interrupted that way leaves no trace.
+        '''
+        return await self.runAsync(self.hence, self.local(expr))
+    
+    async def construct_async(self, obj):
+        '''
+        construct, checked on the executor of async steps. See hence_async.
+        '''
+        ## work on a copy in this proof's context, so the executor thread 
+        ## does not use z3's main context
+        local = copy.copy(obj)
+        local.prereqs = [self.local(prereq) for prereq in obj.prereqs]
+        local.conclusions = [self.local(conclusion) for conclusion in obj.conclusions]
+        local.z3Expr = self.local(obj.z3Expr)
+        return await self.runAsync(self.construct, local)
+    
+    async def runAsync(self, step, *args):
+        '''
+        Runs step, a method of this proof, on the executor once a slot is 
+        free. Steps of one proof run one at a time, in order.
+        '''
+        executor, slots = asyncResources()
+        loop = asyncio.get_running_loop()
+        if loop not in self.asyncLocks:
+            self.asyncLocks[loop] = asyncio.Lock()
+        async with self.asyncLocks[loop]:
+            async with slots:
+                failures, undecided, history = len(self.failures), len(self.undecided), len(self.history)
+                future = asyncio.get_running_loop().run_in_executor(executor, step, *args)
+                try:
+                    return await asyncio.shield(future)
+                except asyncio.CancelledError:
+                    self.context.interrupt()
+                    ## the proof must not be used again before the step stops
+                    await asyncio.wait([future])
+                    if self.lastReason in ("interrupted", "canceled"):
+                        del self.failures[failures:]
+                        del self.undecided[undecided:]
+                        del self.history[history:]
+                    raise
+    
+    def unmet(self, prereqs):
+        '''
+        Checks prereqs against the facts of the proof in a single check.
+        Returns the prereqs that cannot be met, an empty list if all can.
+        '''
+        if len(prereqs) == 0:
+            return []
+        key, entry = self.cached("construct", prereqs)
+        if entry is not None:
+            if self.consistent(entry["result"], entry.get("reason")):
+                return []
+            return [prereq for prereq in prereqs if self.local(prereq).sexpr() in entry.get("core", [])] \
+                or list(prereqs)
+        
+        guards = [self.guard(prereq) for prereq in prereqs]
+        result = self.check(*guards)
+        if self.consistent(result):
+            self.store(key, result)
+            return []
+        failed = []
+        if str(result) == 'unsat':
+            core = set(self.lastCore)
+            failed = [prereq for prereq, guard in zip(prereqs, guards) if guard.get_id() in core]
+        ## without a core to blame, e.g. on a timeout, no prerequisite is known to hold
+        failed = failed or list(prereqs)
+        self.store(key, result, failed)
+        return failed
     
     def status(self):
         '''
@@ -578,25 +1777,173 @@ class Proof(object):
         return self.status()   
     
 
+class FactSet(object):
+    '''
+    An insertion ordered set of facts. Facts are z3 expressions, which
+    are not hashable by value, so each is kept under the SMT-LIB text of
+    its canonical form (see canonicalize): a fact stated twice, or in a
+    symmetric orientation, is kept once, in any z3 context. Membership
+    tests take an expression.
+    '''
+    __slots__ = ("keys", "facts")
+    
+    def __init__(self):
+        self.keys = set()
+        self.facts = []
+    
+    def key(self, fact):
+        return canonicalize(fact).sexpr()
+    
+    def add(self, fact):
+        '''
+        Adds fact. Returns False if it was already present.
+        '''
+        key = self.key(fact)
+        if key in self.keys:
+            return False
+        self.keys.add(key)
+        self.facts.append(fact)
+        return True
+    
+    def __contains__(self, fact):
+        return is_expr(fact) and self.key(fact) in self.keys
+    
+    def __iter__(self):
+        return iter(self.facts)
+    
+    def __len__(self):
+        return len(self.facts)
+    
+    def __getitem__(self, index):
+        return self.facts[index]
+    
+    def __str__(self):
+        return str(self.facts)
+    
+    __repr__ = __str__
+
+
 class Theorem(object):
     '''
         This is a theorem in the language E.
+        
+        For all assumedObjects satisfying the assumedProperties there are
+        desiredObjects such that the desiredConclusions hold. proof is a
+        function that takes a Proof in which the assumed objects are 
+        constructed and the assumed properties assumed, and constructs the
+        desired objects from them; without one the conclusions must follow
+        directly.
+        
+        Theorems form a DAG: uses lists the theorems whose proofs a proof 
+        applies as lemmas (see Proof.apply). A theorem is proved once, 
+        after the theorems it uses, and its status is kept in verified 
+        under a key of its statement, its proof and the keys of the 
+        theorems it uses. With a QueryCache the status is also kept on disk.
     '''
-    ## TODO: overhaul this entire class. 
-    ## it should work like a MultiplyLinkedList, one theorem is a justification
-    ## for others. This is where non-linear deduction gets support
-    def __init__(self):
-        self.assumedObjects = []
-        self.assumedProperties = []
-        self.desiredObjects = []
-        self.desiredConclusions = []
+    ## key of a theorem -> whether it was proved
+    verified = dict()
     
+    def __init__(self, name=None, assumedObjects=None, assumedProperties=None, 
+                 desiredObjects=None, desiredConclusions=None, proof=None, uses=None):
+        self.name = name
+        self.assumedObjects = assumedObjects or []
+        self.assumedProperties = assumedProperties or []
+        self.desiredObjects = desiredObjects or []
+        self.desiredConclusions = desiredConclusions or []
+        self.proof = proof
+        self.uses = uses or []
+        ## the Proof of the last call to prove that checked this theorem
+        self.checked = None
     
     def proclusTerm(self):
         if len(self.desiredObjects) == 0:
             return "Proclus Theorem"
         return "Proclus Problem"
     
+    def key(self):
+        '''
+        Returns a hash of the statement and proof of this theorem, the
+        theorems it uses and the axiom set.
+        '''
+        digest = hashlib.sha256()
+        parts = [str(getLanguage().axiomKey), str(self.name)]
+        parts += [obj.z3Expr.sexpr() for obj in self.assumedObjects + self.desiredObjects]
+        parts += [expr.sexpr() for expr in self.assumedProperties + self.desiredConclusions]
+        if self.proof is not None:
+            try:
+                parts.append(inspect.getsource(self.proof))
+            except (IOError, TypeError):
+                parts.append(repr(self.proof))
+        parts += [theorem.key() for theorem in self.uses]
+        for part in parts:
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+    
+    def prove(self, queryCache=None, **options):
+        '''
+        Checks this theorem in an entailment mode Proof made with options,
+        after the theorems it uses. Returns True if it holds. Theorems
+        already proved are not checked again. The prerequisites of the
+        constructions of the proof must be entailed (see entailedPrereqs),
+        since apply only checks the hypotheses.
+        '''
+        key = self.key()
+        if key in Theorem.verified:
+            return Theorem.verified[key]
+        if queryCache is not None:
+            entry = queryCache.get(key)
+            if entry is not None:
+                Theorem.verified[key] = entry["result"] == "proved"
+                return Theorem.verified[key]
+        
+        proved = all(theorem.prove(queryCache, **options) for theorem in self.uses)
+        if proved:
+            options["entailment"] = True
+            with Proof(queryCache=queryCache, **options) as pc:
+                for obj in self.assumedObjects:
+                    pc.construct(obj)
+                for prop in self.assumedProperties:
+                    pc.assume(prop)
+                ## the proof may only construct what the hypotheses allow
+                pc.entailedPrereqs = True
+                if self.proof is not None:
+                    self.proof(pc)
+                for obj in self.desiredObjects:
+                    if obj.label not in pc.points and obj.label not in pc.lines and obj.label not in pc.circles:
+                        pc.fail("theorem", obj.z3Expr, "Not constructed : " + obj.label)
+                for conclusion in self.desiredConclusions:
+                    pc.hence(conclusion)
+                proved = len(pc.failures) == 0
+            self.checked = pc
+            if pc.undecided:
+                ## may be proved with more time, so it is not remembered
+                return False
+        Theorem.verified[key] = proved
+        if queryCache is not None:
+            queryCache.put(key, "proved" if proved else "failed")
+        return proved
+    
+    def instantiate(self, objects):
+        '''
+        Returns the hypotheses and desired conclusions of this theorem for
+        objects, the objects of the proof it is applied in that take the 
+        place of the assumed and then the desired objects. The hypotheses
+        are the prerequisites and conclusions of the assumed objects and
+        the assumed properties.
+        '''
+        variables = self.assumedObjects + self.desiredObjects
+        if len(objects) != len(variables):
+            raise ValueError(str(self.name) + " takes " + str(len(variables)) + " objects")
+        pairs = [(variable.z3Expr, obj.z3Expr) for variable, obj in zip(variables, objects)]
+        ## the constructions of the assumed objects are hypotheses too
+        hypotheses = [expr for obj in self.assumedObjects for expr in obj.prereqs + obj.conclusions]
+        return [substitute(prop, *pairs) for prop in hypotheses + self.assumedProperties], \
+               [substitute(conclusion, *pairs) for conclusion in self.desiredConclusions]
+    
+    def __repr__(self):
+        return "Theorem " + str(self.name)
+    
     def __str__(self):
         return str(self.assumedObjects) + ", "\
              + str(self.assumedProperties) + \
@@ -604,53 +1951,77 @@ class Theorem(object):
              ", " + str(self.desiredConclusions)
     
     
-## TODO: create AbstractConstructableObject class to provide Template methods
-## for Point, Line, Circle
-class Point(object):
-    
+class ConstructableObject(abc.ABC):
     '''
-    This class represents a Point in a euclidean proof.
-    It is a wrapper for the PointSort and the various
-    functions operating on it, as defined in 
-    LanguageE.
+    Base class of the objects a proof constructs: Point, Line and Circle.
+    An object is a z3 constant of its sort, along with the prerequisites
+    its construction must meet and the conclusions it establishes.
     
-    Once all desired properties are applied to this Point
-    you can call this Point's construct method. 
+    Objects hash by the id of their z3 constant, so they can be kept in 
+    sets and dicts, and use slots to stay small in large diagrams.
     '''
+    __slots__ = ("label", "isDistinct", "prereqs", "conclusions", "z3Expr")
     
     def __init__(self, label, isDistinct=True):
-        '''
-        Point constructor. Label should be 1 or so characters with
-        no spaces, e.g. 'p' . You can construct multiple points
-        with the same constraints but different labels if the
-        label has the for 'p q r' . 
-        
-        For example, Point('p q r') represents 3 distinct points
-        '''
         self.label = label
         self.isDistinct = isDistinct  
         self.prereqs = []
         self.conclusions = []
-        self.z3Expr = Const(label, language.PointSort)
+        self.z3Expr = Const(label, self.sort())
         if self.isDistinct:
             self.conclusions.append(Distinct(self.z3Expr))
     
+    @abc.abstractmethod
+    def sort(self):
+        '''
+        Returns the z3 sort of this kind of object.
+        '''
+    
     def __eq__(self, other):
         '''
         returns the equality of the z3 expressions representing
         the objects being compared
         '''
-        if not isinstance(other, Point):
+        if not isinstance(other, self.__class__):
             return False
         return self.z3Expr == other.z3Expr
     
-    
-    
+    def __hash__(self):
+        return hash(self.z3Expr.get_id())
     
     def __str__(self, *args, **kwargs):
-        return "|Point [" + str(self.z3Expr) + "] :\n" +\
+        return "|" + self.__class__.__name__ + " [" + str(self.z3Expr) + "] :\n" +\
                 "|   prereq: " + str(self.prereqs) + "\n" + \
                 "|   concls: " + str(self.conclusions) + "\n"
+
+
+class Point(ConstructableObject):
+    
+    '''
+    This class represents a Point in a euclidean proof.
+    It is a wrapper for the PointSort and the various
+    functions operating on it, as defined in 
+    LanguageE.
+    
+    Once all desired properties are applied to this Point
+    you can call this Point's construct method. 
+    '''
+    
+    __slots__ = ()
+    
+    def __init__(self, label, isDistinct=True):
+        '''
+        Point constructor. Label should be 1 or so characters with
+        no spaces, e.g. 'p' . You can construct multiple points
+        with the same constraints but different labels if the
+        label has the for 'p q r' . 
+        
+        For example, Point('p q r') represents 3 distinct points
+        '''
+        ConstructableObject.__init__(self, label, isDistinct)
+    
+    def sort(self):
+        return language.PointSort
     
     def onLine(self, line):
         '''
@@ -731,29 +2102,15 @@ class Point(object):
         
 
 
-class Line(object):
+class Line(ConstructableObject):
     
     '''
     Line constructor. 
     '''
-    def __init__(self, label, isDistinct=True):
-        self.label = label
-        self.isDistinct = isDistinct  
-        self.prereqs = []
-        self.conclusions = []
-        self.z3Expr = Const(label, language.LineSort)
-        if self.isDistinct:
-            self.conclusions.append(Distinct(self.z3Expr))
+    __slots__ = ()
     
-    def __eq__(self, other):
-        if not isinstance(other, Line):
-            return False
-        return self.z3Expr == other.z3Expr
-       
-    def __str__(self, *args, **kwargs):
-        return "|Line [" + str(self.z3Expr) + "] :\n" +\
-                "|   prereq: " + str(self.prereqs) + "\n" + \
-                "|   concls: " + str(self.conclusions) + "\n"
+    def sort(self):
+        return language.LineSort
 
     
     def through(self, point1, point2):
@@ -770,29 +2127,15 @@ class Line(object):
     
     
 
-class Circle(object):
+class Circle(ConstructableObject):
     
     '''
     Circle constructor. 
     '''
-    def __init__(self, label, isDistinct=True):
-        self.label = label
-        self.isDistinct = isDistinct  
-        self.prereqs = []
-        self.conclusions = []
-        self.z3Expr = Const(label, language.CircleSort)
-        if self.isDistinct:
-            self.conclusions.append(Distinct(self.z3Expr))
+    __slots__ = ()
     
-    def __eq__(self, other):
-        if not isinstance(other, Circle):
-            return False
-        return self.z3Expr == other.z3Expr
-    
-    def __str__(self, *args, **kwargs):
-        return "|Circle [" + str(self.z3Expr) + "] :\n" +\
-                "|   prereq: " + str(self.prereqs) + "\n" + \
-                "|   concls: " + str(self.conclusions) + "\n"
+    def sort(self):
+        return language.CircleSort
     
     
     def centerThrough(self, point1, point2):
@@ -811,5 +2154,90 @@ class Circle(object):
 
 yesNoFromSolverCheck = lambda x: 'yes' if x == 'sat' else 'no' 
 boolFromSolverCheck = lambda x: True if x == 'sat' else False       
-language = LanguageE()
-solver = language.solver
+
+
+_language = None
+_languageLock = threading.Lock()
+
+## Points, Lines, Circles and the shared language live in z3's main context,
+## which is not thread safe. Proofs only read from it under this lock.
+mainContextLock = threading.RLock()
+
+## the SolverPool proofs check solvers out of unless given one
+_defaultPool = None
+
+def setDefaultPool(pool):
+    '''
+    Sets the SolverPool that proofs take a warm solver from when it fits
+    their options, None for none.
+    '''
+    global _defaultPool
+    _defaultPool = pool
+
+def defaultPool():
+    '''
+    Returns the SolverPool set by setDefaultPool, or None.
+    '''
+    return _defaultPool
+
+## the threads the async steps of every proof of this process are checked
+## on, and how many of them may run at once
+_asyncExecutor = None
+## event loop -> its semaphore, as asyncio primitives belong to one loop
+_asyncSlots = weakref.WeakKeyDictionary()
+asyncLimit = os.cpu_count() or 4
+
+def setAsyncLimit(limit):
+    '''
+    Sets how many async proof steps may be checked at once. Takes effect
+    for the steps started afterwards.
+    '''
+    global asyncLimit, _asyncExecutor, _asyncSlots
+    asyncLimit = limit
+    _asyncExecutor = None
+    _asyncSlots = weakref.WeakKeyDictionary()
+
+def asyncResources():
+    '''
+    Returns the executor and the semaphore bounding the async steps of
+    the running event loop. Must be called from a coroutine.
+    '''
+    global _asyncExecutor
+    if _asyncExecutor is None:
+        _asyncExecutor = concurrent.futures.ThreadPoolExecutor(max_workers=asyncLimit,
+            thread_name_prefix="EuclidZ3")
+    loop = asyncio.get_running_loop()
+    if loop not in _asyncSlots:
+        _asyncSlots[loop] = asyncio.Semaphore(asyncLimit)
+    return _asyncExecutor, _asyncSlots[loop]
+
+def getLanguage():
+    '''
+    Returns the shared LanguageE, building it on first use.
+    Set EUCLIDZ3_CHECK_AXIOMS=1 to check the axiom set when it is built.
+    '''
+    global _language
+    with _languageLock:
+        if _language is None:
+            checkAxioms = os.environ.get("EUCLIDZ3_CHECK_AXIOMS", "") not in ("", "0")
+            _language = LanguageE(checkAxioms=checkAxioms)
+    return _language
+
+
+class LazyLanguage(object):
+    '''
+    Stands in for the shared LanguageE so importing this module
+    does not build the axioms. The language is built the first time
+    one of its attributes is used.
+    '''
+    def __getattr__(self, name):
+        return getattr(getLanguage(), name)
+
+
+language = LazyLanguage()
+
+def __getattr__(name):
+    ## module level solver is built lazily along with the language
+    if name == "solver":
+        return getLanguage().solver
+    raise AttributeError("module " + repr(__name__) + " has no attribute " + repr(name))
@@ -0,0 +1,362 @@
+'''
+Proof checking daemon.
+
+Keeps proofs open in a long running process, so editors and CI hooks can
+check steps without starting an interpreter and building the language
+for every request.
+
+    python -m EuclidZ3.daemon [--socket PATH | --port PORT] [--idle SECONDS] [--jobs N]
+
+The daemon speaks JSON-RPC 2.0, one JSON object per line, over a Unix
+socket or a localhost TCP port. Steps are lines of the proof script
+language (see script.py). The methods are
+
+    open      {"options": {"entailment": true, ...}}  -> {"session": id}
+    construct {"session": id, "step": "let c be a point, between a b"}
+    assume    {"session": id, "formula": "on a L"}
+    hence     {"session": id, "formula": "sameside c d L"}
+    undo      {"session": id, "steps": 1}
+    status    {"session": id}
+    close     {"session": id}
+
+construct, assume and hence answer {"ok": bool, "failures": [...]} with
+the failures of that step. undo drops the last steps and checks the rest
+again, reusing the earlier results of every step the undone ones did not
+affect (see Proof.history), so it costs little solver time.
+
+Requests may be pipelined: the daemon reads the next request before the
+previous one is answered. The steps of a session are checked in the
+order they arrive, those of different sessions concurrently, and
+answers carry the id of their request. Sessions idle for longer than
+--idle seconds are closed.
+'''
+from EuclidZ3.core import Proof, getLanguage, setAsyncLimit
+from EuclidZ3 import script
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import socket
+import stat
+import sys
+import time
+
+
+## the Proof options a session may set
+OPTIONS = ("entailment", "ground", "closure", "relevance", "mbqi", "timeout", "rlimit", "samples")
+
+## JSON-RPC error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+
+class RequestError(Exception):
+    def __init__(self, code, message):
+        Exception.__init__(self, message)
+        self.code = code
+
+
+class Session(object):
+    '''
+    A proof open in the daemon, with the steps checked in it so far.
+    '''
+
+    def __init__(self, identifier, options):
+        self.identifier = identifier
+        self.options = options
+        self.proof = Proof(**options)
+        self.parser = script.ScriptParser()
+        self.parser.options = options
+        self.lines = []
+        self.lock = asyncio.Lock()
+        self.lastUsed = time.time()
+
+    async def step(self, line):
+        '''
+        Parses the script line and checks its steps. Returns whether they
+        all checked and the failures they caused.
+        '''
+        steps = list(self.parser.steps([line]))
+        failures = len(self.proof.failures)
+        ok = True
+        for step in steps:
+            if step.kind == "construct":
+                ok = await self.proof.construct_async(step.value) and ok
+            elif step.kind == "assume":
+                self.proof.assume(step.value)
+            else:
+                ok = await self.proof.hence_async(step.value) and ok
+        self.lines.append(line)
+        return {"ok": ok, "failures": [kind + " " + str(expr) for kind, expr in self.proof.failures[failures:]]}
+
+    async def undo(self, count):
+        '''
+        Drops the last count steps, checking the others again in a new
+        proof that reuses the results of the current one.
+        '''
+        lines = self.lines[:max(0, len(self.lines) - count)]
+        previous, parser, checked = self.proof, self.parser, self.lines
+        self.proof = Proof(previous=previous, **self.options)
+        self.parser = script.ScriptParser()
+        self.parser.options = self.options
+        self.lines = []
+        try:
+            for line in lines:
+                await self.step(line)
+        except BaseException:
+            ## keep the session as it was before the undo
+            self.proof.close()
+            self.proof, self.parser, self.lines = previous, parser, checked
+            raise
+        previous.close()
+        return {"steps": len(self.lines), "reused": self.proof.reused, "failures": len(self.proof.failures)}
+
+    def status(self):
+        proof = self.proof
+        return {"session": self.identifier, "steps": self.lines,
+                "points": sorted(proof.points), "lines": sorted(proof.lines), "circles": sorted(proof.circles),
+                "failures": [kind + " " + str(expr) for kind, expr in proof.failures],
+                "undecided": len(proof.undecided), "stats": proof.stats()["totals"]}
+
+
+class Daemon(object):
+    '''
+    Serves the JSON-RPC methods over the connections it is given.
+    '''
+
+    def __init__(self, idle=600):
+        self.idle = idle
+        self.sessions = dict()
+        self.identifiers = itertools.count(1)
+
+    async def connection(self, reader, writer):
+        '''
+        Answers the requests of one connection. Every request is handled
+        in its own task, so a slow step does not hold up the next request.
+        '''
+        writing = asyncio.Lock()
+        pending = set()
+
+        async def answer(line):
+            response = await self.handle(line)
+            if response is None:
+                return
+            async with writing:
+                writer.write((json.dumps(response) + "\n").encode("utf-8"))
+                await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                task = asyncio.ensure_future(answer(line))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.wait(pending)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle(self, line):
+        '''
+        Returns the response to a request line, None for a notification.
+        '''
+        identifier = None
+        try:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                raise RequestError(PARSE_ERROR, "not JSON")
+            if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+                raise RequestError(INVALID_REQUEST, "not a JSON-RPC request")
+            identifier = request.get("id")
+            params = request.get("params") or dict()
+            if not isinstance(params, dict):
+                raise RequestError(INVALID_PARAMS, "params must be an object")
+            method = getattr(self, "rpc_" + request["method"], None)
+            if method is None:
+                raise RequestError(METHOD_NOT_FOUND, "no method " + request["method"])
+            result = await method(params)
+            if "id" not in request:
+                return None
+            return {"jsonrpc": "2.0", "id": identifier, "result": result}
+        except RequestError as error:
+            return {"jsonrpc": "2.0", "id": identifier, "error": {"code": error.code, "message": str(error)}}
+        except script.ScriptError as error:
+            return {"jsonrpc": "2.0", "id": identifier, "error": {"code": INVALID_PARAMS, "message": str(error)}}
+        except Exception as error:
+            return {"jsonrpc": "2.0", "id": identifier,
+                    "error": {"code": INTERNAL_ERROR, "message": type(error).__name__ + ": " + str(error)}}
+
+    def text(self, params, name, default=""):
+        '''
+        Returns the string param name, or default if it is missing.
+        '''
+        value = params.get(name, default)
+        if not isinstance(value, str):
+            raise RequestError(INVALID_PARAMS, name + " must be a string")
+        return value
+
+    def session(self, params):
+        identifier = params.get("session")
+        session = self.sessions.get(identifier) if isinstance(identifier, str) else None
+        if session is None:
+            raise RequestError(INVALID_PARAMS, "no session " + repr(params.get("session")))
+        session.lastUsed = time.time()
+        return session
+
+    async def rpc_open(self, params):
+        options = params.get("options") or dict()
+        if not isinstance(options, dict):
+            raise RequestError(INVALID_PARAMS, "options must be an object")
+        unknown = [name for name in options if name not in OPTIONS]
+        if unknown:
+            raise RequestError(INVALID_PARAMS, "unknown options " + ", ".join(unknown))
+        identifier = str(next(self.identifiers))
+        self.sessions[identifier] = Session(identifier, options)
+        return {"session": identifier}
+
+    async def rpc_construct(self, params):
+        session = self.session(params)
+        step = self.text(params, "step")
+        if not step.startswith("let "):
+            raise RequestError(INVALID_PARAMS, "a construction starts with let")
+        async with session.lock:
+            return await session.step(step)
+
+    async def rpc_assume(self, params):
+        session = self.session(params)
+        async with session.lock:
+            return await session.step("assume " + self.text(params, "formula"))
+
+    async def rpc_hence(self, params):
+        session = self.session(params)
+        async with session.lock:
+            return await session.step("hence " + self.text(params, "formula"))
+
+    async def rpc_undo(self, params):
+        session = self.session(params)
+        steps = params.get("steps", 1)
+        if not isinstance(steps, int) or isinstance(steps, bool) or steps < 0:
+            raise RequestError(INVALID_PARAMS, "steps must be a non-negative integer")
+        async with session.lock:
+            return await session.undo(steps)
+
+    async def rpc_status(self, params):
+        session = self.session(params)
+        async with session.lock:
+            return session.status()
+
+    async def rpc_close(self, params):
+        session = self.session(params)
+        async with session.lock:
+            self.sessions.pop(session.identifier, None)
+            session.proof.close()
+        return {"closed": session.identifier}
+
+    async def evict(self, every=10):
+        '''
+        Closes the sessions idle for longer than idle seconds.
+        '''
+        while True:
+            await asyncio.sleep(every)
+            now = time.time()
+            for session in list(self.sessions.values()):
+                if now - session.lastUsed > self.idle and not session.lock.locked():
+                    self.sessions.pop(session.identifier, None)
+                    session.proof.close()
+                    print("=== Evicted idle session " + session.identifier + " ===")
+
+
+async def serve(path=None, port=None, idle=600):
+    '''
+    Runs the daemon on the Unix socket at path, or on localhost port.
+    A stale socket at path is replaced; any other file there raises
+    FileExistsError.
+    '''
+    if path is not None and os.path.exists(path):
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            raise FileExistsError("not a socket, refusing to replace it : " + path)
+        os.remove(path)
+    daemon = Daemon(idle)
+    if path is not None:
+        server = await asyncio.start_unix_server(daemon.connection, path=path)
+    else:
+        server = await asyncio.start_server(daemon.connection, host="127.0.0.1", port=port)
+    print("=== EuclidZ3 daemon listening on " + (path or "127.0.0.1:" + str(port)) + " ===")
+    sys.stdout.flush()
+    eviction = asyncio.ensure_future(daemon.evict(min(10, idle)))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        eviction.cancel()
+
+
+class Client(object):
+    '''
+    A blocking client for the daemon, one request at a time.
+
+        client = Client(path="/tmp/euclidz3.sock")
+        session = client.call("open", options={"entailment": True})["session"]
+        client.call("construct", session=session, step="let a b be points")
+    '''
+
+    def __init__(self, path=None, port=None):
+        if path is not None:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(path)
+        else:
+            self.socket = socket.create_connection(("127.0.0.1", port))
+        self.stream = self.socket.makefile("rwb")
+        self.identifiers = itertools.count(1)
+
+    def call(self, method, **params):
+        '''
+        Sends a request and returns its result. Raises RequestError if
+        the daemon answers with an error.
+        '''
+        identifier = next(self.identifiers)
+        request = {"jsonrpc": "2.0", "id": identifier, "method": method, "params": params}
+        self.stream.write((json.dumps(request) + "\n").encode("utf-8"))
+        self.stream.flush()
+        response = json.loads(self.stream.readline())
+        if "error" in response:
+            raise RequestError(response["error"]["code"], response["error"]["message"])
+        return response["result"]
+
+    def close(self):
+        self.stream.close()
+        self.socket.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve EuclidZ3 proof sessions over JSON-RPC.")
+    parser.add_argument("--socket", help="Unix socket to listen on")
+    parser.add_argument("--port", type=int, default=7377, help="localhost port to listen on without --socket")
+    parser.add_argument("--idle", type=float, default=600, help="seconds after which an idle session is closed")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="steps checked at once")
+    args = parser.parse_args(argv)
+
+    setAsyncLimit(args.jobs)
+    getLanguage()
+    try:
+        asyncio.run(serve(args.socket, None if args.socket else args.port, args.idle))
+    except FileExistsError as error:
+        parser.error(str(error))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,354 @@
+from z3 import *
+from EuclidZ3.canonical import SYMMETRIC, canonicalArgs
+import itertools
+
+
+def constants(expr, sortNames=("Point", "Line", "Circle")):
+    '''
+    Returns the uninterpreted constants of the given sorts occurring in expr.
+    '''
+    found = dict()
+    todo = [expr]
+    seen = set()
+    while todo:
+        node = todo.pop()
+        if node.get_id() in seen:
+            continue
+        seen.add(node.get_id())
+        if is_quantifier(node):
+            todo.append(node.body())
+        elif is_app(node):
+            if node.num_args() == 0 and node.decl().kind() == Z3_OP_UNINTERPRETED \
+                    and node.sort().name() in sortNames:
+                found[node.get_id()] = node
+            todo.extend(node.children())
+    return list(found.values())
+
+
+class Grounder(object):
+    '''
+    Instantiates the quantified axioms of language E over the finitely
+    many points, lines and circles registered with it, so that a
+    quantifier free solver can be used instead of E-matching and MBQI.
+
+    Axioms with at most eagerVars bound variables are instantiated eagerly:
+    every new object yields the instances that mention it. Instantiating
+    the larger axioms (triple incidence, angle and area sums) eagerly grows
+    with the 7th or 8th power of the diagram, so those are instantiated
+    lazily: violations(model) returns only the instances a candidate model
+    falsifies, found by a search that prunes on the premises of the axiom.
+    Once a model has no violations it satisfies every instance, so the
+    lazy instances never cost completeness.
+    '''
+
+    def __init__(self, axioms, eagerVars=3):
+        self.eagerVars = eagerVars
+        self.eager = []
+        self.lazy = []
+        self.objects = dict()
+        self.known = set()
+        self.added = set()
+        self.addAxioms(axioms)
+
+    def addAxioms(self, axioms):
+        '''
+        Adds quantified axioms. Returns the eager instances of the new 
+        axioms over the objects registered so far.
+        '''
+        instances = []
+        for axiom in axioms:
+            if not is_quantifier(axiom):
+                continue
+            if axiom.num_vars() <= self.eagerVars:
+                instantiate = Instantiator(axiom)
+                self.eager.append(instantiate)
+                sorts = [axiom.var_sort(i).name() for i in range(axiom.num_vars())]
+                for args in itertools.product(*[self.objects.get(sort, []) for sort in sorts]):
+                    instances.append(instantiate(args))
+            else:
+                self.lazy.append(LazyAxiom(axiom))
+        return instances
+
+    def register(self, const):
+        '''
+        Registers a ground constant. Returns the eager instances that
+        mention it, or an empty list if it was registered before.
+        '''
+        if const.get_id() in self.known:
+            return []
+        self.known.add(const.get_id())
+        sort = const.sort().name()
+        old = list(self.objects.get(sort, []))
+        self.objects.setdefault(sort, []).append(const)
+
+        instances = []
+        for instantiate in self.eager:
+            axiom = instantiate.axiom
+            sorts = [axiom.var_sort(i).name() for i in range(axiom.num_vars())]
+            for first in range(len(sorts)):
+                if sorts[first] != sort:
+                    continue
+                ## the new object first occurs at position first
+                domains = [old if sorts[i] == sort else self.objects.get(sorts[i], []) for i in range(first)]
+                domains.append([const])
+                domains.extend(self.objects.get(s, []) for s in sorts[first + 1:])
+                for args in itertools.product(*domains):
+                    instances.append(instantiate(args))
+        return instances
+
+    def violations(self, model):
+        '''
+        Returns the instances of the lazy axioms, over registered objects,
+        that are false in model and were not returned before.
+        '''
+        evaluator = ModelEvaluator(model)
+        found = []
+        for index, axiom in enumerate(self.lazy):
+            for args in axiom.violations(self.objects, evaluator):
+                key = (index,) + tuple(arg.get_id() for arg in args)
+                if key in self.added:
+                    continue
+                self.added.add(key)
+                found.append(axiom.instantiate(args))
+        return found
+
+    def size(self):
+        '''
+        Returns the number of registered objects.
+        '''
+        return len(self.known)
+
+
+def refine(solver, grounder, assumptions, found=None):
+    '''
+    Checks solver under assumptions, adding the lazy instances of
+    grounder that its models violate until a model violates none.
+    The instances added are appended to found, if given.
+    '''
+    result = solver.check(*assumptions)
+    while str(result) == 'sat':
+        violated = grounder.violations(solver.model())
+        if len(violated) == 0:
+            break
+        solver.add(violated)
+        if found is not None:
+            found.extend(violated)
+        result = solver.check(*assumptions)
+    return result
+
+
+class Instantiator(object):
+    '''
+    Instantiates the bound variables of a quantified axiom with args,
+    given in the order the variables are declared. 
+    
+    Instances are canonicalized, like every ground fact of a proof (see
+    canonical.py). Rather than rewriting each instance, the orientation
+    of every symmetric relation in the body is decided from the names of 
+    the arguments, and the body is substituted into in that orientation.
+    '''
+
+    def __init__(self, axiom):
+        self.axiom = axiom
+        self.body = axiom.body()
+        self.size = axiom.num_vars()
+        ## (application, its symmetric positions, the variable position
+        ## or constant text at each of them) for each symmetric relation
+        self.apps = []
+        todo = [self.body]
+        seen = set()
+        while todo:
+            node = todo.pop()
+            if node.get_id() in seen or not is_app(node):
+                continue
+            seen.add(node.get_id())
+            name = node.decl().name()
+            if node.decl().kind() == Z3_OP_UNINTERPRETED and name in SYMMETRIC:
+                positions = SYMMETRIC[name]
+                slots = [self.size - 1 - get_var_index(node.arg(position)) if is_var(node.arg(position)) 
+                         else node.arg(position).sexpr() for position in positions]
+                self.apps.append((node, positions, slots))
+            todo.extend(node.children())
+        ## orientations of the symmetric relations -> oriented body
+        self.variants = dict()
+        self.texts = dict()
+
+    def text(self, arg):
+        key = arg.get_id()
+        if key not in self.texts:
+            self.texts[key] = arg.sexpr()
+        return self.texts[key]
+
+    def __call__(self, args):
+        orientation = []
+        for app, positions, slots in self.apps:
+            keys = [self.text(args[slot]) if isinstance(slot, int) else slot for slot in slots]
+            orientation.append(tuple(sorted(range(len(keys)), key=lambda i: keys[i])))
+        orientation = tuple(orientation)
+        body = self.variants.get(orientation)
+        if body is None:
+            rewrites = []
+            for (app, positions, slots), order in zip(self.apps, orientation):
+                if list(order) != sorted(order):
+                    children = app.children()
+                    for position, chosen in zip(positions, order):
+                        children[position] = app.arg(positions[chosen])
+                    rewrites.append((app, app.decl()(*children)))
+            body = substitute(self.body, *rewrites) if rewrites else self.body
+            self.variants[orientation] = body
+        ## Var(0) is the last declared variable
+        return substitute_vars(body, *reversed(args))
+
+
+class ModelEvaluator(object):
+    '''
+    Evaluates atoms in a model, memoizing on the elements of the model
+    the arguments are interpreted as. The solver only sees canonicalized
+    terms, so atoms of symmetric relations are evaluated in canonical
+    argument order.
+    '''
+
+    def __init__(self, model):
+        self.model = model
+        self.elements = dict()
+        self.atoms = dict()
+        self.texts = dict()
+
+    def element(self, obj):
+        '''
+        Returns the (element, element id) a (constant, constant id) pair
+        is interpreted as.
+        '''
+        const, key = obj
+        if key not in self.elements:
+            element = self.model.eval(const, model_completion=True)
+            self.elements[key] = (element, element.get_id())
+        return self.elements[key]
+
+    def text(self, obj):
+        const, key = obj
+        if key not in self.texts:
+            self.texts[key] = const.sexpr()
+        return self.texts[key]
+
+    def atom(self, decl, declId, name, objs):
+        objs = canonicalArgs(name, objs, self.text)
+        elements = [self.element(obj) for obj in objs]
+        key = (declId,) + tuple(element[1] for element in elements)
+        if key not in self.atoms:
+            term = decl(*[element[0] for element in elements])
+            self.atoms[key] = is_true(self.model.eval(term, model_completion=True))
+        return self.atoms[key]
+
+    def holds(self, expr):
+        return is_true(self.model.eval(expr, model_completion=True))
+
+
+class LazyAxiom(object):
+    '''
+    A quantified axiom whose premises are compiled into checks that
+    can be evaluated on a partial assignment of its variables.
+    '''
+
+    def __init__(self, axiom):
+        self.axiom = axiom
+        self.instantiate = Instantiator(axiom)
+        self.sorts = [axiom.var_sort(i).name() for i in range(axiom.num_vars())]
+        body = axiom.body()
+        premises = []
+        if is_app_of(body, Z3_OP_IMPLIES):
+            premise = body.arg(0)
+            premises = premise.children() if is_and(premise) else [premise]
+
+        checks = []
+        for premise in premises:
+            variables = set()
+            if self.compilable(premise, variables):
+                checks.append((self.compile(premise), variables))
+        ## assign the variables used by most premises first
+        uses = [sum(1 for _, variables in checks if position in variables) for position in range(len(self.sorts))]
+        self.order = sorted(range(len(self.sorts)), key=lambda position: -uses[position])
+        ## checks[k] are those premises fully assigned after k+1 variables
+        self.checks = [[] for _ in self.order]
+        for check, variables in checks:
+            last = max([self.order.index(position) for position in variables] or [0])
+            self.checks[last].append(check)
+
+    def position(self, var):
+        ## de Bruijn index 0 is the last declared variable
+        return len(self.sorts) - 1 - get_var_index(var)
+
+    def compilable(self, expr, variables):
+        '''
+        Returns True if expr can be evaluated from atoms alone, collecting
+        the positions of the variables it uses.
+        '''
+        if is_var(expr):
+            variables.add(self.position(expr))
+            return True
+        if not is_app(expr):
+            return False
+        if is_not(expr) or is_or(expr) or is_and(expr):
+            return all(self.compilable(child, variables) for child in expr.children())
+        if is_eq(expr) and expr.arg(0).sort().kind() == Z3_UNINTERPRETED_SORT:
+            return all(self.compilable(child, variables) for child in expr.children())
+        if expr.decl().kind() == Z3_OP_UNINTERPRETED:
+            if expr.num_args() == 0:
+                return expr.sort().kind() == Z3_UNINTERPRETED_SORT
+            return is_bool(expr) and all(self.compilable(child, variables) for child in expr.children())
+        return False
+
+    def compile(self, expr):
+        '''
+        Compiles a compilable expression into a python function of an
+        assignment and a ModelEvaluator, so the search never walks z3 terms.
+        '''
+        if is_var(expr):
+            position = self.position(expr)
+            return lambda assignment, evaluator: assignment[position]
+        if is_not(expr):
+            inner = self.compile(expr.arg(0))
+            return lambda assignment, evaluator: not inner(assignment, evaluator)
+        if is_or(expr):
+            parts = [self.compile(child) for child in expr.children()]
+            return lambda assignment, evaluator: any(part(assignment, evaluator) for part in parts)
+        if is_and(expr):
+            parts = [self.compile(child) for child in expr.children()]
+            return lambda assignment, evaluator: all(part(assignment, evaluator) for part in parts)
+        if is_eq(expr):
+            left, right = self.compile(expr.arg(0)), self.compile(expr.arg(1))
+            return lambda assignment, evaluator: \
+                evaluator.element(left(assignment, evaluator))[1] == evaluator.element(right(assignment, evaluator))[1]
+        if expr.num_args() == 0:
+            const = (expr, expr.get_id())
+            return lambda assignment, evaluator: const
+        decl = expr.decl()
+        declId = decl.get_id()
+        name = decl.name()
+        args = [self.compile(child) for child in expr.children()]
+        return lambda assignment, evaluator: evaluator.atom(decl, declId, name, [arg(assignment, evaluator) for arg in args])
+
+    def violations(self, objects, evaluator):
+        '''
+        Yields tuples of objects, in declaration order, whose
+        instance of this axiom is false in the evaluator's model.
+        '''
+        ## assignments hold (constant, constant id) pairs
+        domains = [[(obj, obj.get_id()) for obj in objects.get(sort, [])] for sort in self.sorts]
+        assignment = [None] * len(self.sorts)
+
+        def search(depth):
+            if depth == len(self.order):
+                args = [obj[0] for obj in assignment]
+                if not evaluator.holds(self.instantiate(args)):
+                    yield args
+                return
+            position = self.order[depth]
+            for obj in domains[position]:
+                assignment[position] = obj
+                if all(check(assignment, evaluator) for check in self.checks[depth]):
+                    for args in search(depth + 1):
+                        yield args
+            assignment[position] = None
+
+        return search(0)
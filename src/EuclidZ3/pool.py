@@ -0,0 +1,170 @@
+'''
+Pre-warmed solvers.
+
+Every Proof of the quantified mode starts with a fresh z3 context and a
+solver with the axioms of LanguageE asserted, and z3 internalizes them on
+its first check. A SolverPool does that work once per solver: a Proof
+checks a solver out, works inside a base push scope, and returns it by
+popping back to the axioms.
+'''
+from z3 import *
+from EuclidZ3.core import getLanguage
+import threading
+import time
+
+
+## z3's defaults for the parameters a Proof may change
+DEFAULTS = {"timeout": 4294967295, "rlimit": 0}
+
+
+class PooledSolver(object):
+    '''
+    A solver of a SolverPool, with its context and the number of
+    assertions it has when only the axioms are asserted.
+    '''
+
+    def __init__(self, context, solver, size):
+        self.context = context
+        self.solver = solver
+        self.size = size
+        self.uses = 0
+
+    def healthy(self):
+        '''
+        Returns True if the solver is back to just the axioms.
+        '''
+        return self.solver.num_scopes() == 0 and len(self.solver.assertions()) == self.size
+
+
+class SolverPool(object):
+    '''
+    Keeps up to size solvers with the axioms of language asserted and
+    internalized, for proofs with every axiom loaded (not ground or
+    relevance mode) and the same mbqi setting.
+
+    A solver is retired after maxUses proofs, or when it does not come
+    back to just the axioms. timeout (milliseconds) bounds the checks of
+    the solvers unless a proof sets its own. metrics() reports how long 
+    checkouts waited and how often solvers were reused.
+    '''
+
+    def __init__(self, size=4, language=None, mbqi=True, maxUses=100, prewarm=True, timeout=None):
+        self.size = size
+        self.defaults = dict(DEFAULTS)
+        if timeout:
+            self.defaults["timeout"] = timeout
+        self.language = language if language is not None else getLanguage()
+        self.mbqi = mbqi
+        self.maxUses = maxUses
+        self.idle = []
+        ## solvers in the pool, idle or checked out, and the checked out ones
+        self.count = 0
+        self.busy = set()
+        self.condition = threading.Condition()
+        self.counters = {"checkouts": 0, "reuses": 0, "created": 0, "retired": 0, "unhealthy": 0,
+                         "misses": 0, "waitTime": 0.0, "maxWait": 0.0}
+        if prewarm:
+            for _ in range(size):
+                self.idle.append(self.create())
+                self.count += 1
+
+    def create(self):
+        '''
+        Returns a new solver with the axioms asserted and internalized.
+        '''
+        context = Context()
+        solver = Solver(ctx=context)
+        if not self.mbqi:
+            solver.set("smt.mbqi", False)
+        solver.add(self.language.axiomsIn(context))
+        ## the first check internalizes the axioms
+        solver.set("timeout", 2000)
+        solver.check()
+        solver.set("timeout", self.defaults["timeout"])
+        with self.condition:
+            self.counters["created"] += 1
+        return PooledSolver(context, solver, len(solver.assertions()))
+
+    def checkout(self, block=True, timeout=None):
+        '''
+        Returns a solver in a new base scope. Waits for one to be returned
+        if all size solvers are checked out, at most timeout seconds.
+        Without block, or after the timeout, returns None instead.
+        '''
+        start = time.time()
+        with self.condition:
+            while len(self.idle) == 0 and self.count >= self.size:
+                remaining = None if timeout is None else timeout - (time.time() - start)
+                if not block or (remaining is not None and remaining <= 0):
+                    self.counters["misses"] += 1
+                    return None
+                self.condition.wait(remaining)
+            pooled = self.idle.pop() if self.idle else None
+            if pooled is None:
+                self.count += 1
+            waited = time.time() - start
+            self.counters["checkouts"] += 1
+            self.counters["waitTime"] += waited
+            self.counters["maxWait"] = max(self.counters["maxWait"], waited)
+        if pooled is not None and not pooled.healthy():
+            with self.condition:
+                self.counters["unhealthy"] += 1
+            pooled = None
+        if pooled is None:
+            pooled = self.create()
+        else:
+            with self.condition:
+                self.counters["reuses"] += 1
+        pooled.uses += 1
+        pooled.solver.push()
+        with self.condition:
+            self.busy.add(pooled)
+        return pooled
+
+    def release(self, pooled, lease=None):
+        '''
+        Pops pooled back to the axioms and returns it to the pool. lease
+        is the value of pooled.uses at checkout, if known: a solver that
+        was reclaimed and checked out again since is not released.
+        '''
+        with self.condition:
+            if pooled not in self.busy or (lease is not None and lease != pooled.uses):
+                return
+            self.busy.discard(pooled)
+        solver = pooled.solver
+        solver.pop(solver.num_scopes())
+        for name, value in self.defaults.items():
+            solver.set(name, value)
+        retire = pooled.uses >= self.maxUses or not pooled.healthy()
+        with self.condition:
+            if retire:
+                self.counters["retired"] += 1
+                self.count -= 1
+            else:
+                self.idle.append(pooled)
+            self.condition.notify()
+
+    def reclaim(self):
+        '''
+        Returns every checked out solver to the pool, for when the proofs
+        using them were abandoned without being closed. Returns how many
+        were reclaimed.
+        '''
+        with self.condition:
+            busy = list(self.busy)
+        for pooled in busy:
+            self.release(pooled)
+        return len(busy)
+    
+    def metrics(self):
+        '''
+        Returns the counters of the pool and how many solvers are idle
+        and checked out.
+        '''
+        with self.condition:
+            metrics = dict(self.counters)
+            metrics["idle"] = len(self.idle)
+            metrics["checkedOut"] = self.count - len(self.idle)
+        checkouts = metrics["checkouts"]
+        metrics["meanWait"] = metrics["waitTime"] / checkouts if checkouts else 0.0
+        return metrics
@@ -0,0 +1,346 @@
+'''
+Solver portfolio.
+
+Races several z3 configurations on the same query, each in its own
+long lived worker process. The first configuration to give a definitive
+answer (sat or unsat) wins and the others are interrupted.
+
+The workers keep their solvers between queries. Each query only sends
+the assertions a worker does not have yet, as SMT-LIB text, together with
+the signatures of the symbols they declare. Assertions that were part of
+two queries in a row are kept at the base level of the worker's solver,
+the others are asserted in a scope that is popped after the check, so a
+proof that pushes and pops its goals does not make the workers start
+over.
+'''
+from z3 import *
+from EuclidZ3.ground import Grounder, constants, refine
+import collections
+import multiprocessing
+import multiprocessing.connection
+import threading
+
+
+## (name, solver parameters, ground) of the default configurations
+CONFIGURATIONS = [
+    ("mbqi", {"smt.mbqi" : True}, False),
+    ("ematching", {"smt.mbqi" : False}, False),
+    ("relevancy0", {"smt.relevancy" : 0}, False),
+    ("ground", {}, True),
+]
+
+
+def signatures(expr):
+    '''
+    Returns the uninterpreted symbols of expr as (name, domain sort
+    names, range sort name) and the names of its uninterpreted sorts.
+    '''
+    symbols = {}
+    sorts = set()
+    seen = set()
+    stack = [expr]
+    while stack:
+        node = stack.pop()
+        if node.get_id() in seen:
+            continue
+        seen.add(node.get_id())
+        if is_quantifier(node):
+            for index in range(node.num_vars()):
+                sorts.add(node.var_sort(index))
+            stack.append(node.body())
+            stack.extend(node.pattern(index) for index in range(node.num_patterns()))
+            continue
+        if not is_app(node):
+            continue
+        decl = node.decl()
+        if decl.kind() == Z3_OP_UNINTERPRETED:
+            domain = [decl.domain(index) for index in range(decl.arity())]
+            sorts.update(domain)
+            sorts.add(decl.range())
+            symbols[decl.name()] = (decl.name(), tuple(sort.name() for sort in domain),
+                decl.range().name())
+        stack.extend(node.children())
+    uninterpreted = set(sort.name() for sort in sorts if sort.kind() == Z3_UNINTERPRETED_SORT)
+    return list(symbols.values()), uninterpreted
+
+
+class Worker(object):
+    '''
+    State of one worker process: a solver in its own context that
+    holds the base assertions, and the sorts and symbols declared so far.
+    '''
+
+    def __init__(self, parameters, ground):
+        self.parameters = parameters
+        self.ground = ground
+        self.reset()
+
+    def reset(self):
+        ## set when an error leaves the solver without the assertions the
+        ## portfolio thinks it has, until the portfolio resets it
+        self.broken = False
+        self.ctx = Context()
+        self.sorts = {}
+        self.decls = {}
+        if self.ground:
+            self.solver = SolverFor("QF_UFLRA", ctx=self.ctx)
+            self.grounder = Grounder([])
+        else:
+            self.solver = Solver(ctx=self.ctx)
+            self.grounder = None
+        for name, value in self.parameters.items():
+            self.solver.set(name, value)
+
+    def sort(self, name):
+        builtin = {"Bool" : BoolSort, "Real" : RealSort, "Int" : IntSort}
+        if name in builtin:
+            return builtin[name](self.ctx)
+        return self.sorts[name]
+
+    def declare(self, sorts, symbols):
+        for name in sorts:
+            if name not in self.sorts:
+                self.sorts[name] = DeclareSort(name, self.ctx)
+        for name, domain, range in symbols:
+            if name not in self.decls:
+                self.decls[name] = Function(name, *([self.sort(sort) for sort in domain] + [self.sort(range)]))
+
+    def add(self, texts):
+        '''
+        Parses and asserts texts. Returns the ground instances they
+        caused, in ground mode.
+        '''
+        instances = []
+        for text in texts:
+            for assertion in parse_smt2_string("(assert " + text + ")",
+                    sorts=self.sorts, decls=self.decls, ctx=self.ctx):
+                if self.grounder is None:
+                    self.solver.add(assertion)
+                elif is_quantifier(assertion):
+                    instances.extend(self.grounder.addAxioms([assertion]))
+                else:
+                    self.solver.add(assertion)
+                    for const in constants(assertion):
+                        instances.extend(self.grounder.register(const))
+        self.solver.add(instances)
+        return instances
+
+    def check(self, reset, sorts, symbols, commit, scoped, names, timeout, rlimit):
+        '''
+        Adds commit to the base level and scoped in a scope of its own,
+        and checks them under the Boolean assumptions names. Returns
+        (result, reason, core names).
+        '''
+        if reset:
+            self.reset()
+        elif self.broken:
+            raise RuntimeError("worker lost its assertions")
+        self.declare(sorts, symbols)
+        self.add(commit)
+        self.solver.set("timeout", timeout or 4294967295)
+        self.solver.set("rlimit", rlimit or 0)
+        found = []
+        self.solver.push()
+        try:
+            found.extend(self.add(scoped))
+            assumptions = [Bool(name, self.ctx) for name in names]
+            if self.grounder is None:
+                result = self.solver.check(*assumptions)
+            else:
+                result = refine(self.solver, self.grounder, assumptions, found)
+            reason = self.solver.reason_unknown() if str(result) == 'unknown' else None
+            core = [str(literal) for literal in self.solver.unsat_core()] if str(result) == 'unsat' else None
+        finally:
+            self.solver.pop()
+        ## the grounder remembers the objects of the scope, so their
+        ## instances stay at the base level
+        self.solver.add(found)
+        return str(result), reason, core
+
+
+def serve(connection, parameters, ground):
+    '''
+    Worker process: answers the queries sent on connection with
+    (query, result, reason, core names) until it is sent None. A query
+    that is cancelled while it is checked is interrupted.
+    '''
+    worker = Worker(parameters, ground)
+    waiting = collections.deque()
+    while True:
+        message = waiting.popleft() if waiting else connection.recv()
+        if message is None:
+            return
+        if message[0] == "cancel":
+            continue
+        query = message[1]
+        answer = []
+
+        def run():
+            try:
+                answer.extend(worker.check(*message[2:]))
+            except Exception as error:
+                ## the worker's state is unknown after an error, so the next
+                ## query starts over
+                worker.reset()
+                worker.broken = True
+                answer.extend(('unknown', type(error).__name__ + ": " + str(error), None))
+                answer.append("reset")
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        while thread.is_alive():
+            if connection.poll(0.01):
+                incoming = connection.recv()
+                if incoming is not None and incoming[0] == "cancel" and incoming[1] == query:
+                    worker.ctx.interrupt()
+                else:
+                    waiting.append(incoming)
+            thread.join(0.01)
+        connection.send((query,) + tuple(answer))
+
+
+class Portfolio(object):
+    '''
+    Races the configurations (see CONFIGURATIONS) on a query in
+    separate long lived processes, started on the first query.
+    timeout (milliseconds) and rlimit bound each configuration
+    when the query does not give its own.
+
+    wins counts the queries each configuration answered first.
+    '''
+
+    def __init__(self, configurations=None, timeout=None, rlimit=None):
+        self.configurations = CONFIGURATIONS if configurations is None else configurations
+        self.timeout = timeout
+        self.rlimit = rlimit
+        self.wins = dict((name, 0) for name, _, _ in self.configurations)
+        self.workers = []
+        self.queries = 0
+        self.forget()
+
+    def forget(self):
+        '''
+        Forgets what the workers hold; the next query resets them.
+        '''
+        self.context = None
+        self.committed = []
+        self.tail = []
+        self.texts = {}
+        self.declared = set()
+
+    def start(self):
+        for name, parameters, ground in self.configurations:
+            mine, theirs = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=serve, args=(theirs, parameters, ground))
+            process.daemon = True
+            process.start()
+            theirs.close()
+            self.workers.append((process, mine))
+        self.forget()
+
+    def close(self):
+        '''
+        Stops the worker processes.
+        '''
+        for process, connection in self.workers:
+            try:
+                connection.send(None)
+            except (OSError, EOFError):
+                pass
+        for process, connection in self.workers:
+            process.join(1)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+            connection.close()
+        self.workers = []
+        self.forget()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def text(self, assertion):
+        key = assertion.get_id()
+        if key not in self.texts:
+            symbols, sorts = signatures(assertion)
+            self.texts[key] = (symbols, sorts, assertion.sexpr())
+        return self.texts[key]
+
+    def check(self, assertions, names, timeout=None, rlimit=None):
+        '''
+        Checks assertions (z3 expressions of one context) under the
+        Boolean assumptions names. timeout and rlimit bound this query,
+        falling back on those of the portfolio. Returns (result, reason,
+        core names, winner): the first definitive answer and the
+        configuration that gave it, or an unknown result if no
+        configuration could decide.
+        '''
+        if any(not process.is_alive() for process, _ in self.workers):
+            self.close()
+        if not self.workers:
+            self.start()
+        assertions = list(assertions)
+        context = assertions[0].ctx if assertions else self.context
+        keys = [assertion.get_id() for assertion in assertions]
+        reset = context is not self.context or keys[:len(self.committed)] != self.committed
+        if reset:
+            self.forget()
+            self.context = context
+        new = assertions[len(self.committed):]
+        shared = 0
+        while shared < min(len(new), len(self.tail)) and new[shared].get_id() == self.tail[shared]:
+            shared += 1
+
+        sorts = set()
+        symbols = []
+        commit = []
+        scoped = []
+        for index, assertion in enumerate(new):
+            theirs, sortNames, text = self.text(assertion)
+            sorts.update(sortNames)
+            for symbol in theirs:
+                if symbol[0] not in self.declared:
+                    self.declared.add(symbol[0])
+                    symbols.append(symbol)
+            (commit if index < shared else scoped).append(text)
+        self.committed.extend(keys[len(self.committed):len(self.committed) + shared])
+        self.tail = keys[len(self.committed):]
+
+        self.queries += 1
+        query = self.queries
+        message = ("check", query, reset, sorted(sorts), symbols, commit, scoped, list(names),
+            timeout or self.timeout, rlimit or self.rlimit)
+        for _, connection in self.workers:
+            connection.send(message)
+
+        answer = ('unknown', "no configuration answered", None, None)
+        pending = dict((connection, index) for index, (_, connection) in enumerate(self.workers))
+        while pending:
+            for connection in multiprocessing.connection.wait(list(pending)):
+                try:
+                    received = connection.recv()
+                except EOFError:
+                    ## the worker died; it is restarted on the next query
+                    del pending[connection]
+                    continue
+                if len(received) > 4:
+                    ## the worker lost its assertions, so all of them start over
+                    self.context = None
+                if received[0] != query:
+                    continue
+                index = pending.pop(connection)
+                result, reason, core = received[1:4]
+                name = self.configurations[index][0]
+                if result in ('sat', 'unsat') and answer[0] not in ('sat', 'unsat'):
+                    answer = (result, None, core, name)
+                    self.wins[name] += 1
+                    for other in pending:
+                        other.send(("cancel", query))
+                    pending = {}
+                    break
+                answer = (result, reason, None, None)
+        return answer
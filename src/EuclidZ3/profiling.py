@@ -0,0 +1,82 @@
+'''
+Profiles of proof checks.
+
+A Proof keeps one record per solver check in Proof.profile:
+
+    {"label": "hence SameSide(d, c, L)", "start": 0.52, "wall": 0.031,
+     "result": "unsat", "statistics": {"conflicts": 3, "decisions": 12, ...}}
+
+start is in seconds since the proof was created and statistics holds
+what z3 counted during that check alone. This module summarizes the
+records and writes them as JSON lines or as a Chrome trace, which can be
+opened in chrome://tracing or Perfetto.
+'''
+import json
+import os
+
+
+## z3 statistics that are not counted over the life of the solver, kept
+## as they are: memory levels, and the time of the last check alone
+GAUGES = ("memory", "max memory", "time")
+
+
+def statistics(solver):
+    '''
+    Returns the statistics of solver as a dict.
+    '''
+    counted = solver.statistics()
+    return dict((key, counted.get_key_value(key)) for key in counted.keys())
+
+
+def difference(after, before):
+    '''
+    Returns what the z3 statistics after counted since before.
+    '''
+    counted = dict()
+    for key, value in after.items():
+        if key in GAUGES:
+            counted[key] = value
+        elif value != before.get(key, 0):
+            counted[key] = value - before.get(key, 0)
+    return counted
+
+
+def summarize(records):
+    '''
+    Returns one entry per label with the number of checks, their wall
+    time and their conflicts, decisions and quantifier instantiations,
+    the most expensive first.
+    '''
+    steps = dict()
+    for record in records:
+        step = steps.get(record["label"])
+        if step is None:
+            step = steps[record["label"]] = {"label": record["label"], "checks": 0, "wall": 0.0,
+                "conflicts": 0, "decisions": 0, "instantiations": 0}
+        counted = record["statistics"]
+        step["checks"] += 1
+        step["wall"] += record["wall"]
+        step["conflicts"] += counted.get("conflicts", 0)
+        step["decisions"] += counted.get("decisions", 0)
+        step["instantiations"] += counted.get("quant instantiations", 0) + counted.get("axiom instances", 0)
+    return sorted(steps.values(), key=lambda step: step["wall"], reverse=True)
+
+
+def writeJsonLines(records, out):
+    '''
+    Writes the records to the file out, one JSON object per line.
+    '''
+    for record in records:
+        out.write(json.dumps(record) + "\n")
+
+
+def writeChromeTrace(records, out):
+    '''
+    Writes the records to the file out as complete events of the
+    Chrome trace event format, in microseconds.
+    '''
+    events = [{"name": record["label"], "cat": "check", "ph": "X", "pid": os.getpid(), "tid": 0,
+               "ts": int(record["start"] * 1e6), "dur": int(record["wall"] * 1e6),
+               "args": dict(record["statistics"], result=record["result"])}
+              for record in records]
+    json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, out)
@@ -0,0 +1,23 @@
+'''
+If lines L and M both go through two distinct points a and b,
+then L and M are the same line.
+'''
+from z3 import *
+from EuclidZ3.core import *
+
+
+def proof():
+    pc = Proof()
+    a = Point("a")
+    pc.construct(a)
+    b = Point("b")
+    pc.construct(b)
+    L = Line("L")
+    L.through(a, b)
+    pc.construct(L)
+    M = Line("M")
+    M.through(a, b)
+    pc.construct(M)
+    pc.hence(L.z3Expr == M.z3Expr)
+    pc.hence(language.OnLine(a.z3Expr, M.z3Expr))
+    return pc
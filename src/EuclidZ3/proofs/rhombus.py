@@ -0,0 +1,43 @@
+'''
+Euclid I.1 as a lemma: applied to pq and to qp it gives points r and s
+with pr = qs and rq = sp, both equal to pq, without redoing its proof.
+'''
+from z3 import *
+from EuclidZ3.core import *
+
+
+a, b, c = Point("a"), Point("b"), Point("c")
+
+
+def equilateral(pc):
+    alpha = Circle("alpha")
+    alpha.centerThrough(a, b)
+    pc.construct(alpha)
+    beta = Circle("beta")
+    beta.centerThrough(b, a)
+    pc.construct(beta)
+    pc.hence(language.Intersectscc(alpha.z3Expr, beta.z3Expr))
+    c.intersectsCircleCircle(alpha, beta)
+    pc.construct(c)
+
+
+I1 = Theorem("I.1", [a, b], [Not(a.z3Expr == b.z3Expr)], [c],
+    [language.Segment(a.z3Expr, c.z3Expr) == language.Segment(a.z3Expr, b.z3Expr),
+     language.Segment(b.z3Expr, c.z3Expr) == language.Segment(a.z3Expr, b.z3Expr)],
+    proof=equilateral)
+
+
+def proof():
+    pc = Proof(entailment=True)
+    p = Point("p")
+    pc.construct(p)
+    q = Point("q")
+    pc.construct(q)
+    pc.assume(Not(p.z3Expr == q.z3Expr))
+    r = Point("r")
+    pc.apply(I1, [p, q, r])
+    s = Point("s")
+    pc.apply(I1, [q, p, s])
+    pc.hence(language.Segment(p.z3Expr, r.z3Expr) == language.Segment(q.z3Expr, s.z3Expr))
+    pc.hence(language.Segment(r.z3Expr, q.z3Expr) == language.Segment(s.z3Expr, p.z3Expr))
+    return pc
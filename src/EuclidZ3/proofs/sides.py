@@ -0,0 +1,23 @@
+'''
+A point between a and c, where a is on L and c is not,
+is on the same side of L as c.
+'''
+from z3 import *
+from EuclidZ3.core import *
+
+
+def proof():
+    pc = Proof(entailment=True)
+    a = Point("a")
+    pc.construct(a)
+    c = Point("c")
+    pc.construct(c)
+    L = Line("L")
+    pc.construct(L)
+    pc.assume(language.OnLine(a.z3Expr, L.z3Expr))
+    pc.assume(Not(language.OnLine(c.z3Expr, L.z3Expr)))
+    b = Point("b")
+    b.between(a, c)
+    pc.construct(b)
+    pc.hence(language.SameSide(b.z3Expr, c.z3Expr, L.z3Expr))
+    return pc
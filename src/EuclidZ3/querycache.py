@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import tempfile
+
+
+class QueryCache(object):
+    '''
+    A content addressed on-disk cache of solver answers.
+
+    An answer is stored under the hash of everything it depends on: the
+    version of the axiom set, the facts asserted in the proof, the query
+    and the mode it was checked in. The facts are hashed as a sorted set,
+    so proofs that reach the same facts in a different order share their
+    answers.
+
+    Entries are small JSON files. The least recently used entries, by
+    modification time, are evicted once the cache grows over maxBytes.
+    '''
+
+    def __init__(self, directory=None, maxBytes=64 * 1024 * 1024):
+        if directory is None:
+            directory = os.path.join(os.environ.get("EUCLIDZ3_CACHE_DIR",
+                os.path.join(os.path.expanduser("~"), ".cache", "EuclidZ3")), "queries")
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.size = sum(size for _, _, size in self.entries())
+
+    def key(self, axiomKey, context, query, mode):
+        '''
+        Returns the key of query checked in mode against the facts context,
+        an iterable of their SMT-LIB texts, under the axiom set axiomKey.
+        '''
+        digest = hashlib.sha256()
+        for part in [str(axiomKey), mode, query] + sorted(set(context)):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def get(self, key):
+        '''
+        Returns the entry stored under key, a dict with the "result" and
+        optional "reason" and "core", or None.
+        '''
+        path = self.path(key)
+        try:
+            with open(path) as stored:
+                entry = json.load(stored)
+            os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, key, result, reason=None, core=None):
+        '''
+        Stores the answer to the query of key: the z3 result, the reason
+        for an unknown result and the SMT-LIB texts of an unsat core.
+        '''
+        entry = {"result": str(result)}
+        if reason is not None:
+            entry["reason"] = reason
+        if core is not None:
+            entry["core"] = core
+        text = json.dumps(entry)
+        path = self.path(key)
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            handle, tmpPath = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(handle, "w") as tmp:
+                tmp.write(text)
+            os.replace(tmpPath, path)
+        except (IOError, OSError):
+            return
+        self.size += len(text)
+        if self.size > self.maxBytes:
+            self.evict()
+
+    def entries(self):
+        '''
+        Returns (modification time, path, size) of every entry.
+        '''
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    status = os.stat(path)
+                except OSError:
+                    continue
+                found.append((status.st_mtime, path, status.st_size))
+        return found
+
+    def evict(self):
+        '''
+        Removes the least recently used entries until the cache is
+        back under three quarters of maxBytes.
+        '''
+        entries = sorted(self.entries())
+        self.size = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if self.size <= self.maxBytes * 3 // 4:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
+
+    def clear(self):
+        for _, path, _ in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.size = 0
+
+    def stats(self):
+        '''
+        Returns the hit and miss counters and the size of the cache.
+        '''
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "bytes": self.size,
+                "hitRate": float(self.hits) / lookups if lookups else 0.0}
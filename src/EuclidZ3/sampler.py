@@ -0,0 +1,512 @@
+'''
+Random diagram sampler.
+
+Realizes the points, lines and circles of a proof with coordinates in
+many random configurations at once, as NumPy arrays, and evaluates the
+relations and magnitudes of language E in all of them together:
+
+    On, Onc, Between, SameSide, Inside, Center, Intersects*   as in the plane
+    Segment(a, b)      the distance from a to b
+    Angle(a, b, c)     the angle at b, in radians, RightAngle being pi/2
+    Area(a, b, c)      the area of the triangle abc
+
+A configuration in which every fact of the proof holds is a model of the
+facts and of the axioms, which are true in the plane. So a claim false in
+one is not entailed by the facts, and a claim true in one is consistent
+with them, without asking z3 (see Proof.satisfied).
+
+Floating point answers are only trusted with a margin: an atom closer
+than delta to the boundary between true and false, without being within
+epsilon of it, is undecided, and so is every configuration in which a
+fact is undecided. numpy is only needed once a Sampler is made.
+'''
+from z3 import *
+from EuclidZ3.ground import constants
+import math
+
+
+## loaded by loadNumpy, so EuclidZ3 does not depend on numpy
+numpy = None
+
+## candidate positions tried for an object before its samples are given up
+TRIES = 8
+
+
+def loadNumpy():
+    '''
+    Imports numpy on first use.
+    '''
+    global numpy
+    if numpy is None:
+        try:
+            import numpy as module
+        except ImportError:
+            raise ImportError("the diagram sampler needs numpy")
+        numpy = module
+    return numpy
+
+
+def objectKey(expr):
+    '''
+    Returns the key of a point, line or circle constant, the same in
+    every z3 context.
+    '''
+    return (expr.sort().name(), expr.decl().name())
+
+
+class Sampler(object):
+    '''
+    Realizations of the diagram of a proof in samples random
+    configurations. Points are (samples, 2) arrays of coordinates, lines
+    a point and a unit direction, circles a center and a radius.
+
+    realize places a newly constructed object, add records a fact of the
+    proof and witnesses tells whether a claim holds in a configuration
+    where every fact holds.
+    '''
+
+    def __init__(self, samples=256, seed=None, epsilon=1e-9, delta=1e-6):
+        loadNumpy()
+        self.samples = samples
+        self.random = numpy.random.default_rng(seed)
+        self.epsilon = epsilon
+        self.delta = delta
+        ## key of an object -> its realization
+        self.objects = dict()
+        ## configurations in which every fact evaluated so far holds
+        self.valid = numpy.ones(samples, dtype=bool)
+        ## facts not evaluated yet, as they mention unrealized objects
+        self.pending = []
+
+    ## objects
+
+    def realize(self, obj):
+        '''
+        Places obj, a Point, Line or Circle, in every configuration by
+        those of its conclusions that mention only objects already placed. Each
+        configuration keeps the first of TRIES candidates that meets the
+        conclusions; the others are not met there and leave it invalid.
+        '''
+        key = objectKey(obj.z3Expr)
+        conclusions = [conclusion for conclusion in obj.conclusions
+                       if all(objectKey(const) == key or objectKey(const) in self.objects
+                              for const in constants(conclusion))]
+        chosen = None
+        done = numpy.zeros(self.samples, dtype=bool)
+        for _ in range(TRIES):
+            candidate = self.candidate(obj, conclusions)
+            self.objects[key] = candidate
+            met = self.holds(conclusions)
+            if chosen is None:
+                chosen = candidate
+            else:
+                take = met & ~done
+                chosen = tuple(numpy.where(take.reshape((-1,) + (1,) * (old.ndim - 1)), new, old)
+                               for new, old in zip(candidate, chosen))
+            done |= met
+            if done.all():
+                break
+        self.objects[key] = chosen
+
+    def candidate(self, obj, conclusions):
+        '''
+        Returns random positions of obj that meet the conclusions fixing
+        where it lies, like the lines or circles a point is on.
+        '''
+        sortName = obj.z3Expr.sort().name()
+        if sortName == "Line":
+            return self.candidateLine(conclusions)
+        if sortName == "Circle":
+            return self.candidateCircle(conclusions)
+        return (self.candidatePoint(obj, conclusions),)
+
+    def mentioned(self, conclusions, name, position, sortName):
+        '''
+        Returns the realized objects of sortName at argument position of
+        the conclusions that apply name.
+        '''
+        found = []
+        for conclusion in conclusions:
+            if is_app(conclusion) and conclusion.decl().name() == name:
+                arg = conclusion.arg(position)
+                if arg.sort().name() == sortName and objectKey(arg) in self.objects:
+                    found.append(arg)
+        return found
+
+    def candidatePoint(self, obj, conclusions):
+        n = self.samples
+        key = objectKey(obj.z3Expr)
+        ## the lines, circles and segments the point lies on
+        loci = []
+        for conclusion in conclusions:
+            if not is_app(conclusion) or conclusion.num_args() == 0:
+                continue
+            args = conclusion.children()
+            name = conclusion.decl().name()
+            radius = self.radius(conclusion, key)
+            if radius is not None:
+                loci.append(("circle",) + radius)
+            elif name == "On" and objectKey(args[0]) == key and objectKey(args[1]) in self.objects:
+                loci.append(("line",) + self.objects[objectKey(args[1])])
+            elif name == "Onc" and objectKey(args[0]) == key and objectKey(args[1]) in self.objects:
+                loci.append(("circle",) + self.objects[objectKey(args[1])])
+            elif name == "Between" and objectKey(args[1]) == key and \
+                    objectKey(args[0]) in self.objects and objectKey(args[2]) in self.objects:
+                loci.append(("segment", self.objects[objectKey(args[0])][0], self.objects[objectKey(args[2])][0]))
+        if len(loci) >= 2:
+            return self.intersection(self.asCurve(loci[0]), self.asCurve(loci[1]))
+        if len(loci) == 1:
+            locus = loci[0]
+            if locus[0] == "line":
+                return locus[1] + self.random.normal(0.0, 2.0, (n, 1)) * locus[2]
+            if locus[0] == "circle":
+                return locus[1] + locus[2][:, None] * self.direction()
+            return locus[1] + self.random.uniform(0.0, 1.0, (n, 1)) * (locus[2] - locus[1])
+        inside = [conclusion.arg(1) for conclusion in conclusions if is_app(conclusion) and \
+                  conclusion.decl().name() == "Inside" and objectKey(conclusion.arg(1)) in self.objects]
+        if inside:
+            center, radius = self.objects[objectKey(inside[0])]
+            return center + (radius * numpy.sqrt(self.random.uniform(0.0, 1.0, n)))[:, None] * self.direction()
+        return self.random.uniform(-3.0, 3.0, (n, 2))
+
+    def radius(self, conclusion, key):
+        '''
+        Returns the center and radius of the circle the point of key lies
+        on by conclusion, if it is Segment(c, x) = Segment(a, b) for x
+        that point and c, a, b placed points, or None.
+        '''
+        if not is_eq(conclusion):
+            return None
+        for segment, other in [conclusion.children(), reversed(conclusion.children())]:
+            if not (is_app(segment) and segment.decl().name() == "Segment" and
+                    is_app(other) and other.decl().name() == "Segment"):
+                continue
+            ends = [objectKey(arg) for arg in segment.children()]
+            if ends.count(key) != 1 or not all(objectKey(arg) in self.objects for arg in other.children()):
+                continue
+            center = ends[1] if ends[0] == key else ends[0]
+            if center not in self.objects:
+                continue
+            first, second = [self.objects[objectKey(arg)][0] for arg in other.children()]
+            return (self.objects[center][0], self.norm(second - first))
+        return None
+
+    def candidateLine(self, conclusions):
+        n = self.samples
+        points = [self.objects[objectKey(point)][0] for point in self.mentioned(conclusions, "On", 0, "Point")]
+        if len(points) >= 2:
+            return (points[0], self.unit(points[1] - points[0]))
+        base = points[0] if points else self.random.uniform(-3.0, 3.0, (n, 2))
+        return (base, self.direction())
+
+    def candidateCircle(self, conclusions):
+        n = self.samples
+        centers = [self.objects[objectKey(point)][0] for point in self.mentioned(conclusions, "Center", 0, "Point")]
+        through = [self.objects[objectKey(point)][0] for point in self.mentioned(conclusions, "Onc", 0, "Point")]
+        center = centers[0] if centers else self.random.uniform(-3.0, 3.0, (n, 2))
+        if through:
+            radius = self.norm(through[0] - center)
+        else:
+            radius = self.random.uniform(0.5, 3.0, n)
+        return (center, radius)
+
+    def direction(self):
+        angle = self.random.uniform(0.0, 2 * math.pi, self.samples)
+        return numpy.stack([numpy.cos(angle), numpy.sin(angle)], axis=1)
+
+    def asCurve(self, locus):
+        '''
+        Returns a locus as ("line", base, direction) or ("circle", center, radius).
+        '''
+        if locus[0] == "segment":
+            return ("line", locus[1], self.unit(locus[2] - locus[1]))
+        return locus
+
+    def intersection(self, first, second):
+        '''
+        Returns one of the common points of two curves in each
+        configuration, chosen at random, or nan where they have none.
+        '''
+        if first[0] == "circle" and second[0] == "line":
+            first, second = second, first
+        side = numpy.where(self.random.uniform(size=self.samples) < 0.5, -1.0, 1.0)[:, None]
+        if first[0] == "line" and second[0] == "line":
+            base, direction = first[1], first[2]
+            with numpy.errstate(divide="ignore", invalid="ignore"):
+                t = self.cross(second[2], second[1] - base) / self.cross(second[2], direction)
+            return base + t[:, None] * direction
+        if first[0] == "line":
+            base, direction = first[1], first[2]
+            center, radius = second[1], second[2]
+            along = self.dot(center - base, direction)
+            foot = base + along[:, None] * direction
+            with numpy.errstate(invalid="ignore"):
+                half = numpy.sqrt(radius ** 2 - self.norm(center - foot) ** 2)
+            return foot + side * half[:, None] * direction
+        (center1, radius1), (center2, radius2) = first[1:], second[1:]
+        between = center2 - center1
+        distance = self.norm(between)
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            along = (distance ** 2 + radius1 ** 2 - radius2 ** 2) / (2 * distance)
+            half = numpy.sqrt(radius1 ** 2 - along ** 2)
+            axis = between / distance[:, None]
+        normal = numpy.stack([-axis[:, 1], axis[:, 0]], axis=1)
+        return center1 + along[:, None] * axis + side * half[:, None] * normal
+
+    ## facts
+
+    def add(self, fact):
+        '''
+        Records a fact of the proof. Configurations where it does not
+        hold are no longer used.
+        '''
+        self.pending.append(fact)
+
+    def update(self):
+        '''
+        Evaluates the pending facts whose objects are realized. Returns
+        False if some fact still mentions an unrealized object, in which
+        case no configuration is known to be a model of the facts.
+        '''
+        waiting = []
+        for fact in self.pending:
+            if all(objectKey(const) in self.objects for const in constants(fact)):
+                self.valid &= self.holds([fact])
+            else:
+                waiting.append(fact)
+        self.pending = waiting
+        return len(waiting) == 0
+
+    def witnesses(self, expr):
+        '''
+        Returns True if expr holds in some configuration where every
+        fact holds.
+        '''
+        if not self.update() or not self.valid.any():
+            return False
+        if not all(objectKey(const) in self.objects for const in constants(expr)):
+            return False
+        return bool((self.holds([expr]) & self.valid).any())
+
+    def holds(self, exprs):
+        '''
+        Returns where every one of exprs surely holds.
+        '''
+        met = numpy.ones(self.samples, dtype=bool)
+        memo = dict()
+        for expr in exprs:
+            met &= self.truth(expr, memo)[0]
+        return met
+
+    ## evaluation
+
+    def truth(self, expr, memo):
+        '''
+        Returns two arrays, where expr surely holds and where it surely
+        does not. Both are False where it is undecided.
+        '''
+        if expr.get_id() in memo:
+            return memo[expr.get_id()]
+        result = self.evaluateBool(expr, memo)
+        memo[expr.get_id()] = result
+        return result
+
+    def undecided(self):
+        return (numpy.zeros(self.samples, dtype=bool), numpy.zeros(self.samples, dtype=bool))
+
+    def evaluateBool(self, expr, memo):
+        n = self.samples
+        if is_true(expr):
+            return (numpy.ones(n, dtype=bool), numpy.zeros(n, dtype=bool))
+        if is_false(expr):
+            return (numpy.zeros(n, dtype=bool), numpy.ones(n, dtype=bool))
+        if is_quantifier(expr) or not is_app(expr):
+            return self.undecided()
+        args = expr.children()
+        if is_not(expr):
+            true, false = self.truth(args[0], memo)
+            return (false, true)
+        if is_and(expr) or is_or(expr):
+            parts = [self.truth(arg, memo) for arg in args]
+            trues = numpy.array([part[0] for part in parts])
+            falses = numpy.array([part[1] for part in parts])
+            if is_and(expr):
+                return (trues.all(axis=0), falses.any(axis=0))
+            return (trues.any(axis=0), falses.all(axis=0))
+        if is_implies(expr):
+            (true1, false1), (true2, false2) = self.truth(args[0], memo), self.truth(args[1], memo)
+            return (false1 | true2, true1 & false2)
+        if is_eq(expr) and is_bool(args[0]):
+            (true1, false1), (true2, false2) = self.truth(args[0], memo), self.truth(args[1], memo)
+            return ((true1 & true2) | (false1 & false2), (true1 & false2) | (false1 & true2))
+        if is_eq(expr) or is_distinct(expr):
+            if len(args) < 2:
+                return self.evaluateBool(BoolVal(True, expr.ctx), memo)
+            pairs = [self.equal(args[i], args[j], memo) for i in range(len(args)) for j in range(i + 1, len(args))]
+            trues = numpy.array([pair[0] for pair in pairs])
+            falses = numpy.array([pair[1] for pair in pairs])
+            if is_eq(expr):
+                return (trues.all(axis=0), falses.any(axis=0))
+            return (falses.all(axis=0), trues.any(axis=0))
+        if is_lt(expr) or is_le(expr) or is_gt(expr) or is_ge(expr):
+            if is_gt(expr) or is_ge(expr):
+                args = [args[1], args[0]]
+            ## difference below zero for the comparison to hold
+            difference = self.value(args[0], memo) - self.value(args[1], memo)
+            return self.sign(difference, strict=is_lt(expr) or is_gt(expr))
+        if expr.decl().kind() != Z3_OP_UNINTERPRETED:
+            return self.undecided()
+        name = expr.decl().name()
+        if any(is_app(arg) and objectKey(arg) not in self.objects for arg in args):
+            return self.undecided()
+        realized = [self.objects[objectKey(arg)] for arg in args]
+        if name == "On":
+            return self.zero(self.distanceToLine(realized[0][0], realized[1]))
+        if name == "Onc":
+            return self.zero(self.norm(realized[0][0] - realized[1][0]) - realized[1][1])
+        if name == "Center":
+            return self.zero(self.norm(realized[0][0] - realized[1][0]))
+        if name == "Inside":
+            return self.sign(self.norm(realized[0][0] - realized[1][0]) - realized[1][1], strict=True)
+        if name == "Between":
+            return self.between(realized[0][0], realized[1][0], realized[2][0])
+        if name == "SameSide":
+            first = self.distanceToLine(realized[0][0], realized[2])
+            second = self.distanceToLine(realized[1][0], realized[2])
+            delta, epsilon = self.delta, self.epsilon
+            true = ((first >= delta) & (second >= delta)) | ((first <= -delta) & (second <= -delta))
+            false = (numpy.abs(first) <= epsilon) | (numpy.abs(second) <= epsilon) | \
+                ((first >= delta) & (second <= -delta)) | ((first <= -delta) & (second >= delta))
+            return (true, false)
+        if name == "Intersectsll":
+            (base1, direction1), (base2, direction2) = realized
+            angle = numpy.abs(self.cross(direction1, direction2))
+            apart = numpy.abs(self.distanceToLine(base2, realized[0]))
+            ## lines meet unless they are parallel and apart
+            return ((angle >= self.delta) | (apart <= self.epsilon), (angle <= self.epsilon) & (apart >= self.delta))
+        if name == "Intersectslc":
+            (base, direction), (center, radius) = realized
+            return self.sign(numpy.abs(self.distanceToLine(center, realized[0])) - radius, strict=True)
+        if name == "Intersectscc":
+            (center1, radius1), (center2, radius2) = realized
+            distance = self.norm(center1 - center2)
+            near, far = self.sign(numpy.abs(radius1 - radius2) - distance, strict=True), \
+                self.sign(distance - radius1 - radius2, strict=True)
+            return (near[0] & far[0], near[1] | far[1])
+        return self.undecided()
+
+    def value(self, expr, memo):
+        '''
+        Returns the values of a real term, nan where it is undefined.
+        '''
+        n = self.samples
+        if expr.get_id() in memo:
+            return memo[expr.get_id()]
+        result = numpy.full(n, numpy.nan)
+        args = expr.children() if is_app(expr) else []
+        if is_rational_value(expr):
+            result = numpy.full(n, float(expr.numerator_as_long()) / float(expr.denominator_as_long()))
+        elif is_int_value(expr):
+            result = numpy.full(n, float(expr.as_long()))
+        elif is_add(expr):
+            result = sum(self.value(arg, memo) for arg in args)
+        elif is_sub(expr):
+            result = self.value(args[0], memo) - sum(self.value(arg, memo) for arg in args[1:])
+        elif is_div(expr):
+            with numpy.errstate(divide="ignore", invalid="ignore"):
+                result = self.value(args[0], memo) / self.value(args[1], memo)
+            result = numpy.where(numpy.isfinite(result), result, numpy.nan)
+        elif is_mul(expr):
+            result = numpy.ones(n)
+            for arg in args:
+                result = result * self.value(arg, memo)
+        elif is_app_of(expr, Z3_OP_UMINUS):
+            result = -self.value(args[0], memo)
+        elif is_to_real(expr):
+            result = self.value(args[0], memo)
+        elif is_app(expr) and expr.decl().kind() == Z3_OP_UNINTERPRETED:
+            name = expr.decl().name()
+            if name == "RightAngle" and len(args) == 0:
+                result = numpy.full(n, math.pi / 2)
+            elif name in ("Segment", "Angle", "Area") and all(objectKey(arg) in self.objects for arg in args):
+                points = [self.objects[objectKey(arg)][0] for arg in args]
+                if name == "Segment":
+                    result = self.norm(points[0] - points[1])
+                elif name == "Area":
+                    result = numpy.abs(self.cross(points[1] - points[0], points[2] - points[0])) / 2
+                else:
+                    first, second = points[0] - points[1], points[2] - points[1]
+                    result = numpy.arctan2(numpy.abs(self.cross(first, second)), self.dot(first, second))
+                    ## the angle at a vertex that coincides with an end is not determined
+                    degenerate = (self.norm(first) < self.delta) | (self.norm(second) < self.delta)
+                    result = numpy.where(degenerate, numpy.nan, result)
+        memo[expr.get_id()] = result
+        return result
+
+    def equal(self, first, second, memo):
+        '''
+        Returns where two terms are surely equal and where surely not.
+        '''
+        sortName = first.sort().name()
+        if sortName not in ("Point", "Line", "Circle"):
+            return self.zero(self.value(first, memo) - self.value(second, memo))
+        if objectKey(first) not in self.objects or objectKey(second) not in self.objects:
+            return self.undecided()
+        one, other = self.objects[objectKey(first)], self.objects[objectKey(second)]
+        if sortName == "Point":
+            return self.zero(self.norm(one[0] - other[0]))
+        if sortName == "Line":
+            angle = numpy.abs(self.cross(one[1], other[1]))
+            apart = numpy.abs(self.distanceToLine(other[0], one))
+            return ((angle <= self.epsilon) & (apart <= self.epsilon), (angle >= self.delta) | (apart >= self.delta))
+        return self.zero(numpy.maximum(self.norm(one[0] - other[0]), numpy.abs(one[1] - other[1])))
+
+    def zero(self, values):
+        '''
+        Returns where values are surely zero and where surely not.
+        '''
+        magnitude = numpy.abs(values)
+        return (magnitude <= self.epsilon, magnitude >= self.delta)
+
+    def sign(self, values, strict):
+        '''
+        Returns where values are surely below zero, or at most zero if
+        not strict, and where surely not.
+        '''
+        if strict:
+            return (values <= -self.delta, values >= -self.epsilon)
+        return (values <= self.epsilon, values >= self.delta)
+
+    def between(self, first, middle, last):
+        length = self.norm(last - first)
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            direction = (last - first) / length[:, None]
+        off = numpy.abs(self.cross(direction, middle - first))
+        along = self.dot(middle - first, direction)
+        rest = length - along
+        delta, epsilon = self.delta, self.epsilon
+        true = (length >= delta) & (off <= epsilon) & (along >= delta) & (rest >= delta)
+        false = (length <= epsilon) | (off >= delta) | (along <= epsilon) | (rest <= epsilon)
+        return (true, false)
+
+    ## vectors
+
+    def distanceToLine(self, point, line):
+        '''
+        Returns the signed distance of point from line.
+        '''
+        base, direction = line
+        return self.cross(direction, point - base)
+
+    def cross(self, first, second):
+        return first[:, 0] * second[:, 1] - first[:, 1] * second[:, 0]
+
+    def dot(self, first, second):
+        return first[:, 0] * second[:, 0] + first[:, 1] * second[:, 1]
+
+    def norm(self, vector):
+        return numpy.hypot(vector[:, 0], vector[:, 1])
+
+    def unit(self, vector):
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            return vector / self.norm(vector)[:, None]
@@ -0,0 +1,410 @@
+'''
+Proof scripts.
+
+A proof script is a text file with one step of a proof per line:
+
+    # comments start with a hash
+    proof entailment
+    let a b be points
+    let L be the line through a b
+    let c be a point, not on L
+    let d be a point between a c
+    hence sameside d c L
+    hence not on d L and seg a d < seg a c
+
+The first line may set the Proof options with "proof" followed by any of
+entailment, ground, closure, relevance, nombqi and sample (which checks
+claims in SAMPLES random configurations first, see Proof).
+
+Objects are introduced with let:
+
+    let a [b ...] be a point | points [[,] CLAUSE ...]
+    let L be a line | the line through a b
+    let alpha be a circle | the circle center a through b
+
+where a point CLAUSE is one of "on L", "on alpha", "between b c",
+"sameside b L", "opposite b L", "inside alpha", "outside alpha",
+"not on L" or "intersection X Y" for lines or circles X and Y.
+
+assume and hence take a formula built from "not", "and", "or" and
+parentheses over the atoms
+
+    on a L, on a alpha, between a b c, sameside a b L, inside a alpha,
+    center a alpha, intersects X Y, x = y, x != y
+
+and comparisons s < t, s <= t, s = t, s != t, s >= t, s > t of sums of
+magnitudes "seg a b", "angle a b c", "area a b c", "right" and numbers.
+
+Scripts are parsed and checked one step at a time, so a proof of any
+length is never held in memory as a whole.
+'''
+from z3 import *
+from EuclidZ3.core import Proof, Point, Line, Circle, getLanguage
+import re
+
+
+TOKEN = re.compile(r"\s*(<=|>=|!=|[()+,=<>]|[A-Za-z_][A-Za-z0-9_']*|\d+(?:\.\d+)?)")
+COMPARISONS = ("<", "<=", "=", "!=", ">=", ">")
+OPTIONS = ("entailment", "ground", "closure", "relevance", "nombqi", "sample")
+## configurations sampled with the sample option
+SAMPLES = 256
+
+
+class ScriptError(Exception):
+    '''
+    A step of a proof script that cannot be parsed.
+    '''
+    def __init__(self, number, message):
+        Exception.__init__(self, "line " + str(number) + ": " + message)
+        self.number = number
+
+
+def tokenize(text, number):
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = TOKEN.match(text, position)
+        if match is None:
+            raise ScriptError(number, "unexpected " + repr(text[position:]))
+        tokens.append(match.group(1))
+        position = match.end()
+    return tokens
+
+
+class Step(object):
+    '''
+    One step of a proof script: a construction, an assumption or a hence.
+    '''
+
+    def __init__(self, kind, value, number, text):
+        self.kind = kind
+        self.value = value
+        self.number = number
+        self.text = text
+
+    def apply(self, proof):
+        '''
+        Carries out this step in proof. Returns True if it checked.
+        '''
+        if self.kind == "construct":
+            return proof.construct(self.value)
+        if self.kind == "assume":
+            proof.assume(self.value)
+            return True
+        return proof.hence(self.value)
+
+    def __str__(self):
+        return str(self.number) + ": " + self.text
+
+
+class ScriptParser(object):
+    '''
+    Turns the lines of a proof script into Steps, one line at a time.
+    Keeps the points, lines and circles introduced so far by name.
+    '''
+
+    def __init__(self):
+        self.language = getLanguage()
+        self.objects = dict()
+        self.options = None
+
+    def steps(self, lines):
+        '''
+        Yields the steps of the script lines, an iterable of strings
+        such as an open file, parsing each line only when it is reached.
+        '''
+        for number, line in enumerate(lines, 1):
+            line = line.split("#")[0].strip()
+            if line == "":
+                continue
+            self.tokens = tokenize(line, number)
+            self.position = 0
+            self.number = number
+            keyword = self.next()
+            if keyword == "proof":
+                if self.options is not None:
+                    raise ScriptError(number, "proof options must come first")
+                self.options = self.parseOptions()
+                continue
+            if self.options is None:
+                self.options = dict()
+            if keyword == "let":
+                for obj in self.parseLet():
+                    yield Step("construct", obj, number, line)
+            elif keyword in ("assume", "hence"):
+                expr = self.parseFormula()
+                self.expectEnd()
+                yield Step(keyword, expr, number, line)
+            else:
+                raise ScriptError(number, "unknown step " + repr(keyword))
+
+    ## token stream
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None
+
+    def next(self):
+        token = self.peek()
+        if token is None:
+            raise ScriptError(self.number, "unexpected end of line")
+        self.position += 1
+        return token
+
+    def expect(self, *words):
+        for word in words:
+            token = self.next()
+            if token != word:
+                raise ScriptError(self.number, "expected " + repr(word) + " but found " + repr(token))
+
+    def accept(self, word):
+        if self.peek() == word:
+            self.position += 1
+            return True
+        return False
+
+    def expectEnd(self):
+        if self.peek() is not None:
+            raise ScriptError(self.number, "unexpected " + repr(self.peek()))
+
+    def object(self, *classes):
+        name = self.next()
+        obj = self.objects.get(name)
+        if obj is None:
+            raise ScriptError(self.number, "unknown object " + repr(name))
+        if classes and not isinstance(obj, classes):
+            raise ScriptError(self.number, repr(name) + " is not a " +
+                " or ".join(cls.__name__.lower() for cls in classes))
+        return obj
+
+    ## steps
+
+    def parseOptions(self):
+        options = dict()
+        while self.peek() is not None:
+            option = self.next()
+            if option not in OPTIONS:
+                raise ScriptError(self.number, "unknown proof option " + repr(option))
+            if option == "nombqi":
+                options["mbqi"] = False
+            elif option == "sample":
+                options["samples"] = SAMPLES
+            else:
+                options[option] = True
+        return options
+
+    def parseLet(self):
+        '''
+        Parses the rest of a let step, returns the objects it introduces.
+        '''
+        names = []
+        while self.peek() not in ("be", None):
+            names.append(self.next())
+        self.expect("be")
+        if len(names) == 0:
+            raise ScriptError(self.number, "let without a name")
+        for name in names:
+            if name in self.objects:
+                raise ScriptError(self.number, repr(name) + " is already defined")
+        article = None if self.peek() == "points" else self.next()
+        kind = self.next()
+        if kind in ("point", "points"):
+            objs = [Point(name) for name in names]
+            while self.peek() is not None:
+                self.accept(",")
+                self.parseClause(objs)
+        elif len(names) > 1:
+            raise ScriptError(self.number, "only points can be introduced together")
+        elif kind == "line":
+            objs = [Line(names[0])]
+            if article == "the":
+                self.expect("through")
+                objs[0].through(self.object(Point), self.object(Point))
+        elif kind == "circle":
+            objs = [Circle(names[0])]
+            if article == "the":
+                self.expect("center")
+                center = self.object(Point)
+                self.expect("through")
+                objs[0].centerThrough(center, self.object(Point))
+        else:
+            raise ScriptError(self.number, "expected a point, line or circle")
+        self.expectEnd()
+        for obj in objs:
+            self.objects[obj.label] = obj
+        return objs
+
+    def parseClause(self, points):
+        '''
+        Parses a construction clause and applies it to points.
+        '''
+        word = self.next()
+        if word == "on":
+            target = self.object(Line, Circle)
+            for point in points:
+                if isinstance(target, Line):
+                    point.onLine(target)
+                else:
+                    point.onCircle(target)
+        elif word == "not":
+            self.expect("on")
+            line = self.object(Line)
+            for point in points:
+                point.conclusions.append(Not(self.language.OnLine(point.z3Expr, line.z3Expr)))
+        elif word == "between":
+            first, second = self.object(Point), self.object(Point)
+            for point in points:
+                point.between(first, second)
+        elif word in ("sameside", "opposite"):
+            other, line = self.object(Point), self.object(Line)
+            for point in points:
+                if word == "sameside":
+                    point.sameside(other, line)
+                else:
+                    point.opposite(other, line)
+        elif word in ("inside", "outside"):
+            circle = self.object(Circle)
+            for point in points:
+                if word == "inside":
+                    point.inside(circle)
+                else:
+                    point.outside(circle)
+        elif word == "intersection":
+            first, second = self.object(Line, Circle), self.object(Line, Circle)
+            for point in points:
+                if isinstance(first, Line) and isinstance(second, Line):
+                    point.intersectsLines(first, second)
+                elif isinstance(first, Circle) and isinstance(second, Circle):
+                    point.intersectsCircleCircle(first, second)
+                elif isinstance(first, Circle):
+                    point.intersectsCircleLine(first, second)
+                else:
+                    point.intersectsCircleLine(second, first)
+        else:
+            raise ScriptError(self.number, "unknown construction " + repr(word))
+
+    ## formulas
+
+    def parseFormula(self):
+        parts = [self.parseConjunction()]
+        while self.accept("or"):
+            parts.append(self.parseConjunction())
+        return parts[0] if len(parts) == 1 else Or(*parts)
+
+    def parseConjunction(self):
+        parts = [self.parseUnary()]
+        while self.accept("and"):
+            parts.append(self.parseUnary())
+        return parts[0] if len(parts) == 1 else And(*parts)
+
+    def parseUnary(self):
+        if self.accept("not"):
+            return Not(self.parseUnary())
+        if self.accept("("):
+            formula = self.parseFormula()
+            self.expect(")")
+            return formula
+        return self.parseAtom()
+
+    def parseAtom(self):
+        language = self.language
+        word = self.peek()
+        if word == "on":
+            self.next()
+            point, target = self.object(Point), self.object(Line, Circle)
+            if isinstance(target, Line):
+                return language.OnLine(point.z3Expr, target.z3Expr)
+            return language.OnCircle(point.z3Expr, target.z3Expr)
+        if word == "between":
+            self.next()
+            return language.Between(*[self.object(Point).z3Expr for _ in range(3)])
+        if word == "sameside":
+            self.next()
+            return language.SameSide(self.object(Point).z3Expr, self.object(Point).z3Expr, self.object(Line).z3Expr)
+        if word in ("inside", "center"):
+            self.next()
+            relation = language.Inside if word == "inside" else language.Center
+            return relation(self.object(Point).z3Expr, self.object(Circle).z3Expr)
+        if word == "intersects":
+            self.next()
+            first, second = self.object(Line, Circle), self.object(Line, Circle)
+            if isinstance(first, Line) and isinstance(second, Line):
+                return language.Intersectsll(first.z3Expr, second.z3Expr)
+            if isinstance(first, Circle) and isinstance(second, Circle):
+                return language.Intersectscc(first.z3Expr, second.z3Expr)
+            if isinstance(first, Circle):
+                first, second = second, first
+            return language.Intersectslc(first.z3Expr, second.z3Expr)
+
+        left = self.parseTerm()
+        op = self.next()
+        if op not in COMPARISONS:
+            raise ScriptError(self.number, "expected a comparison but found " + repr(op))
+        right = self.parseTerm()
+        if op == "<":
+            return left < right
+        if op == "<=":
+            return left <= right
+        if op == "=":
+            return left == right
+        if op == "!=":
+            return Not(left == right)
+        if op == ">=":
+            return left >= right
+        return left > right
+
+    def parseTerm(self):
+        parts = [self.parseMagnitude()]
+        while self.accept("+"):
+            parts.append(self.parseMagnitude())
+        return parts[0] if len(parts) == 1 else Sum(*parts)
+
+    def parseMagnitude(self):
+        language = self.language
+        word = self.next()
+        if word == "seg":
+            return language.Segment(self.object(Point).z3Expr, self.object(Point).z3Expr)
+        if word in ("angle", "area"):
+            function = language.Angle if word == "angle" else language.Area
+            return function(*[self.object(Point).z3Expr for _ in range(3)])
+        if word == "right":
+            return language.RightAngle
+        if re.match(r"\d", word):
+            return RealVal(word)
+        self.position -= 1
+        return self.object().z3Expr
+
+
+def run(lines, proof=None, previous=None):
+    '''
+    Checks the proof script given as an iterable of lines, step by step.
+    Returns the Proof, whose failures list the steps that did not check.
+    The proof is created from the options of the script unless given.
+    previous is the Proof of an earlier version of the script, whose
+    results are reused for the steps the edit did not affect.
+    '''
+    parser = ScriptParser()
+    created = proof is None
+    try:
+        for step in parser.steps(lines):
+            if proof is None:
+                proof = Proof(previous=previous, **parser.options)
+            step.apply(proof)
+    except BaseException:
+        ## a script that stops early must not keep a pooled solver
+        if created and proof is not None:
+            proof.close()
+        raise
+    if proof is None:
+        proof = Proof(previous=previous, **(parser.options or dict()))
+    return proof
+
+
+def load(path, previous=None):
+    '''
+    Checks the proof script in the file at path. Returns its Proof.
+    '''
+    with open(path) as script:
+        return run(script, previous=previous)
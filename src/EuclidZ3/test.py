@@ -1,5 +1,5 @@
 from z3 import *
-from core import *
+from EuclidZ3.core import *
  
 
  
@@ -113,5 +113,733 @@ def test1():
     solver.pop()
     print("=== Finished Core ===")
 
+def expect(description, got, expected):
+    '''
+    Prints a check and its answer. Raises AssertionError if the answer
+    is not the expected one.
+    '''
+    print(">> " + description)
+    print("      << " + str(got))
+    if got != expected:
+        raise AssertionError(description + " : got " + str(got) + ", expected " + str(expected))
+
+def testLanguage():
+    import os, subprocess, sys, tempfile
+    print("=== Starting language tests ===")
+
+    ## importing the core must not build the axioms
+    source = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    built = subprocess.check_output([sys.executable, "-c",
+        "import EuclidZ3.core as core; print(core._language is not None)"], cwd=source).decode().split()
+    expect("Import EuclidZ3.core, language built", built[-1], "False")
+
+    directory = tempfile.mkdtemp()
+    first = LanguageE(cacheDir=directory)
+    expect("Build LanguageE, axiom files cached", 
+        [name.startswith("axioms-") and name.endswith(".smt2") for name in os.listdir(directory)], [True])
+    second = LanguageE(cacheDir=directory)
+    expect("Load LanguageE from the cache, same axioms", 
+        [axiom.sexpr() for axiom in second.axioms] == [axiom.sexpr() for axiom in first.axioms], True)
+
+    print("=== Finished language tests ===")
+
+def diagram(pc):
+    '''
+    Constructs a point a on a line L, a point c off L and a point b
+    between a and c in pc. Returns a, b, c and L.
+    '''
+    language = getLanguage()
+    L = Line("L")
+    pc.construct(L)
+    a, c = Point("a"), Point("c")
+    a.onLine(L)
+    pc.construct(a)
+    c.conclusions.append(Not(language.OnLine(c.z3Expr, L.z3Expr)))
+    pc.construct(c)
+    b = Point("b")
+    b.between(a, c)
+    pc.construct(b)
+    return a, b, c, L
+
+def testContexts():
+    print("=== Starting context tests ===")
+
+    language = getLanguage()
+    first, second = Proof(), Proof()
+    expect("Two proofs share a context", first.context == second.context, False)
+    a, b, c, L = diagram(first)
+    expect("Hence b and c are on opposite sides of L", 
+        first.hence(Not(language.SameSide(b.z3Expr, c.z3Expr, L.z3Expr))), False)
+    ## the diagram of the first proof is not a fact of the second
+    expect("Hence b and c are on opposite sides of L, in the other proof", 
+        second.hence(Not(language.SameSide(b.z3Expr, c.z3Expr, L.z3Expr))), True)
+    first.close()
+    second.close()
+
+    print("=== Finished context tests ===")
+
+def testHenceMany():
+    print("=== Starting batch tests ===")
+
+    language = getLanguage()
+    pc = Proof()
+    a, b, c, L = diagram(pc)
+    expect("Hence sameside b c L, and not sameside b c L", pc.hence_many([
+        language.SameSide(b.z3Expr, c.z3Expr, L.z3Expr), 
+        Not(language.SameSide(b.z3Expr, c.z3Expr, L.z3Expr))]), [True, False])
+    x = Point("x")
+    pc.construct(x)
+    ## each is consistent on its own, but not with the other
+    expect("Hence on x L, and not on x L", pc.hence_many([
+        language.OnLine(x.z3Expr, L.z3Expr), Not(language.OnLine(x.z3Expr, L.z3Expr))]), [False, False])
+    pc.close()
+
+    print("=== Finished batch tests ===")
+
+def checkDiagram(description, **options):
+    '''
+    Checks the diagram in a proof in entailment mode with options, 
+    which must accept what it entails and nothing else. Returns the proof.
+    '''
+    language = getLanguage()
+    pc = Proof(entailment=True, **options)
+    a, b, c, L = diagram(pc)
+    expect(description + ": hence sameside b c L", 
+        pc.hence(language.SameSide(b.z3Expr, c.z3Expr, L.z3Expr)), True)
+    x = Point("x")
+    pc.construct(x)
+    ## consistent with the facts, but not entailed by them
+    expect(description + ": hence on x L", pc.hence(language.OnLine(x.z3Expr, L.z3Expr)), False)
+    return pc
+
+def testEntailment():
+    print("=== Starting entailment tests ===")
+
+    language = getLanguage()
+    pc = checkDiagram("entailment")
+    a, x, L = Point("a"), Point("x"), Line("L")
+    expect("Core of not on x L", pc.entails(Not(language.OnLine(x.z3Expr, L.z3Expr))), None)
+    core = pc.entails(Not(language.OnLine(Point("b").z3Expr, L.z3Expr)))
+    expect("Core of not on b L names on a L", 
+        any(fact.eq(language.OnLine(a.z3Expr, L.z3Expr)) for fact in core or []), True)
+    pc.close()
+
+    print("=== Finished entailment tests ===")
+
+def testGround():
+    print("=== Starting ground tests ===")
+    checkDiagram("ground", ground=True).close()
+    print("=== Finished ground tests ===")
+
+def testPatterns():
+    print("=== Starting pattern tests ===")
+
+    language = getLanguage()
+    unpatterned = [axiom for axiom in language.axioms if is_quantifier(axiom) and axiom.num_patterns() == 0]
+    expect("Quantified axioms without patterns", len(unpatterned), 0)
+    checkDiagram("no mbqi", mbqi=False).close()
+
+    print("=== Finished pattern tests ===")
+
+def testRelevance():
+    print("=== Starting relevance tests ===")
+
+    pc = checkDiagram("relevance", relevance=True)
+    expect("Families used", sorted(pc.families), ["diagrammatic"])
+    ## the diagram mentions no circles, so their axioms are never loaded
+    expect("Circle axioms left unloaded", 
+        any("circle" in families for _, families, _ in pc.unloaded), True)
+    pc.close()
+
+    print("=== Finished relevance tests ===")
+
+def testClosure():
+    print("=== Starting closure tests ===")
+
+    language = getLanguage()
+    pc = checkDiagram("closure", closure=True)
+    a, b = Point("a"), Point("b")
+    hits = pc.closure.hits
+    expect("Hence a != b", pc.hence(Not(a.z3Expr == b.z3Expr)), True)
+    expect("Answered by the closure", pc.closure.hits, hits + 1)
+    pc.close()
+
+    ## outside entailment mode, claims the closure refutes are rejected
+    pc = Proof(closure=True)
+    a, b, c, L = diagram(pc)
+    hits = pc.closure.hits
+    expect("Hence not between c b a", pc.hence(Not(language.Between(c.z3Expr, b.z3Expr, a.z3Expr))), False)
+    expect("Answered by the closure", pc.closure.hits, hits + 1)
+    pc.close()
+
+    print("=== Finished closure tests ===")
+
+def testCheck():
+    import os, tempfile
+    from EuclidZ3 import check
+    print("=== Starting batch checker tests ===")
+
+    proofs = os.path.join(os.path.dirname(os.path.abspath(__file__)), "proofs")
+    result = check.checkFile((os.path.join(proofs, "lines.py"), None))
+    expect("Check proofs/lines.py", (result["status"], result["failures"]), ("ok", []))
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "wrong.py")
+    with open(path, "w") as proofFile:
+        proofFile.write("from EuclidZ3.core import *\n"
+                        "def proof():\n"
+                        "    pc = Proof()\n"
+                        "    a, b = Point('a'), Point('b')\n"
+                        "    pc.construct(a)\n"
+                        "    pc.construct(b)\n"
+                        "    pc.hence(Not(a.z3Expr == a.z3Expr))\n"
+                        "    return pc\n")
+    result = check.checkFile((path, None))
+    expect("Check a proof of a != a", (result["status"], len(result["failures"])), ("failed", 1))
+    expect("Exit status for a directory with a failing proof", check.main([directory, "--jobs", "1"]), 1)
+
+    print("=== Finished batch checker tests ===")
+
+def testScript():
+    from EuclidZ3 import script
+    from EuclidZ3.script import ScriptParser, ScriptError
+    print("=== Starting script tests ===")
+
+    lines = ["# a comment", "proof entailment", "let a c be points", "let L be a line",
+             "", "assume on a L and not on c L", "let b be a point, between a c",
+             "hence sameside b c L"]
+    parser = ScriptParser()
+    steps = [(step.kind, step.number) for step in parser.steps(lines)]
+    expect("Parse " + str(lines), steps, [("construct", 3), ("construct", 3), ("construct", 4), 
+        ("assume", 6), ("construct", 7), ("hence", 8)])
+    expect("Options", parser.options, {"entailment": True})
+
+    ## errors report the line they are on, blank lines and comments included
+    for lines, number in [(["let a be a point", "", "hence on a"], 3),
+                          (["let a be a point", "proof ground"], 2),
+                          (["# comment", "prove a"], 2),
+                          (["let L be a line", "hence on q L"], 2)]:
+        try:
+            list(ScriptParser().steps(lines))
+            error = None
+        except ScriptError as raised:
+            error = raised.number
+        expect("Line of the error in " + str(lines), error, number)
+
+    lines = ["proof entailment", "let a c be points", "let L be a line", "assume on a L and not on c L", 
+             "let b be a point, between a c", "hence sameside b c L"]
+    pc = script.run(lines)
+    expect("Run " + str(lines), pc.failures, [])
+    pc.close()
+    pc = script.run(lines + ["hence on b L"])
+    expect("Run it with hence on b L", [step for step, _ in pc.failures], ["hence"])
+    pc.close()
+
+    print("=== Finished script tests ===")
+
+def testQueryCache():
+    import tempfile, time
+    from EuclidZ3.querycache import QueryCache
+    print("=== Starting query cache tests ===")
+
+    language = getLanguage()
+    cache = QueryCache(tempfile.mkdtemp())
+    for run in range(2):
+        pc = Proof(entailment=True, queryCache=cache)
+        a, b, c, L = diagram(pc)
+        expect("Run " + str(run) + ": hence sameside b c L", 
+            pc.hence(language.SameSide(b.z3Expr, c.z3Expr, L.z3Expr)), True)
+        x = Point("x")
+        pc.construct(x)
+        expect("Run " + str(run) + ": hence on x L", pc.hence(language.OnLine(x.z3Expr, L.z3Expr)), False)
+        pc.close()
+    ## the second run is answered from the cache
+    stats = cache.stats()
+    expect("Hits equal misses", stats["hits"] > 0 and stats["hits"] == stats["misses"], True)
+
+    ## an entry is about 17 bytes, so the third one evicts the least
+    ## recently used of the first two
+    cache = QueryCache(tempfile.mkdtemp(), maxBytes=50)
+    for key in ["k1", "k2"]:
+        cache.put(key, "sat")
+        time.sleep(0.05)
+    cache.get("k1")
+    time.sleep(0.05)
+    cache.put("k3", "unsat")
+    expect("Put k1 k2, get k1, put k3 with maxBytes 50", 
+        dict((key, cache.get(key) is not None) for key in ["k1", "k2", "k3"]), 
+        {"k1": True, "k2": False, "k3": True})
+
+    print("=== Finished query cache tests ===")
+
+def testCanonical():
+    from EuclidZ3.canonical import canonicalize
+    print("=== Starting canonicalization tests ===")
+
+    language = getLanguage()
+    a, b, c = Consts('a b c', language.PointSort)
+    L = Const('L', language.LineSort)
+    ## symmetric arguments are sorted, the others are left in place
+    for first, second in [(language.Between(c, b, a), language.Between(a, b, c)),
+                          (language.SameSide(b, a, L), language.SameSide(a, b, L)),
+                          (language.Segment(b, a), language.Segment(a, b)),
+                          (language.Area(c, a, b), language.Area(b, c, a)),
+                          (Not(language.Between(c, a, b)), Not(language.Between(b, a, c)))]:
+        expect("Canonicalize " + str(first) + " and " + str(second), 
+            canonicalize(first).eq(canonicalize(second)), True)
+    expect("Canonicalize Between(a, c, b)", str(canonicalize(language.Between(a, c, b))), "Between(a, c, b)")
+    expect("Canonicalize Between(a, c, b) and Between(a, b, c)", 
+        canonicalize(language.Between(a, c, b)).eq(canonicalize(language.Between(a, b, c))), False)
+
+    print("=== Finished canonicalization tests ===")
+
+def testFactSet():
+    print("=== Starting fact set tests ===")
+
+    language = getLanguage()
+    pc = Proof()
+    a, b, c, L = diagram(pc)
+    pc.assume(language.SameSide(b.z3Expr, c.z3Expr, L.z3Expr))
+    pc.assume(language.SameSide(c.z3Expr, b.z3Expr, L.z3Expr))
+    expect("Assume sameside b c L and sameside c b L, assumptions", len(pc.assumptions), 
+        len([fact for fact in pc.assumptions if not fact.eq(language.SameSide(b.z3Expr, c.z3Expr, L.z3Expr))]) + 1)
+    expect("sameside c b L in assumptions", language.SameSide(c.z3Expr, b.z3Expr, L.z3Expr) in pc.assumptions, True)
+    expect("on a L in conclusions", language.OnLine(a.z3Expr, L.z3Expr) in pc.conclusions, True)
+    expect("on c L in conclusions", language.OnLine(c.z3Expr, L.z3Expr) in pc.conclusions, False)
+    expect("Last conclusion", str(pc.conclusions[-1]), "Between(a, b, c)")
+    pc.close()
+
+    expect("Points with one label in a set", len(set([Point("p"), Point("p"), Point("q")])), 2)
+    try:
+        ConstructableObject("o")
+        made = True
+    except TypeError:
+        made = False
+    expect("Make a ConstructableObject", made, False)
+
+    print("=== Finished fact set tests ===")
+
+def testPrereqs():
+    print("=== Starting prerequisite tests ===")
+
+    a, b = Point("a"), Point("b")
+    pc = Proof()
+    pc.construct(a)
+    pc.construct(b)
+    pc.assume(a.z3Expr == b.z3Expr)
+    L = Line("L")
+    L.through(a, b)
+    expect("Construct the line through a b, with a = b", pc.construct(L), False)
+    expect("Prerequisites not met", [str(prereq) for prereq in pc.lastFailure], ["Not(a == b)"])
+    pc.close()
+
+    print("=== Finished prerequisite tests ===")
+
+def testLimits():
+    import tempfile
+    from EuclidZ3.portfolio import Portfolio
+    from EuclidZ3.querycache import QueryCache
+    print("=== Starting limit tests ===")
+
+    language = getLanguage()
+    a, b, c, L = Point("a"), Point("b"), Point("c"), Line("L")
+    facts = [language.OnLine(a.z3Expr, L.z3Expr), Not(language.OnLine(c.z3Expr, L.z3Expr)), 
+             language.Between(a.z3Expr, b.z3Expr, c.z3Expr)]
+    claim = language.SameSide(b.z3Expr, c.z3Expr, L.z3Expr)
+    cache = QueryCache(tempfile.mkdtemp())
+    for rlimit, answer, undecided in [(1, False, 1), (None, True, 0)]:
+        pc = Proof(entailment=True, rlimit=rlimit, queryCache=cache)
+        for obj in (a, b, c, L):
+            pc.construct(obj)
+        for fact in facts:
+            pc.assume(fact)
+        ## an answer cut short by the limit is not cached for the next run
+        expect("Hence sameside b c L with rlimit " + str(rlimit), (pc.hence(claim), len(pc.undecided)), 
+            (answer, undecided))
+        pc.close()
+
+    with Portfolio() as portfolio:
+        checkDiagram("portfolio", portfolio=portfolio).close()
+        expect("Queries won", sum(portfolio.wins.values()) > 0, True)
+
+    print("=== Finished limit tests ===")
+
+def testBook1():
+    from EuclidZ3 import benchmark
+    print("=== Starting Book I tests ===")
+
+    results = benchmark.runBook1(dict(), None)
+    expect("Steps of the Book I scripts not ok", 
+        [result["query"] for result in results if result["result"] != "ok"], [])
+
+    result = {"suite": "book1", "configuration": "patterns, mbqi", "query": "prop01.euclid:3 let a", 
+              "result": "ok", "wall": 1.0, "instantiations": 0}
+    expect("Compare a result to itself", benchmark.compare([result], [result], 0.25, 0.25), [])
+    baseline = dict(result, result="failed", wall=0.5)
+    expect("Regressions against a faster baseline with another answer", 
+        len(benchmark.compare([result], [baseline], 0.25, 0.25)), 2)
+
+    print("=== Finished Book I tests ===")
+
+def testProfile():
+    import json, os, tempfile
+    print("=== Starting profile tests ===")
+
+    language = getLanguage()
+    pc = Proof(entailment=True)
+    a, b, c, L = diagram(pc)
+    claim = language.SameSide(b.z3Expr, c.z3Expr, L.z3Expr)
+    pc.hence(claim)
+    stats = pc.stats()
+    expect("Checks counted", stats["totals"]["checks"], len(pc.profile))
+    expect("Steps profiled", "hence " + str(claim) in [step["label"] for step in stats["steps"]], True)
+    ## time is z3's time for one check, not a count to take differences of
+    expect("Checks with a negative time", 
+        [record["label"] for record in pc.profile if record["statistics"].get("time", 0) < 0], [])
+    path = os.path.join(tempfile.mkdtemp(), "trace.json")
+    pc.exportStats(path, format="chrome")
+    with open(path) as trace:
+        events = json.load(trace)["traceEvents"]
+    expect("Trace events", len(events), len(pc.profile))
+    pc.close()
+
+    print("=== Finished profile tests ===")
+
+def testTheorems():
+    from EuclidZ3.proofs import rhombus
+    print("=== Starting theorem tests ===")
+
+    ## I.1: for distinct a and b there is c with ab = ac = bc
+    I1 = rhombus.I1
+    pc = Proof(entailment=True)
+    p, q, x = Point("p"), Point("q"), Point("x")
+    for obj in (p, q, x):
+        pc.construct(obj)
+    pc.assume(Not(p.z3Expr == q.z3Expr))
+    ## the desired object must be new, not one the proof already has
+    expect("Apply I.1 to p q x, with x already constructed", pc.apply(I1, [p, q, x]), False)
+    expect("Apply I.1 to p q q", pc.apply(I1, [p, q, q]), False)
+    y = Point("y")
+    y.between(p, q)
+    expect("Apply I.1 to p q y, with y between p q", pc.apply(I1, [p, q, y]), False)
+    expect("Apply I.1 to q q z", pc.apply(I1, [q, q, Point("z")]), False)
+    z = Point("z")
+    expect("Apply I.1 to p q z", pc.apply(I1, [p, q, z]), True)
+    expect("Hence seg p z = seg q z", pc.hence(getLanguage().Segment(p.z3Expr, z.z3Expr) ==
+        getLanguage().Segment(q.z3Expr, z.z3Expr)), True)
+    pc.close()
+
+    ## a proof whose constructions rely on unentailed prerequisites
+    ## does not prove a != b
+    a, b = Point("a"), Point("b")
+    def lineProof(pc):
+        L = Line("L")
+        L.through(a, b)
+        pc.construct(L)
+    T = Theorem("T", [a, b], [], [], [Not(a.z3Expr == b.z3Expr)], proof=lineProof)
+    expect("Prove a != b by drawing the line through a b", T.prove(), False)
+
+    print("=== Finished theorem tests ===")
+
+def testReplay():
+    import os
+    from EuclidZ3 import script
+    print("=== Starting replay tests ===")
+
+    lines = ["let a b be points", "let L be a line", "let M be a line",
+             "let z be a point", "let x be a point", "hence on x L"]
+    first = script.run(lines)
+    again = script.run(lines, previous=first)
+    expect("Check the same script again, steps reused", again.reused, len(again.history))
+
+    ## the inserted facts about z contradict each other, so the last
+    ## step is no longer consistent with the facts; it must be checked
+    ## again, not replayed because it does not mention z
+    edited = lines[:5] + ["assume on z M", "assume not on z M"] + lines[5:]
+    again = script.run(edited, previous=first)
+    expect("Insert contradicting facts about z before the last step", 
+        (again.history[-1]["ok"], len(again.failures)), (False, 1))
+    for proof in (first, again):
+        proof.close()
+
+    ## steps left undecided by a limit are checked again, not replayed
+    ## as failures
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "book1", "prop12.euclid")
+    with open(path) as prop12:
+        lines = [line for line in prop12 if not line.startswith("proof")]
+    first = script.run(lines, proof=Proof(entailment=True, rlimit=1))
+    expect("Check prop12 with rlimit 1, undecided", len(first.undecided) > 0, True)
+    again = script.run(lines, proof=Proof(entailment=True, previous=first))
+    expect("Check it again without the limit, failures", (len(again.failures), len(again.undecided)), (0, 0))
+    ## and then every step but the assumption is replayed
+    same = script.run(lines, proof=Proof(entailment=True, previous=again))
+    expect("Check it a third time, reused", (same.reused, len(same.failures)), 
+        (len([entry for entry in same.history if entry["step"] != "assume"]), 0))
+    for proof in (first, again, same):
+        proof.close()
+
+    print("=== Finished replay tests ===")
+
+def pigeons(n):
+    '''
+    Returns the claim that n pigeons fit in n - 1 holes, one to a hole,
+    which takes the solver long to refute for n around 10.
+    '''
+    holes = [[Bool("pigeon%d_%d" % (pigeon, hole)) for hole in range(n - 1)] for pigeon in range(n)]
+    return And([Or(row) for row in holes] + [Not(And(holes[first][hole], holes[second][hole]))
+        for hole in range(n - 1) for first in range(n) for second in range(first + 1, n)])
+
+def testAsync():
+    import asyncio
+    print("=== Starting async tests ===")
+
+    language = getLanguage()
+    pc = Proof(entailment=True)
+    a, b, c, L = diagram(pc)
+    claim = language.SameSide(b.z3Expr, c.z3Expr, L.z3Expr)
+    ## each event loop gets its own locks
+    for run in range(2):
+        expect("Run " + str(run) + ": hence sameside b c L", asyncio.run(pc.hence_async(claim)), True)
+
+    ## a claim that takes long to refute, named to keep the output short
+    hard = Proof()
+    pigeon = Bool("pigeons")
+    hard.assume(pigeon == pigeons(10))
+    async def cancelled():
+        task = asyncio.ensure_future(hard.hence_async(pigeon))
+        await asyncio.sleep(0.5)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            return True
+        return False
+    steps = (len(hard.failures), len(hard.undecided), len(hard.history))
+    expect("Cancel hence pigeons, 10 pigeons in 9 holes", asyncio.run(cancelled()), True)
+    expect("Failures, undecided and steps after the cancel", 
+        (len(hard.failures), len(hard.undecided), len(hard.history)), steps)
+    expect("Hence not pigeons after the cancel", asyncio.run(hard.hence_async(Not(pigeon))), True)
+    hard.close()
+    pc.close()
+
+    print("=== Finished async tests ===")
+
+def testDaemon():
+    import asyncio, json, os, tempfile, threading, time
+    from EuclidZ3 import daemon
+    print("=== Starting daemon tests ===")
+
+    server = daemon.Daemon()
+    def call(method, **params):
+        line = json.dumps({"jsonrpc": "2.0", "id": 1, "method": method, "params": params})
+        response = asyncio.run(server.handle(line))
+        return response.get("result", response.get("error"))
+
+    session = call("open", options={"entailment": True})["session"]
+    for step in ["let a c be points", "let L be a line", "let b be a point, between a c"]:
+        expect("Construct " + step, call("construct", session=session, step=step)["ok"], True)
+    call("assume", session=session, formula="on a L and not on c L")
+    expect("Hence sameside b c L", call("hence", session=session, formula="sameside b c L")["ok"], True)
+    expect("Hence on b L", call("hence", session=session, formula="on b L")["ok"], False)
+    expect("Undo 1", call("undo", session=session, steps=1), {"steps": 5, "reused": 5, "failures": 0})
+    expect("Steps after the undo", len(call("status", session=session)["steps"]), 5)
+    expect("Hence with a number", call("hence", session=session, formula=5)["code"], daemon.INVALID_PARAMS)
+    expect("Undo x steps", call("undo", session=session, steps="x")["code"], daemon.INVALID_PARAMS)
+    expect("Close", call("close", session=session), {"closed": session})
+    expect("Status after the close", call("status", session=session)["code"], daemon.INVALID_PARAMS)
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "notes.txt")
+    with open(path, "w") as notes:
+        notes.write("not a socket\n")
+    try:
+        asyncio.run(daemon.serve(path))
+        refused = False
+    except FileExistsError:
+        refused = True
+    expect("Serve on a file that is not a socket", refused, True)
+
+    ## a session over a socket
+    path = os.path.join(directory, "euclidz3.sock")
+    stop = threading.Event()
+    async def serveUntilStopped():
+        serving = asyncio.ensure_future(daemon.serve(path))
+        while not stop.is_set():
+            await asyncio.sleep(0.05)
+        serving.cancel()
+        try:
+            await serving
+        except asyncio.CancelledError:
+            pass
+    thread = threading.Thread(target=asyncio.run, args=(serveUntilStopped(),))
+    thread.start()
+    while not os.path.exists(path):
+        time.sleep(0.05)
+    client = daemon.Client(path=path)
+    session = client.call("open")["session"]
+    client.call("construct", session=session, step="let a b be points")
+    expect("Hence a = b over the socket", client.call("hence", session=session, formula="a = b")["ok"], True)
+    expect("Undo over the socket", client.call("undo", session=session)["steps"], 1)
+    client.close()
+    stop.set()
+    thread.join()
+
+    print("=== Finished daemon tests ===")
+
+def testPool():
+    import os, tempfile
+    from EuclidZ3.pool import SolverPool
+    from EuclidZ3.check import checkFile
+    print("=== Starting pool tests ===")
+
+    pool = SolverPool(size=1)
+    setDefaultPool(pool)
+    directory = tempfile.mkdtemp()
+    raises = os.path.join(directory, "raises.py")
+    with open(raises, "w") as proofFile:
+        proofFile.write("from EuclidZ3.core import *\n"
+                        "def proof():\n"
+                        "    pc = Proof()\n"
+                        "    raise RuntimeError('abandoned')\n")
+    broken = os.path.join(directory, "broken.euclid")
+    with open(broken, "w") as proofFile:
+        proofFile.write("let a be a point\nhence on a\n")
+    ## a proof that raises never reaches close, its solver is reclaimed
+    for path, status in ((raises, "error"), (broken, "error")):
+        result = checkFile((path, None))
+        expect("Check " + os.path.basename(path) + ", checked out", 
+            (result["status"], pool.metrics()["checkedOut"]), (status, 0))
+
+    ## a proof closed after its solver was reclaimed and checked out
+    ## again does not release the other proof's solver
+    first = Proof()
+    pool.reclaim()
+    second = Proof()
+    expect("Second proof pooled", second.pooled is not None, True)
+    first.close()
+    expect("Close a reclaimed proof while its solver is checked out again, checked out", 
+        pool.metrics()["checkedOut"], 1)
+    second.close()
+    expect("Close the other, checked out", pool.metrics()["checkedOut"], 0)
+    setDefaultPool(None)
+
+    print("=== Finished pool tests ===")
+
+def testModels():
+    from EuclidZ3 import benchmark
+    import os
+    print("=== Starting model tests ===")
+
+    language = getLanguage()
+    pc = Proof(entailment=True)
+    a, b, c, L = diagram(pc)
+    x = Point("x")
+    pc.construct(x)
+    ## the check that on x L does not follow keeps a model of the facts
+    expect("Hence on x L", pc.hence(language.OnLine(x.z3Expr, L.z3Expr)), False)
+    checks = pc.counters["checks"]
+    ## that model puts b and c on the same side of L
+    expect("Hence not sameside b c L", pc.hence(Not(language.SameSide(b.z3Expr, c.z3Expr, L.z3Expr))), False)
+    expect("Solver calls, model hits", (pc.counters["checks"] - checks, pc.counters["modelHits"]), (0, 1))
+    expect("Hence sameside b c L", pc.hence(language.SameSide(b.z3Expr, c.z3Expr, L.z3Expr)), True)
+    pc.close()
+
+    ## models never refute a step that follows
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "book1", "prop01.euclid")
+    expect("Steps of prop01 not ok", 
+        [result["query"] for result in benchmark.runScript(path, dict(), None) if result["result"] != "ok"], [])
+
+    print("=== Finished model tests ===")
+
+def testCoincidences():
+    from EuclidZ3.canonical import Coincidences
+    print("=== Starting coincidence tests ===")
+
+    language = getLanguage()
+    a, b, c, d, e = Consts('a b c d e', language.PointSort)
+    L = Const('L', language.LineSort)
+    coincidences = Coincidences()
+    expect("Merge c b, then d c, then b a", 
+        [coincidences.merge(c, b), coincidences.merge(d, c), coincidences.merge(b, a)], [True, True, True])
+    ## every class is represented by its first member
+    expect("Representatives of a b c d", [str(coincidences.find(point)) for point in (a, b, c, d)], ["a"] * 4)
+    expect("Merge a d again", coincidences.merge(a, d), False)
+    expect("Rewrite Between(d, e, b) and On(c, L)", 
+        str(coincidences.rewrite(And(language.Between(d, e, b), language.OnLine(c, L)))), 
+        "And(Between(a, e, a), On(a, L))")
+
+    pc = Proof(entailment=True)
+    p, q = Point("p"), Point("q")
+    M, N = Line("M"), Line("N")
+    for obj in (p, q, M, N):
+        pc.construct(obj)
+    pc.assume(language.OnLine(p.z3Expr, N.z3Expr))
+    pc.assume(M.z3Expr == N.z3Expr)
+    expect("Assume on p N and M = N, hence on p M", pc.hence(language.OnLine(p.z3Expr, M.z3Expr)), True)
+    expect("Hence on q M", pc.hence(language.OnLine(q.z3Expr, M.z3Expr)), False)
+    pc.close()
+
+    print("=== Finished coincidence tests ===")
+
+def testSampler():
+    from EuclidZ3 import benchmark
+    from EuclidZ3.proofs import rhombus
+    import os
+    print("=== Starting sampler tests ===")
+
+    language = getLanguage()
+    pc = Proof(entailment=True, models=0, samples=64)
+    a, b, c, L = diagram(pc)
+    checks = pc.counters["checks"]
+    expect("Hence not sameside b c L", pc.hence(Not(language.SameSide(b.z3Expr, c.z3Expr, L.z3Expr))), False)
+    expect("Solver calls, sample hits", (pc.counters["checks"] - checks, pc.counters["sampleHits"]), (0, 1))
+    expect("Hence sameside b c L", pc.hence(language.SameSide(b.z3Expr, c.z3Expr, L.z3Expr)), True)
+    pc.close()
+
+    ## the point a lemma gives is placed by the lemma's conclusions, so
+    ## the configurations stay valid and keep refuting false claims
+    pc = Proof(entailment=True, models=0, samples=64)
+    p, q, r = Point("p"), Point("q"), Point("r")
+    pc.construct(p)
+    pc.construct(q)
+    pc.assume(Not(p.z3Expr == q.z3Expr))
+    expect("Apply I.1 to p q r", pc.apply(rhombus.I1, [p, q, r]), True)
+    checks = pc.counters["checks"]
+    expect("Hence seg p r < seg p q", pc.hence(language.Segment(p.z3Expr, r.z3Expr) < 
+        language.Segment(p.z3Expr, q.z3Expr)), False)
+    expect("Solver calls, sample hits", (pc.counters["checks"] - checks, pc.counters["sampleHits"]), (0, 1))
+    pc.close()
+
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "book1", "prop01.euclid")
+    expect("Steps of prop01 not ok, sampled", [result["query"] for result in 
+        benchmark.runScript(path, dict(samples=64), None) if result["result"] != "ok"], [])
+
+    print("=== Finished sampler tests ===")
+
 if __name__ == "__main__":
-    test1()
\ No newline at end of file
+    test1()
+    testLanguage()
+    testContexts()
+    testHenceMany()
+    testEntailment()
+    testGround()
+    testPatterns()
+    testRelevance()
+    testClosure()
+    testCheck()
+    testScript()
+    testQueryCache()
+    testCanonical()
+    testFactSet()
+    testPrereqs()
+    testLimits()
+    testBook1()
+    testProfile()
+    testTheorems()
+    testReplay()
+    testAsync()
+    testDaemon()
+    testPool()
+    testModels()
+    testCoincidences()
+    testSampler()